@@ -733,6 +733,12 @@ def callback(request):
     SPLITTER_CONTRACT_ADDRESS = GRANTS_SPLITTER_MAINNET
 else:
     SPLITTER_CONTRACT_ADDRESS = GRANTS_SPLITTER_ROPSTEN
+# shared volume the CLR workers read memory-mapped round snapshots from
+CLR_SNAPSHOT_DIR = env('CLR_SNAPSHOT_DIR', default='/tmp/clr_snapshots')
+# local cache of the grant logos and avatars drawn on collection thumbnails
+GRANTS_LOGO_CACHE_DIR = env('GRANTS_LOGO_CACHE_DIR', default='/tmp/grant_logos')
+# seconds logged out grants explorer responses are cached for, 0 disables the cache
+GRANTS_LISTING_CACHE_TIMEOUT = env.int('GRANTS_LISTING_CACHE_TIMEOUT', default=60 * 5)
 
 METATX_GAS_PRICE_THRESHOLD = float(env('METATX_GAS_PRICE_THRESHOLD', default='10000.0'))
 
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Handle economy tx related tests.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.utils import timezone
+
+from economy.tx import grants_transactions_validator, rpc_batch
+from test_plus.test import TestCase
+from web3 import HTTPProvider, Web3
+
+
+class TxTest(TestCase):
+    """Define tests for the batched contribution validation."""
+
+    def test_rpc_batch_matches_results_to_calls(self):
+        """Test the batch results are returned in call order, with None for errors."""
+        w3 = Web3(HTTPProvider('http://localhost:8545'))
+        response = [
+            {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': 'boom'}},
+            {'jsonrpc': '2.0', 'id': 0, 'result': '0x1'},
+        ]
+
+        with patch('economy.tx.make_post_request', return_value=json.dumps(response).encode()) as post:
+            results = rpc_batch(w3, [('eth_blockNumber', []), ('eth_getTransactionByHash', ['0x' + '1' * 64])])
+
+        assert results == ['0x1', None]
+        assert len(json.loads(post.call_args[0][1])) == 2
+        post.assert_called_once()
+
+    def test_contributions_of_a_bulk_checkout_share_one_lookup(self):
+        """Test a transaction is fetched once however many contributions it paid for."""
+        tx_hash = '0x' + 'a' * 64
+        contributions = [
+            SimpleNamespace(pk=pk, split_tx_id=tx_hash, created_on=timezone.now()) for pk in range(3)
+        ] + [SimpleNamespace(pk=3, split_tx_id='0x0', created_on=timezone.now())]
+        receipt = {'status': 1, 'blockNumber': 1, 'blockHash': '0x1'}
+
+        with patch('economy.tx.get_receipts_and_transactions', return_value={tx_hash: (receipt, {})}) as lookup, \
+                patch('economy.tx.validate_bulk_checkout', side_effect=lambda *args, **kwargs: {'passed': True}):
+            responses = grants_transactions_validator(contributions, MagicMock())
+
+        lookup.assert_called_once()
+        assert list(lookup.call_args[0][1]) == [tx_hash]
+        assert [responses[pk]['status'] for pk in range(3)] == ['success'] * 3
+        assert responses[3]['validation']['comment'] == 'Invalid transaction hash in split_tx_id'
@@ -1,3 +1,4 @@
+import json
 from decimal import Decimal
 
 from django.conf import settings
@@ -5,8 +6,11 @@
 
 from dashboard.abi import erc20_abi
 from economy.models import Token
-from web3 import Web3
+from web3 import HTTPProvider, Web3
 from web3.exceptions import BadFunctionCallOutput
+from web3.middleware.pythonic import receipt_formatter, transaction_formatter
+from web3.utils.datastructures import AttributeDict
+from web3.utils.request import make_post_request
 
 
 def maybeprint(_str, _str2=None, _str3=None):
@@ -43,6 +47,15 @@ class TransactionNotFound(Exception):
 check_event_transfer =  lambda contract_address, search, txid : w3.eth.filter({ "address": contract_address, "topics": [search, txid]})
 get_decimals = lambda contract : int(contract.functions.decimals().call())
 
+# transactions looked up per JSON-RPC batch request, each takes a receipt and a transaction call
+RPC_BATCH_SIZE = 100
+RPC_RESULT_FORMATTERS = {
+    'eth_getTransactionReceipt': receipt_formatter,
+    'eth_getTransactionByHash': transaction_formatter,
+}
+# matches the DROPPED_DAYS of dashboard.utils.get_tx_status
+TX_DROPPED_AFTER = timezone.timedelta(days=4)
+
 bulk_checkout_abi = '[{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"token","type":"address"},{"indexed":true,"internalType":"uint256","name":"amount","type":"uint256"},{"indexed":false,"internalType":"address","name":"dest","type":"address"},{"indexed":true,"internalType":"address","name":"donor","type":"address"}],"name":"DonationSent","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"previousOwner","type":"address"},{"indexed":true,"internalType":"address","name":"newOwner","type":"address"}],"name":"OwnershipTransferred","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"address","name":"account","type":"address"}],"name":"Paused","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"token","type":"address"},{"indexed":true,"internalType":"uint256","name":"amount","type":"uint256"},{"indexed":true,"internalType":"address","name":"dest","type":"address"}],"name":"TokenWithdrawn","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"address","name":"account","type":"address"}],"name":"Unpaused","type":"event"},{"inputs":[{"components":[{"internalType":"address","name":"token","type":"address"},{"internalType":"uint256","name":"amount","type":"uint256"},{"internalType":"address payable","name":"dest","type":"address"}],"internalType":"struct BulkCheckout.Donation[]","name":"_donations","type":"tuple[]"}],"name":"donate","outputs":[],"stateMutability":"payable","type":"function"},{"inputs":[],"name":"owner","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"pause","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"paused","outputs":[{"internalType":"bool","name":"","type":"bool"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"renounceOwnership","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"newOwner","type":"address"}],"name":"transferOwnership","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"unpause","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address payable","name":"_dest","type":"address"}],"name":"withdrawEther","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_tokenAddress","type":"address"},{"internalType":"address","name":"_dest","type":"address"}],"name":"withdrawToken","outputs":[],"stateMutability":"nonpayable","type":"function"}]'
 
 def getReplacedTX(tx):
@@ -82,14 +95,21 @@ def transaction_status(transaction, txid):
         maybeprint(89, e)
 
 
-def get_token(token_symbol, network, chain='std'):
+def get_token(token_symbol, network, chain='std', tokens=None):
     """
     For a given token symbol and amount, returns the token's details.
     For mainnet checkout in ETH, we change the token address to 0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE
     For polygon checkout in MATIC, we change the token address to 0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE
     since that's the address BulkCheckout uses to represent ETH (default here is the zero address)
+    Pass the same `tokens` dict to reuse the tokens already looked up, e.g. across a batch of contributions
     """
 
+    if tokens is not None:
+        key = (token_symbol, network, chain)
+        if key not in tokens:
+            tokens[key] = get_token(token_symbol, network, chain)
+        return tokens[key]
+
     network_id = 1
 
     if chain == 'polygon':
@@ -110,12 +130,12 @@ def get_token(token_symbol, network, chain='std'):
     return token
 
 
-def parse_token_amount(token_symbol, amount, network, chain='std'):
+def parse_token_amount(token_symbol, amount, network, chain='std', tokens=None):
     """
     For a given token symbol and amount, returns the integer version in "wei", i.e. the integer
     form based on the token's number of decimals
     """
-    token = get_token(token_symbol, network, chain)
+    token = get_token(token_symbol, network, chain, tokens)
     decimals = token['decimals']
     parsed_amount = int(amount * 10 ** decimals)
     return parsed_amount
@@ -141,35 +161,17 @@ def check_for_replaced_tx(tx_hash, network, datetime=None, chain='std'):
     return tx_hash, status, timestamp
 
 
-def grants_transaction_validator(contribution, w3, chain='std'):
-    """
-    This function is used to validate contributions sent on L1 & Polygon L2 through the BulkCheckout contract.
-    This contract can be found here:
-      - On GitHub: https://github.com/gitcoinco/BulkTransactions/blob/master/contracts/BulkCheckout.sol
-      - On mainnet: https://etherscan.io/address/0x7d655c57f71464b6f83811c55d84009cd9f5221c
-      - On Polygon mainnet: https://polygonscan.com/address/0xb99080b9407436eBb2b8Fe56D45fFA47E9bb8877
-      - On Polygon testnet: https://mumbai.polygonscan.com/address/0x3E2849E2A489C8fE47F52847c42aF2E8A82B9973
-
-    To facilitate testing on Rinkeby and Mumbai, we pass in a web3 instance instead of using the mainnet
-    instance defined at the top of this file
-    """
-
-    # Get specific info about this contribution that we use later
-    tx_hash = contribution.split_tx_id
-    network = contribution.subscription.network
-
+def get_bulk_checkout_address(network, chain='std'):
     if network == 'mainnet' and chain == 'polygon':
-        bulk_checkout_address = '0xb99080b9407436eBb2b8Fe56D45fFA47E9bb8877'
+        return '0xb99080b9407436eBb2b8Fe56D45fFA47E9bb8877'
     elif network == 'testnet' and chain == 'polygon':
-        bulk_checkout_address = '0x3E2849E2A489C8fE47F52847c42aF2E8A82B9973'
-    else:
-        bulk_checkout_address = '0x7d655c57f71464B6f83811C55D84009Cd9f5221C'
+        return '0x3E2849E2A489C8fE47F52847c42aF2E8A82B9973'
+    return '0x7d655c57f71464B6f83811C55D84009Cd9f5221C'
 
-    # Get bulk checkout contract instance
-    bulk_checkout_contract = w3.eth.contract(address=bulk_checkout_address, abi=bulk_checkout_abi)
 
-    # Response that calling function uses to set fields on Contribution. Set the defaults here
-    response = {
+def default_validation_response():
+    """Response that calling function uses to set fields on Contribution"""
+    return {
         # We set `passed` to `True` if matching transfer is found for this contribution. The
         # `comment` field is used to provide details when false
         'validation': {
@@ -188,32 +190,194 @@ def grants_transaction_validator(contribution, w3, chain='std'):
         'split_tx_confirmed': False
     }
 
+
+def is_valid_tx_hash(tx_hash):
+    return bool(tx_hash) and len(tx_hash) == 66
+
+
+def invalid_tx_hash_response():
+    response = default_validation_response()
+    # Set to True so this doesn't run again, since there's no transaction hash to check
+    response['tx_cleared'] = True
+    response['validation']['comment'] = 'Invalid transaction hash in split_tx_id'
+    return response
+
+
+def receipt_status(receipt, created_on):
+    """
+    The status get_tx_status would return for a receipt that was already fetched: pending, or
+    dropped once older than TX_DROPPED_AFTER when there is no receipt yet, and success or error once mined
+    """
+    if not receipt:
+        return 'dropped' if timezone.now() > created_on + TX_DROPPED_AFTER else 'pending'
+    if 'status' not in receipt.keys():
+        return 'success' if receipt['blockNumber'] and receipt['blockHash'] else 'unknown'
+    return {1: 'success', 0: 'error'}.get(receipt['status'], 'unknown')
+
+
+def rpc_batch(w3, calls):
+    """
+    Sends [(method, params)] to the node as a single JSON-RPC batch request. Results are formatted
+    the same way the matching w3.eth methods format them, and are None for calls that errored.
+    Providers other than HTTP don't take batches, so the calls are made one at a time instead
+    """
+    if not calls:
+        return []
+
+    provider = w3.providers[0]
+    if not isinstance(provider, HTTPProvider):
+        results = []
+        for method, params in calls:
+            try:
+                results.append(w3.manager.request_blocking(method, params))
+            except ValueError:
+                results.append(None)
+        return results
+
+    payload = [
+        {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': request_id}
+        for request_id, (method, params) in enumerate(calls)
+    ]
+    raw_response = make_post_request(
+        provider.endpoint_uri, json.dumps(payload).encode(), **provider.get_request_kwargs()
+    )
+    responses = {response['id']: response for response in json.loads(raw_response)}
+
+    results = []
+    for request_id, (method, _) in enumerate(calls):
+        result = responses.get(request_id, {}).get('result')
+        if result is not None:
+            formatter = RPC_RESULT_FORMATTERS.get(method)
+            result = AttributeDict.recursive(formatter(result) if formatter else result)
+        results.append(result)
+    return results
+
+
+def get_receipts_and_transactions(w3, tx_hashes):
+    """
+    Fetches the receipt and transaction of every hash with batch requests of at most RPC_BATCH_SIZE hashes
+
+    Returns:
+        {tx_hash: (receipt, transaction)}, either of which is None when the node doesn't have it
+    """
+    tx_hashes = list(tx_hashes)
+    found = {}
+    for i in range(0, len(tx_hashes), RPC_BATCH_SIZE):
+        batch = tx_hashes[i:i + RPC_BATCH_SIZE]
+        calls = []
+        for tx_hash in batch:
+            calls += [('eth_getTransactionReceipt', [tx_hash]), ('eth_getTransactionByHash', [tx_hash])]
+        results = rpc_batch(w3, calls)
+        for index, tx_hash in enumerate(batch):
+            found[tx_hash] = (results[2 * index], results[2 * index + 1])
+    return found
+
+
+def grants_transaction_validator(contribution, w3, chain='std'):
+    """
+    This function is used to validate contributions sent on L1 & Polygon L2 through the BulkCheckout contract.
+    This contract can be found here:
+      - On GitHub: https://github.com/gitcoinco/BulkTransactions/blob/master/contracts/BulkCheckout.sol
+      - On mainnet: https://etherscan.io/address/0x7d655c57f71464b6f83811c55d84009cd9f5221c
+      - On Polygon mainnet: https://polygonscan.com/address/0xb99080b9407436eBb2b8Fe56D45fFA47E9bb8877
+      - On Polygon testnet: https://mumbai.polygonscan.com/address/0x3E2849E2A489C8fE47F52847c42aF2E8A82B9973
+
+    To facilitate testing on Rinkeby and Mumbai, we pass in a web3 instance instead of using the mainnet
+    instance defined at the top of this file.
+    To validate many contributions, use grants_transactions_validator, which looks each transaction up once
+    """
+
+    # Get specific info about this contribution that we use later
+    tx_hash = contribution.split_tx_id
+    network = contribution.subscription.network
+
     # Return if tx_hash is not valid
-    if not tx_hash or len(tx_hash) != 66:
-        # Set to True so this doesn't run again, since there's no transaction hash to check
-        response['tx_cleared'] = True
-        response['validation']['comment'] = 'Invalid transaction hash in split_tx_id'
-        return response
+    if not is_valid_tx_hash(tx_hash):
+        return invalid_tx_hash_response()
 
     # Check for dropped and replaced txn
     tx_hash, status, _ = check_for_replaced_tx(tx_hash, network, chain=chain)
 
+    receipt = tx_info = None
+    if status != 'pending':
+        receipt = w3.eth.getTransactionReceipt(tx_hash) # equivalent to eth_getTransactionReceipt
+        if status != 'success':
+            tx_info = w3.eth.getTransaction(tx_hash) # equivalent to eth_getTransactionByHash
+
+    return validate_bulk_checkout(contribution, w3, status, receipt, tx_info, chain=chain)
+
+
+def grants_transactions_validator(contributions, w3, chain='std'):
+    """
+    grants_transaction_validator for many contributions on the same network and chain. A bulk checkout
+    creates one contribution per grant, all with the same split_tx_id, so contributions are grouped by
+    transaction and each receipt and transaction is fetched once, in batch requests. Tokens are looked
+    up once per batch
+
+    Returns:
+        {contribution pk: validator response}, with the transaction's get_tx_status in response['status'].
+        Contributions that raised while being validated are left out
+    """
+    responses = {}
+    by_tx_hash = {}
+    for contribution in contributions:
+        if is_valid_tx_hash(contribution.split_tx_id):
+            by_tx_hash.setdefault(contribution.split_tx_id, []).append(contribution)
+        else:
+            responses[contribution.pk] = invalid_tx_hash_response()
+            responses[contribution.pk]['status'] = 'unknown'
+
+    # Check for dropped and replaced txns, whose replacements are fetched in a second batch
+    found = get_receipts_and_transactions(w3, by_tx_hash.keys())
+    replaced = {}
+    for tx_hash, (receipt, _) in found.items():
+        replace_hash = getReplacedTX(tx_hash) if not receipt else None
+        if replace_hash:
+            replaced[tx_hash] = replace_hash
+    if replaced:
+        found.update(get_receipts_and_transactions(w3, set(replaced.values()) - set(found)))
+
+    tokens = {}
+    for tx_hash, tx_contributions in by_tx_hash.items():
+        receipt, tx_info = found[replaced.get(tx_hash, tx_hash)]
+        for contribution in tx_contributions:
+            status = receipt_status(receipt, contribution.created_on)
+            try:
+                response = validate_bulk_checkout(contribution, w3, status, receipt, tx_info, chain=chain, tokens=tokens)
+            except Exception as e:
+                # left out of the responses, so the caller validates it on its own
+                maybeprint(contribution.pk, e)
+                continue
+            response['status'] = status
+            responses[contribution.pk] = response
+
+    return responses
+
+
+def validate_bulk_checkout(contribution, w3, status, receipt, tx_info, chain='std', tokens=None):
+    """
+    Validates a contribution against its BulkCheckout transaction that was already looked up.
+    The receipt is needed unless the transaction is pending, the transaction itself only when it failed
+    """
+    network = contribution.subscription.network
+
+    # Get bulk checkout contract instance
+    bulk_checkout_contract = w3.eth.contract(address=get_bulk_checkout_address(network, chain), abi=bulk_checkout_abi)
+
+    response = default_validation_response()
+
     # If transaction was successful, continue to validate it
     if status == 'success':
         # Transaction was successful so we know it cleared
         response['tx_cleared'] = True
         response['split_tx_confirmed'] = True
 
-        # Get the receipt to parse parameters
-        receipt = w3.eth.getTransactionReceipt(tx_hash)
-
         # Validator currently assumes msg.sender == originator as described above
         response['originator'] = [ receipt['from'] ]
 
         # Parse receipt logs to look for expected transfer info. We don't need to distinguish
         # between ETH and token transfers, and don't need to look at any other receipt parameters,
         # because all contributions are emitted as an event
-        receipt = w3.eth.getTransactionReceipt(tx_hash)
         parsed_logs = bulk_checkout_contract.events.DonationSent().processReceipt(receipt)
 
         # Return if no donation logs were found
@@ -224,14 +388,15 @@ def grants_transaction_validator(contribution, w3, chain='std'):
         # Parse out the transfer details we are looking to find in the event logs
         token_symbol = contribution.normalized_data['token_symbol']
         expected_recipient = contribution.normalized_data['admin_address'].lower()
-        expected_token = get_token(token_symbol, network, chain)['addr'].lower() # we compare by token address
+        expected_token = get_token(token_symbol, network, chain, tokens)['addr'].lower() # we compare by token address
         amount_to_use = contribution.subscription.amount_per_period
 
         expected_amount = parse_token_amount(
             token_symbol=token_symbol,
             amount=amount_to_use,
             network=network,
-            chain=chain
+            chain=chain,
+            tokens=tokens
         )
         transfer_tolerance = 0.05 # use a 5% tolerance when checking amounts to account for floating point error
         expected_amount_min = int(expected_amount * (1 - transfer_tolerance))
@@ -284,44 +449,38 @@ def grants_transaction_validator(contribution, w3, chain='std'):
         response['validation']['comment'] = 'Transaction is still pending'
         return response
 
-    try:
-        # Get receipt and set originator to msg.sender for reasons described above
-        receipt = w3.eth.getTransactionReceipt(tx_hash) # equivalent to eth_getTransactionReceipt
-        tx_info = w3.eth.getTransaction(tx_hash) # equivalent to eth_getTransactionByHash
-        response['originator'] = [ receipt['from'] ]
-
-        if receipt.status == 0:
-            # Transaction was mined but it failed, try to find out why
-            gas_limit = tx_info['gas']
-            gas_used = receipt['gasUsed']
-            if gas_limit == gas_used:
-                response['tx_cleared'] = True
-                response['split_tx_confirmed'] = True
-                response['validation']['comment'] = 'Transaction failed. Out of gas'
-                return response
+    if not receipt:
+        response['validation']['comment'] = 'Transaction receipt not found. Transaction may still be pending or was dropped'
+        return response
 
-            if gas_used > 0.99 * gas_limit:
-                # Some out of gas failures don't use all gas, e.g. https://etherscan.io/tx/0xac37f5bc0e9b75dd0f296b8569f72181a066458b9bee1bbed088ec2298fb4344
-                response['tx_cleared'] = True
-                response['split_tx_confirmed'] = True
-                response['validation']['comment'] = 'Transaction failed. Likely out of gas. Check Etherscan or Tenderly for more details'
-                return response
+    # Set originator to msg.sender for reasons described above
+    response['originator'] = [ receipt['from'] ]
 
+    if receipt.status == 0:
+        # Transaction was mined but it failed, try to find out why
+        gas_limit = tx_info['gas']
+        gas_used = receipt['gasUsed']
+        if gas_limit == gas_used:
             response['tx_cleared'] = True
             response['split_tx_confirmed'] = True
-            response['validation']['comment'] = 'Transaction failed. Unknown reason. See Etherscan or Tenderly for more details'
+            response['validation']['comment'] = 'Transaction failed. Out of gas'
             return response
 
-        # If here, transaction was successful. This code block should never execute because it means
-        # the transaction was successful but for some unknown reason it was not parsed above
-        raise Exception('Unknown transaction validation flow 1')
+        if gas_used > 0.99 * gas_limit:
+            # Some out of gas failures don't use all gas, e.g. https://etherscan.io/tx/0xac37f5bc0e9b75dd0f296b8569f72181a066458b9bee1bbed088ec2298fb4344
+            response['tx_cleared'] = True
+            response['split_tx_confirmed'] = True
+            response['validation']['comment'] = 'Transaction failed. Likely out of gas. Check Etherscan or Tenderly for more details'
+            return response
 
-    except w3.exceptions.TransactionNotFound:
-        response['validation']['comment'] = 'Transaction receipt not found. Transaction may still be pending or was dropped'
+        response['tx_cleared'] = True
+        response['split_tx_confirmed'] = True
+        response['validation']['comment'] = 'Transaction failed. Unknown reason. See Etherscan or Tenderly for more details'
         return response
 
-    # We should always return before getting here. If we don't, above parsing logic should be fixed
-    raise Exception('Unknown transaction validation flow 2')
+    # If here, transaction was successful. This code block should never execute because it means
+    # the transaction was successful but for some unknown reason it was not parsed above
+    raise Exception('Unknown transaction validation flow 1')
 
 
 def trim_null_address(address):
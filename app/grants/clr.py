@@ -23,7 +23,15 @@
 from django.utils import timezone
 
 import numpy as np
-from grants.clr_data_src import fetch_contributions, fetch_grants, fetch_summed_contributions
+from grants.clr_data_src import (
+    fetch_contributions, fetch_grants, fetch_summed_contribution_matrix, fetch_summed_contributions,
+)
+from grants.clr_engine import ContributionMatrix, calculate_clr_totals, cap_matches
+from grants.clr_prediction import MatchPredictor, get_contributor_vectors
+from grants.clr_scheduler import POTENTIAL_DONATIONS, predict_curves
+from grants.clr_snapshot import RoundSnapshot
+from grants.clr_state import CLRRoundState
+from grants.clr_writer import CLRPredictionCurveWriter
 from grants.models import GrantCLRCalculation
 
 
@@ -348,68 +356,76 @@ def normalise(bigtot, totals, total_pot, match_cap_per_grant):
                 [{'id': proj, 'number_contributions': _num, 'contribution_amount': _sum, 'clr_amount': tot}]
 
     '''
+    keys = list(totals.keys())
+    matches = np.array([totals[key]['clr_amount'] for key in keys], dtype=np.float64)
+
     # check if saturation is reached
     is_saturated = bigtot >= total_pot
     # check for saturation and normalise if reached
     if is_saturated:
         # print(f'saturation reached. Total Pot: ${total_pot} | Total Allocated ${bigtot}. Normalizing')
-        for key, t in totals.items():
-            t['clr_amount'] = ((t['clr_amount'] / bigtot) * total_pot)
+        matches = (matches / bigtot) * total_pot
     else:
         if bigtot == 0:
             bigtot = 1
         percentage_increase = np.log(total_pot / bigtot) / 100
-        for key, t in totals.items():
-            t['clr_amount'] = t['clr_amount'] * (1 + percentage_increase)
+        matches = matches * (1 + percentage_increase)
 
     # apply the match cap post-normalisation
-    totals = apply_cap(totals, match_cap_per_grant, is_saturated)
+    matches = cap_matches(matches, match_cap_per_grant, is_saturated)
+
+    for key, clr_amount in zip(keys, matches):
+        totals[key]['clr_amount'] = float(clr_amount)
 
     return totals
 
 
 def apply_cap(totals, match_cap_per_grant, should_spread):
-    # work out how much of the pool is remaining after capping each grant
-    remainder = 0   # amount left to be redistributed after cap
-    uncapped = 0    # total amount matched for grants which haven't capped
-
-    # cap each of the clr_amounts
-    for key, t in totals.items():
-        if t['clr_amount'] >= match_cap_per_grant:
-            # grant has exceeded the cap
-            #  - so cap the clr_amount
-            #  - add the extra funds to remainder
-            remainder += t['clr_amount'] - match_cap_per_grant
-            t['clr_amount'] = match_cap_per_grant
+    '''
+        caps each grant at match_cap_per_grant, spreading the capped remainder proportionally
+        over the uncapped grants when should_spread (see grants.clr_engine.cap_matches)
+    '''
+    keys = list(totals.keys())
+    matches = np.array([totals[key]['clr_amount'] for key in keys], dtype=np.float64)
 
-        else:
-            # grant has not exceed cap so add amount to uncapped
-            uncapped += t['clr_amount']
-
-    # check that we have both capped and uncapped grants and that we should be spreading the remainder
-    if should_spread and remainder > 0 and uncapped > 0:
-        # div so we can spread the remainder proportionally
-        per_remainder = remainder / uncapped
-        # reset remainder to check if any grants enter the cap region after spreading the remainder
-        remainder = 0
-        # spread the remainder
-        for key, t in totals.items():
-            if t['clr_amount'] < match_cap_per_grant:
-                t['clr_amount'] += per_remainder * t['clr_amount']
-                # check if the cap is hit after spreading the remainder
-                if t['clr_amount'] >= match_cap_per_grant:
-                    remainder += t['clr_amount'] - match_cap_per_grant
-
-        # apply the cap again (recursively)
-        if remainder > 0:
-            apply_cap(totals, match_cap_per_grant, should_spread)
+    for key, clr_amount in zip(keys, cap_matches(matches, match_cap_per_grant, should_spread)):
+        totals[key]['clr_amount'] = float(clr_amount)
 
     return totals
 
 
-def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainnet', only_grant_pk=None, what='full', use_sql=False):
+def record_current_distribution(clr_round, curr_grants_clr):
+    '''
+        updates the current match estimate (the 0 point of each grant's latest prediction curve)
+
+        args:
+            clr_round       :   GrantCLR
+            curr_grants_clr :   normalised totals by grant (from normalise)
+    '''
+    print(f"- saving slim grant calc at {round(time.time(),1)}")
+    grants = {grant.pk: grant for grant in clr_round.grants.using('default').filter(pk__in=curr_grants_clr.keys())}
+    latest_calcs = {}
+    calcs = clr_round.clr_calculations.using('default').filter(latest=True, grant_id__in=grants.keys()).order_by('pk')
+    for calc in calcs:
+        latest_calcs[calc.grant_id] = calc
+
+    writer = CLRPredictionCurveWriter(clr_round)
+    for pk, grant_calc in curr_grants_clr.items():
+        # update latest calcs with current distribution
+        latest_calc = latest_calcs.get(pk)
+        if pk not in grants or not latest_calc:
+            print(f"- - could not find latest clr calc for {pk} ")
+            continue
+        clr_prediction_curve = copy.deepcopy(latest_calc.clr_prediction_curve)
+        clr_prediction_curve[0][1] = grant_calc['clr_amount'] # update only the existing match estimate
+        writer.stage(grants[pk], clr_prediction_curve)
+
+    print(f"- saving {len(writer)} grant calcs at {round(time.time(),1)}")
+    writer.commit()
+
+
+def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainnet', only_grant_pk=None, what='full', use_sql=False, engine='sparse', processes=1, use_snapshot=False):
     # setup
-    counter = 0
     debug_output = []
     clr_calc_start_time = timezone.now()
 
@@ -417,13 +433,52 @@ def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainn
     total_pot = float(clr_round.total_pot)
     v_threshold = float(clr_round.verified_threshold)
 
+    grant_clr_percentage_cap = clr_round.grant_clr_percentage_cap if clr_round.grant_clr_percentage_cap else 100
+    # $ value of the percentage cap
+    match_cap_per_grant = total_pot * (float(grant_clr_percentage_cap) / 100)
+
+    # for incremental calc - apply only the contributions made since the last run to the stored round state
+    if what == 'incremental':
+        state = CLRRoundState.load(clr_round.pk)
+        if state and not state.is_stale:
+            print(f"- starting incremental update at {round(time.time(),1)}")
+            contributions = fetch_contributions(clr_round, network)
+            applied = state.apply_contributions(contributions, clr_round.contribution_multiplier)
+            state.save()
+            print(f"- applied {applied} new contributions at {round(time.time(),1)}")
+
+            curr_grants_clr = normalise(state.bigtot, copy.deepcopy(state.totals), total_pot, match_cap_per_grant)
+            predictor = MatchPredictor.from_totals(clr_round.pk, state.totals, v_threshold, total_pot, match_cap_per_grant)
+            predictor.save(get_contributor_vectors(state.curr_agg, state.trust_dict))
+            record_current_distribution(clr_round, curr_grants_clr)
+            print(f"\nTotal execution time: {(timezone.now() - clr_calc_start_time)}\n")
+            return
+
+        # the round state needs profile keyed data from the orm, so rebuild it the slow way
+        use_sql = False
+        use_snapshot = False
+
     print(f"- starting fetch_grants at {round(time.time(),1)}")
     grants = fetch_grants(clr_round, network)
 
-    # collect data using sql or django (to group+sum)
-    if use_sql:
+    # reuse the round another worker has already read from the db (see grants.clr_snapshot)
+    snapshot = RoundSnapshot.load(clr_round.pk, network) if use_snapshot else None
+
+    # collect data using the snapshot, sql or django (to group+sum)
+    # the sparse engine reads the snapshot and the sql rows straight into its matrix, without the nested dicts
+    matrix = None
+    if snapshot:
+        print(f"- starting load of snapshot ({len(snapshot)} rows) at {round(time.time(),1)}")
+        if engine == 'sparse':
+            matrix = snapshot.to_matrix()
+        else:
+            curr_agg, trust_dict = snapshot.to_agg()
+    elif use_sql:
         print(f"- starting get data and sum at {round(time.time(),1)}")
-        curr_agg, trust_dict = fetch_summed_contributions(grants, clr_round, network)
+        if engine == 'sparse':
+            matrix = fetch_summed_contribution_matrix(grants, clr_round, network)
+        else:
+            curr_agg, trust_dict = fetch_summed_contributions(grants, clr_round, network)
     else:
         print(f"- starting fetch_contributions at {round(time.time(),1)}")
         contributions = fetch_contributions(clr_round, network)
@@ -435,45 +490,52 @@ def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainn
         # this aggregates the data into the expected format
         curr_agg = aggregate_contributions(curr_round)
 
-    if len(curr_agg) == 0:
+    if matrix is None and engine == 'sparse':
+        matrix = ContributionMatrix.from_agg(curr_agg, trust_dict)
+
+    if save_to_db and not snapshot:
+        # publish the freshly read round for the other workers and commands
+        if matrix is not None:
+            RoundSnapshot.from_matrix(clr_round.pk, network, matrix).save()
+        else:
+            RoundSnapshot.from_agg(clr_round.pk, network, curr_agg, trust_dict).save()
+
+    if not (matrix.grant_ids if matrix is not None else curr_agg):
         print(f'- done - no Contributions for CLR {clr_round.round_num}. Exiting')
         print(f"\nTotal execution time: {(timezone.now() - clr_calc_start_time)}\n")
         return
 
-    print(f"- starting current distributions calc at {round(time.time(),1)}")
-    # aggregate pairs and run calculation to get current distribution
-    pair_totals = get_totals_by_pair(curr_agg)
-
-    grant_clr_percentage_cap = clr_round.grant_clr_percentage_cap if clr_round.grant_clr_percentage_cap else 100
-    bigtot, totals = calculate_clr(curr_agg, trust_dict, pair_totals, v_threshold, total_pot)
-
-    # $ value of the percentage cap
-    match_cap_per_grant = total_pot * (float(grant_clr_percentage_cap) / 100)
+    print(f"- starting current distributions calc ({engine} engine) at {round(time.time(),1)}")
+    if matrix is not None:
+        # pair totals and matches as contributor x grant matrix operations (the kernel shared with townsquare)
+        bigtot, totals = calculate_clr_totals(matrix, v_threshold)
+        vectors = matrix.contributor_vectors()
+    else:
+        # reference implementation - aggregate pairs and run calculation to get current distribution
+        pair_totals = get_totals_by_pair(curr_agg)
+        bigtot, totals = calculate_clr(curr_agg, trust_dict, pair_totals, v_threshold, total_pot)
+        vectors = get_contributor_vectors(curr_agg, trust_dict)
 
     # normalise against a deepcopy of the totals to avoid mutations
     curr_grants_clr = normalise(bigtot, copy.deepcopy(totals), total_pot, match_cap_per_grant)
 
+    # what-if predictions only need the raw matches and each grant's contributors
+    predictor = MatchPredictor.from_totals(clr_round.pk, totals, v_threshold, total_pot, match_cap_per_grant)
+    if save_to_db:
+        predictor.save(vectors)
+
     # for slim calc - only update the current distribution and skip calculating predictions
-    if what == 'slim':
-        print(f"- saving slim grant calc at {round(time.time(),1)}")
-        total_count = len(curr_grants_clr.items())
-        for pk, grant_calc in curr_grants_clr.items():
-            counter += 1
-            if counter % 10 == 0 or True:
-                print(f"- {counter}/{total_count} grants iter, pk:{pk}, at {round(time.time(),1)}")
-
-            # update latest calcs with current distribution
-            grant_calc = curr_grants_clr[pk]
-            grant = clr_round.grants.using('default').get(pk=pk)
-            latest_calc = grant.clr_calculations.using('default').filter(latest=True, grantclr=clr_round).order_by('-pk').first()
-            if not latest_calc:
-                print(f"- - could not find latest clr calc for {grant.pk} ")
-                continue
-            clr_prediction_curve = copy.deepcopy(latest_calc.clr_prediction_curve)
-            clr_prediction_curve[0][1] = grant_calc['clr_amount'] # update only the existing match estimate
-            print(clr_prediction_curve)
-            clr_round.record_clr_prediction_curve(grant, clr_prediction_curve)
-            grant.save()
+    if what in ['slim', 'incremental']:
+        if what == 'incremental':
+            # keep the pair totals around so the next run only has to apply the new contributions
+            state = CLRRoundState(
+                clr_round.pk, v_threshold, {grant.id: grant.defer_clr_to_id or grant.id for grant in grants},
+                curr_agg, trust_dict, pair_totals if engine != 'sparse' else get_totals_by_pair(curr_agg), totals,
+                contributions.values_list('pk', flat=True)
+            )
+            state.save()
+
+        record_current_distribution(clr_round, curr_grants_clr)
         # if we are only calculating slim CLR calculations, return here and save 97% compute power
         print(f"- done calculating at {round(time.time(),1)}")
         print(f"\nTotal execution time: {(timezone.now() - clr_calc_start_time)}\n")
@@ -485,54 +547,23 @@ def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainn
 
     print(f"- starting grants iter at {round(time.time(),1)}")
     # for full calc - calculate the clr for each grant given additional potential_donations
-    total_count = grants.count()
+    grants = list(grants)
+    potential_donations = POTENTIAL_DONATIONS
+    vectors = {grant.id: vectors[grant.id] for grant in grants if grant.id in vectors}
+    curves = predict_curves(predictor, vectors, [grant.id for grant in grants], what=what, processes=processes)
+    print(f"- done predicting {len(curves)} grants at {round(time.time(),1)}")
 
-    invalid_clr_calculations = GrantCLRCalculation.objects.filter(latest=True, grantclr=clr_round.pk)
+    # stage every curve and write the round in one go once all grants are done
+    writer = CLRPredictionCurveWriter(clr_round, update_grants=from_date and from_date > (clr_calc_start_time - timezone.timedelta(hours=1)))
 
     for grant in grants:
-        invalid_clr_calculations.exclude(grant=grant.pk)
-        # five potential additional donations plus the base case of 0
-        potential_donations = [0, 1, 10, 100, 1000, 10000]
-
-        # debug the run...
-        counter += 1
-        if counter % 10 == 0 or True:
-            print(f"- {counter}/{total_count} grants iter, pk:{grant.id}, at {round(time.time(),1)}")
-
-        # if no contributions have been made for this grant then the pairwise will fail and there will be no matching for this grant
-        if not curr_agg.get(grant.id):
-            grants_clr = None
-            potential_clr = [0.0 for x in range(0, 6)]
-        else:
-            potential_clr = []
-            for amount in potential_donations:
-                # no need to run the calculation multiple times for amount=0 (will always be the same result)
-                if amount == 0:
-                    # use the current distribution calc
-                    grants_clr = curr_grants_clr.get(grant.id)
-                    predicted_clr = grants_clr['clr_amount'] if grants_clr else 0.0
-                else:
-                    raw_grants_clr = totals.get(grant.id)
-                    # final will save the current distribution for every grant (ie without predictions)
-                    if what == 'final' or raw_grants_clr['clr_amount'] == match_cap_per_grant:
-                        # ignore the other ones
-                        grants_clr = None
-                        predicted_clr = 0.0
-                    else:
-                        # calculate clr with additional donation amount
-                        grants_clr, predicted_clr, _, _ = calculate_clr_for_prediction(
-                            bigtot, totals, curr_agg, trust_dict, v_threshold, total_pot, grant.id, amount, match_cap_per_grant
-                        )
-
-                # record each point of the prediction
-                potential_clr.append(predicted_clr)
+        potential_clr = curves[grant.id]
+        grants_clr = curr_grants_clr.get(grant.id)
 
         # save the result of the prediction
         if save_to_db:
             clr_prediction_curve = list(zip(potential_donations, potential_clr))
             base = clr_prediction_curve[0][1]
-            grant.last_clr_calc_date = timezone.now()
-            grant.next_clr_calc_date = timezone.now() + timezone.timedelta(minutes=60)
 
             # check that we have enough data to set the curve
             can_estimate = True if base or clr_prediction_curve[1][1] or clr_prediction_curve[2][1] or clr_prediction_curve[3][1] else False
@@ -541,17 +572,19 @@ def predict_clr(save_to_db=False, from_date=None, clr_round=None, network='mainn
             else:
                 clr_prediction_curve = [[0.0, 0.0, 0.0] for x in range(0, 6)]
 
-            print(clr_prediction_curve)
+            writer.stage(grant, clr_prediction_curve)
 
-            clr_round.record_clr_prediction_curve(grant, clr_prediction_curve)
+        debug_output.append({'grant': grant.id, "title": grant.title, "clr_prediction_curve": (potential_donations, potential_clr), "grants_clr": grants_clr})
 
-            if from_date > (clr_calc_start_time - timezone.timedelta(hours=1)):
-                grant.save()
+    if save_to_db:
+        if not only_grant_pk:
+            # grants which have dropped out of the round no longer have a valid calc
+            invalid_clr_calculations = GrantCLRCalculation.objects.filter(latest=True, grantclr=clr_round.pk)
+            invalid_clr_calculations.exclude(grant_id__in=writer.curves.keys()).update(latest=False, active=False)
 
-        debug_output.append({'grant': grant.id, "title": grant.title, "clr_prediction_curve": (potential_donations, potential_clr), "grants_clr": grants_clr})
+        print(f"- saving {len(writer)} grant calcs at {round(time.time(),1)}")
+        writer.commit()
 
-    invalid_clr_calculations.update(latest=False, active=False)
-    
     print(f"\nTotal execution time: {(timezone.now() - clr_calc_start_time)}\n")
 
     return debug_output
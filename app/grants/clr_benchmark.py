@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Define the synthetic round generator and CLR benchmarks.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import contextlib
+import copy
+import io
+import statistics
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.utils import timezone
+
+import numpy as np
+from grants import clr
+from grants.clr_engine import calculate_clr_sparse
+from townsquare import clr as townsquare_clr
+
+
+class SyntheticContributions:
+    '''
+        in-memory stand in for the Contribution queryset returned by fetch_contributions,
+        implementing only what grants.clr reads from it
+    '''
+
+    def __init__(self, contributions):
+        self.contributions = contributions
+
+    def __iter__(self):
+        return iter(self.contributions)
+
+    def __len__(self):
+        return len(self.contributions)
+
+    def count(self):
+        return len(self.contributions)
+
+    def filter(self, created_on__gte=None, created_on__lte=None):
+        return SyntheticContributions([
+            contribution for contribution in self.contributions
+            if (created_on__gte is None or contribution.created_on >= created_on__gte)
+            and (created_on__lte is None or contribution.created_on <= created_on__lte)
+        ])
+
+    def prefetch_related(self, *lookups):
+        return self
+
+    def values_list(self, field, flat=False):
+        return [getattr(contribution, field) for contribution in self.contributions]
+
+
+class SyntheticRound:
+    '''
+        a generated round: GrantCLR, grants and contributions as plain python objects
+
+        contributors pick grants with zipf-like popularity, give power-law sized amounts and
+        carry a trust bonus where sybil_rate of them sit at the sybil floor
+    '''
+
+    def __init__(self, num_grants=100, num_contributors=2000, num_contributions=20000, alpha=1.5,
+                 popularity=1.1, sybil_rate=0.1, total_pot=100000, match_cap=10, seed=0):
+        '''
+            Args:
+                num_grants          : grants in the round
+                num_contributors    : distinct contributing profiles
+                num_contributions   : contributions made during the round
+                alpha               : pareto shape of contribution amounts (lower = heavier tail)
+                popularity          : zipf exponent of how contributions spread over grants and contributors
+                sybil_rate          : share of contributors at the minimum trust bonus
+                total_pot           : matching pool
+                match_cap           : grant_clr_percentage_cap
+                seed                : random seed, rounds with the same arguments are identical
+        '''
+        rng = np.random.RandomState(seed)
+        now = timezone.now()
+
+        self.clr_round = SimpleNamespace(
+            pk=seed, round_num=seed, sub_round_slug='benchmark',
+            start_date=now - timezone.timedelta(days=14), end_date=now,
+            total_pot=Decimal(total_pot), verified_threshold=Decimal(25),
+            grant_clr_percentage_cap=Decimal(match_cap), contribution_multiplier=Decimal(1),
+        )
+
+        self.grants = [
+            SimpleNamespace(id=i + 1, pk=i + 1, title=f'Grant {i + 1}', defer_clr_to=None, defer_clr_to_id=None)
+            for i in range(num_grants)
+        ]
+
+        # sybils are pinned to the trust floor, everyone else spreads over [0.5, 1.5)
+        trust = np.where(rng.random_sample(num_contributors) < sybil_rate, 0.5, rng.uniform(0.5, 1.5, num_contributors))
+        self.profiles = [
+            SimpleNamespace(id=i + 1, trust_bonus=round(float(trust_bonus), 2)) for i, trust_bonus in enumerate(trust)
+        ]
+
+        grant_picks = rng.choice(num_grants, num_contributions, p=self._zipf(num_grants, popularity, rng))
+        profile_picks = rng.choice(num_contributors, num_contributions, p=self._zipf(num_contributors, popularity, rng))
+        amounts = np.minimum(np.round(1 + rng.pareto(alpha, num_contributions), 2), 100000)
+        offsets = rng.uniform(0, 14 * 24 * 60 * 60, num_contributions)
+
+        self.contributions = SyntheticContributions([
+            SimpleNamespace(
+                pk=i + 1, grant_id=int(grant), profile_for_clr=self.profiles[profile],
+                amount_per_period_usdt=Decimal(str(amount)),
+                created_on=self.clr_round.start_date + timezone.timedelta(seconds=float(offset)),
+            ) for i, (grant, profile, amount, offset) in enumerate(zip(grant_picks, profile_picks, amounts, offsets))
+        ])
+
+    @staticmethod
+    def _zipf(n, exponent, rng):
+        '''popularity weights for n items, shuffled so ids don't predict rank'''
+        weights = 1.0 / np.arange(1, n + 1) ** exponent
+        rng.shuffle(weights)
+        return weights / weights.sum()
+
+    def townsquare_data(self):
+        '''contributions as the [[grant_id, user_id, amount]] rows used by townsquare.clr'''
+        return [
+            [float(c.grant_id), float(c.profile_for_clr.id), float(c.amount_per_period_usdt)]
+            for c in self.contributions
+        ]
+
+
+def time_call(func, repeat=3):
+    '''
+        returns:
+            (min, median) wall clock seconds over repeat calls, with func's output silenced
+    '''
+    timings = []
+    for x in range(0, repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+
+def benchmark_grants_clr(synthetic_round, engine='sparse', what='full', repeat=3, processes=1):
+    '''
+        times each stage of grants.clr against the synthetic round, then predict_clr end to
+        end with the db reads swapped for the in-memory round
+
+        returns:
+            [(stage, min seconds, median seconds)]
+    '''
+    clr_round = synthetic_round.clr_round
+    grants = synthetic_round.grants
+    contributions = synthetic_round.contributions
+    total_pot = float(clr_round.total_pot)
+    v_threshold = float(clr_round.verified_threshold)
+    match_cap_per_grant = total_pot * float(clr_round.grant_clr_percentage_cap) / 100
+
+    grant_contributions_curr = clr.populate_data_for_clr(grants, contributions, clr_round)
+    curr_round, trust_dict = clr.translate_data(grant_contributions_curr)
+    curr_agg = clr.aggregate_contributions(curr_round)
+    pair_totals = clr.get_totals_by_pair(curr_agg)
+    bigtot, totals = clr.calculate_clr(curr_agg, trust_dict, pair_totals, v_threshold, total_pot)
+
+    stages = [
+        ('populate_data_for_clr', lambda: clr.populate_data_for_clr(grants, contributions, clr_round)),
+        ('translate_data + aggregate', lambda: clr.aggregate_contributions(clr.translate_data(grant_contributions_curr)[0])),
+        ('get_totals_by_pair', lambda: clr.get_totals_by_pair(curr_agg)),
+        ('calculate_clr', lambda: clr.calculate_clr(curr_agg, trust_dict, pair_totals, v_threshold, total_pot)),
+        ('calculate_clr_sparse', lambda: calculate_clr_sparse(curr_agg, trust_dict, v_threshold, total_pot)),
+        ('normalise', lambda: clr.normalise(bigtot, copy.deepcopy(totals), total_pot, match_cap_per_grant)),
+    ]
+
+    def run_predict_clr():
+        # slim runs always write the current distribution, so that is stubbed out along with the reads
+        with mock.patch.object(clr, 'fetch_grants', return_value=grants), \
+                mock.patch.object(clr, 'fetch_contributions', return_value=contributions), \
+                mock.patch.object(clr, 'record_current_distribution'):
+            clr.predict_clr(
+                save_to_db=False, from_date=timezone.now(), clr_round=clr_round, what=what, engine=engine,
+                processes=processes
+            )
+    stages.append((f'predict_clr ({what}, {engine})', run_predict_clr))
+
+    return [(name, *time_call(func, repeat)) for name, func in stages]
+
+
+def benchmark_townsquare_clr(synthetic_round, repeat=3, live=True):
+    '''
+        times townsquare.clr's final and live (what-if) calculations against the synthetic round
+
+        returns:
+            [(stage, min seconds, median seconds)]
+    '''
+    data = synthetic_round.townsquare_data()
+    total_pot = float(synthetic_round.clr_round.total_pot)
+    stages = [('townsquare run_calc', lambda: townsquare_clr.run_calc(data, total_pot=total_pot))]
+    if live:
+        grant_id, live_user = data[0][0], data[0][1]
+        stages.append((
+            'townsquare run_live_calc',
+            lambda: townsquare_clr.run_live_calc(data, grant_id=grant_id, live_user=live_user, total_pot=total_pot)
+        ))
+
+    return [(name, *time_call(func, repeat)) for name, func in stages]
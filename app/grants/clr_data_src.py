@@ -1,5 +1,6 @@
 from django.db import connection
 
+from grants.clr_engine import ContributionMatrix
 from grants.models import Contribution, Grant, GrantCollection
 from townsquare.models import SquelchProfile
 
@@ -68,6 +69,84 @@ def fetch_contributions(clr_round, network='mainnet'):
     return contributions
 
 
+# rows pulled from the server-side cursor per round trip
+CHUNK_SIZE = 5000
+
+SUMMED_CONTRIBUTIONS_SQL = '''
+    -- group by ... sum the contributions $ value for each user
+    SELECT
+        grants.use_grant_id as grant_id,
+        grants_contribution.profile_for_clr_id as user_id,
+        SUM(grants_contribution.amount_per_period_usdt * %(multiplier)s)::FLOAT,
+        MAX(dashboard_profile.trust_bonus)::FLOAT as trust_bonus
+    FROM grants_contribution
+    INNER JOIN dashboard_profile ON (grants_contribution.profile_for_clr_id = dashboard_profile.id)
+    INNER JOIN grants_subscription ON (grants_contribution.subscription_id = grants_subscription.id)
+    RIGHT JOIN (
+        SELECT
+            grants_grant.id as grant_id,
+            (
+                CASE
+                WHEN grants_grant.defer_clr_to_id IS NOT NULL THEN grants_grant.defer_clr_to_id
+                ELSE grants_grant.id
+                END
+            ) as use_grant_id
+        FROM grants_grant
+    ) grants ON (grants_contribution.grant_id = grants.grant_id)
+    WHERE (
+        grants_contribution.grant_id = ANY(%(grant_ids)s) AND
+        grants_contribution.created_on >= %(start_date)s AND
+        grants_contribution.created_on <= %(end_date)s AND
+        grants_contribution.match = True AND
+        grants_subscription.network = %(network)s AND
+        grants_contribution.success = True AND
+        grants_contribution.amount_per_period_usdt >= 0 AND
+        NOT (
+            grants_contribution.profile_for_clr_id IN (
+                SELECT squelched.profile_id FROM townsquare_squelchprofile squelched WHERE squelched.active = True
+            ) AND grants_contribution.profile_for_clr_id IS NOT NULL
+        )
+    )
+    GROUP BY grants.use_grant_id, grants_contribution.profile_for_clr_id;
+'''
+
+
+def stream_summed_contributions(grants, clr_round, network='mainnet', chunk_size=CHUNK_SIZE):
+    '''
+        Aggregated contributions grouped by grant and contributor, streamed from a
+        server-side cursor so only chunk_size rows are held in memory at a time
+
+        args:
+            grants      :   Grants (to fetch contribs for)
+            clr_round   :   GrantCLR
+            network     :   mainnet | rinkeby
+            chunk_size  :   rows per chunk
+        yields:
+            lists of (grant_id, user_id, aggregated_amount, trust_score) rows
+    '''
+    # only consider contribs from current grant set
+    grant_ids = [grant.id for grant in grants]
+    if not grant_ids:
+        return
+
+    params = {
+        'multiplier': float(clr_round.contribution_multiplier),
+        'grant_ids': grant_ids,
+        'start_date': clr_round.start_date,
+        'end_date': clr_round.end_date,
+        'network': network,
+    }
+
+    # a named cursor keeps the result set on the db server until it is fetched
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(SUMMED_CONTRIBUTIONS_SQL, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
 def fetch_summed_contributions(grants, clr_round, network='mainnet'):
     '''
         Aggregated contributions grouped by grant and contributor
@@ -86,65 +165,30 @@ def fetch_summed_contributions(grants, clr_round, network='mainnet'):
             dictionary of profile_ids and trust scores
                 {user_id (str): trust_score (float)}
     '''
+    curr_agg = {}
+    trust_dict = {}
+    # populate shared state for the round one chunk at a time
+    for rows in stream_summed_contributions(grants, clr_round, network):
+        for grant_id, user_id, amount, trust_bonus in rows:
+            if not curr_agg.get(grant_id):
+                curr_agg[grant_id] = {}
+            trust_dict[user_id] = trust_bonus
+            curr_agg[grant_id][user_id] = amount
 
-    multiplier = clr_round.contribution_multiplier
-    clr_start_date = clr_round.start_date
-    clr_end_date = clr_round.end_date
+    return curr_agg, trust_dict
 
-    # only consider contribs from current grant set
-    grantIds = ''
-    for i in range(len(grants)):
-        grantIds += "'" + str(grants[i].id) + "'" + (', ' if i+1 != len(grants) else '')
 
-    # collect contributions with a groupBy sum query
-    summedContribs = f'''
-        -- group by ... sum the contributions $ value for each user
-        SELECT
-            grants.use_grant_id as grant_id,
-            grants_contribution.profile_for_clr_id as user_id,
-            SUM(grants_contribution.amount_per_period_usdt * {float(multiplier)}),
-            MAX(dashboard_profile.trust_bonus)::FLOAT as trust_bonus
-        FROM grants_contribution
-        INNER JOIN dashboard_profile ON (grants_contribution.profile_for_clr_id = dashboard_profile.id)
-        INNER JOIN grants_subscription ON (grants_contribution.subscription_id = grants_subscription.id)
-        RIGHT JOIN (
-            SELECT
-                grants_grant.id as grant_id,
-                (
-                    CASE
-                    WHEN grants_grant.defer_clr_to_id IS NOT NULL THEN grants_grant.defer_clr_to_id
-                    ELSE grants_grant.id
-                    END
-                ) as use_grant_id
-            FROM grants_grant
-        ) grants ON (grants_contribution.grant_id = grants.grant_id)
-        WHERE (
-            grants_contribution.grant_id IN ({grantIds}) AND
-            grants_contribution.created_on >= '{clr_start_date}' AND
-            grants_contribution.created_on <= '{clr_end_date}' AND
-            grants_contribution.match = True AND
-            grants_subscription.network = '{network}' AND
-            grants_contribution.success = True AND
-            grants_contribution.amount_per_period_usdt >= 0 AND
-            NOT (
-                grants_contribution.profile_for_clr_id IN (
-                    SELECT squelched.profile_id FROM townsquare_squelchprofile squelched WHERE squelched.active = True
-                ) AND grants_contribution.profile_for_clr_id IS NOT NULL
-            )
-        )
-        GROUP BY grants.use_grant_id, grants_contribution.profile_for_clr_id;
+def fetch_summed_contribution_matrix(grants, clr_round, network='mainnet', chunk_size=CHUNK_SIZE):
     '''
+        Aggregated contributions grouped by grant and contributor, packed into the sparse
+        engine's matrix one chunk at a time without building the nested dicts
 
-    # open cursor and execute the groupBy sum for the round
-    with connection.cursor() as cursor:
-        curr_agg = {}
-        trust_dict = {}
-        # execute to populate shared state for the round
-        cursor.execute(summedContribs)
-        for _row in cursor.fetchall():
-            if not curr_agg.get(_row[0]):
-                curr_agg[_row[0]] = {}
-            trust_dict[_row[1]] = _row[3]
-            curr_agg[_row[0]][_row[1]] = _row[2]
-
-    return curr_agg, trust_dict
+        args:
+            grants      :   Grants (to fetch contribs for)
+            clr_round   :   GrantCLR
+            network     :   mainnet | rinkeby
+            chunk_size  :   rows per chunk
+        returns:
+            ContributionMatrix
+    '''
+    return ContributionMatrix.from_chunks(stream_summed_contributions(grants, clr_round, network, chunk_size))
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""Define the sparse-matrix CLR engine.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import numpy as np
+from scipy import sparse
+
+
+class ContributionMatrix:
+    '''
+        contributor x grant matrix of aggregated contributions for a round
+
+        the pairwise CLR terms sqrt(a_i * a_j) are expressed as products of the
+        element-wise square root of this matrix, which lets scipy do the heavy
+        lifting instead of the nested dict loops in grants.clr
+    '''
+
+    def __init__(self, grant_ids, user_ids, amounts, trust):
+        '''
+            Args:
+                grant_ids   : list of grant ids (one per column)
+                user_ids    : list of user ids (one per row)
+                amounts     : scipy.sparse matrix (users x grants) of aggregated amounts
+                trust       : np.array of trust bonuses (one per row)
+        '''
+        self.grant_ids = list(grant_ids)
+        self.user_ids = list(user_ids)
+        self.amounts = sparse.csr_matrix(amounts, dtype=np.float64)
+        self.trust = np.asarray(trust, dtype=np.float64)
+        self.grant_index = {grant_id: i for i, grant_id in enumerate(self.grant_ids)}
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+
+    @classmethod
+    def from_agg(cls, curr_agg, trust_dict):
+        '''
+            builds the matrix from the nested dicts used by grants.clr
+
+            args:
+                curr_agg
+                    {grant_id (str): {user_id (str): aggregated_amount (float)}}
+                trust_dict
+                    {user_id (str): trust_score (float)}
+        '''
+        grant_ids = list(curr_agg.keys())
+        user_index = {}
+        rows, cols, data = [], [], []
+        for col, grant_id in enumerate(grant_ids):
+            for user_id, amount in curr_agg[grant_id].items():
+                row = user_index.setdefault(user_id, len(user_index))
+                rows.append(row)
+                cols.append(col)
+                data.append(float(amount))
+
+        user_ids = list(user_index.keys())
+        trust = [float(trust_dict[user_id]) for user_id in user_ids]
+        amounts = sparse.coo_matrix(
+            (np.array(data, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(len(user_ids), len(grant_ids))
+        )
+        # duplicate (user, grant) entries are summed by the conversion to csr
+        return cls(grant_ids, user_ids, amounts, trust)
+
+    @classmethod
+    def from_columns(cls, grant_ids, user_ids, amounts, trust=None):
+        '''
+            builds the matrix from parallel columns, one entry per contribution (repeat
+            contributions by the same contributor to the same grant are summed)
+
+            args:
+                grant_ids   : array-like of grant ids
+                user_ids    : array-like of contributor ids
+                amounts     : array-like of contribution amounts
+                trust       : array-like of the contributor's trust score, or None for a trust of 1
+        '''
+        grant_keys, cols = np.unique(np.asarray(grant_ids), return_inverse=True)
+        user_keys, rows = np.unique(np.asarray(user_ids), return_inverse=True)
+
+        user_trust = np.ones(len(user_keys))
+        if trust is not None:
+            user_trust[rows] = np.asarray(trust, dtype=np.float64)
+
+        amounts = sparse.coo_matrix(
+            (np.asarray(amounts, dtype=np.float64), (rows, cols)), shape=(len(user_keys), len(grant_keys))
+        )
+        return cls(grant_keys.tolist(), user_keys.tolist(), amounts, user_trust)
+
+    @classmethod
+    def from_rows(cls, rows, trust_dict=None):
+        '''
+            builds the matrix from contribution rows (the townsquare.clr input)
+
+            args:
+                rows
+                    [[grant_id, user_id, contribution_amount (float)]]
+                trust_dict
+                    {user_id: trust_score (float)}, or None for a trust of 1
+        '''
+        if not rows:
+            return cls([], [], sparse.csr_matrix((0, 0)), [])
+
+        grant_ids, user_ids, amounts = zip(*[row[:3] for row in rows])
+        trust = [float(trust_dict[user_id]) for user_id in user_ids] if trust_dict is not None else None
+        return cls.from_columns(grant_ids, user_ids, amounts, trust)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        '''
+            builds the matrix from chunks of aggregated rows, as streamed by
+            grants.clr_data_src.stream_summed_contributions - each chunk is packed into arrays as it
+            arrives, so the round is never held as python objects
+
+            args:
+                chunks
+                    iterable of [(grant_id, user_id, aggregated_amount (float), trust_score (float))]
+        '''
+        grant_ids, user_ids, amounts, trust = [], [], [], []
+        for rows in chunks:
+            chunk_grant_ids, chunk_user_ids, chunk_amounts, chunk_trust = zip(*rows)
+            grant_ids.append(np.asarray(chunk_grant_ids))
+            user_ids.append(np.asarray(chunk_user_ids))
+            amounts.append(np.asarray(chunk_amounts, dtype=np.float64))
+            trust.append(np.asarray(chunk_trust, dtype=np.float64))
+
+        if not grant_ids:
+            return cls([], [], sparse.csr_matrix((0, 0)), [])
+        return cls.from_columns(*[np.concatenate(column) for column in (grant_ids, user_ids, amounts, trust)])
+
+    def with_contribution(self, grant_id, user_id, amount, trust=1.0):
+        '''
+            copy of the matrix with one more contribution, adding the grant and contributor
+            when they are new
+        '''
+        grant_ids, user_ids = list(self.grant_ids), list(self.user_ids)
+        user_trust = self.trust
+        if grant_id not in self.grant_index:
+            grant_ids.append(grant_id)
+        if user_id not in self.user_index:
+            user_ids.append(user_id)
+            user_trust = np.append(user_trust, float(trust))
+
+        shape = (len(user_ids), len(grant_ids))
+        amounts = self.amounts.copy()
+        amounts.resize(shape)
+        row, col = self.user_index.get(user_id, shape[0] - 1), self.grant_index.get(grant_id, shape[1] - 1)
+        contribution = sparse.csr_matrix(([float(amount)], ([row], [col])), shape=shape)
+        return ContributionMatrix(grant_ids, user_ids, amounts + contribution, user_trust)
+
+    def contributor_vectors(self):
+        '''
+            returns:
+                {grant_id: (np.array of amounts, np.array of trust scores)} for every grant with
+                contributions, as grants.clr_prediction.get_contributor_vector builds them
+        '''
+        columns = self.amounts.tocsc()
+        vectors = {}
+        for i, grant_id in enumerate(self.grant_ids):
+            start, end = columns.indptr[i], columns.indptr[i + 1]
+            if end > start:
+                vectors[grant_id] = (columns.data[start:end].copy(), self.trust[columns.indices[start:end]])
+        return vectors
+
+    @property
+    def sqrt_amounts(self):
+        '''element-wise sqrt of the amounts, negative amounts contribute nothing'''
+        roots = self.amounts.copy()
+        roots.data = np.sqrt(np.clip(roots.data, 0, None))
+        return roots
+
+
+def get_sparse_totals_by_pair(roots):
+    '''
+        gets pair totals between every contributor pair in the round
+
+        args:
+            roots : scipy.sparse matrix (users x grants) of sqrt(aggregated_amount)
+
+        returns:
+            pair totals as a sparse (users x users) matrix, equivalent to
+            grants.clr.get_totals_by_pair
+    '''
+    return (roots @ roots.T).tocoo()
+
+
+def get_pair_discounts(pair_totals, trust, v_threshold):
+    '''
+        computes the pairwise discount 1 / (pair_total / (v_threshold * max(trust)) + 1)
+        for every non-zero pair
+
+        returns:
+            sparse (users x users) matrix of discounts
+    '''
+    pair_trust = np.maximum(trust[pair_totals.row], trust[pair_totals.col])
+    discounts = 1.0 / (pair_totals.data / (v_threshold * pair_trust) + 1)
+    return sparse.csr_matrix((discounts, (pair_totals.row, pair_totals.col)), shape=pair_totals.shape)
+
+
+def calculate_raw_matches(matrix, v_threshold):
+    '''
+        calculates the un-normalised clr amount for every grant in the matrix
+
+        for a grant g with root vector s this is sum_{i<j} s_i * s_j * D_ij, which
+        equals (s.T @ D @ s - sum_i s_i^2 * D_ii) / 2 as D is symmetric
+
+        returns:
+            np.array of clr amounts in matrix.grant_ids order
+    '''
+    roots = matrix.sqrt_amounts
+    discounts = get_pair_discounts(get_sparse_totals_by_pair(roots), matrix.trust, float(v_threshold))
+
+    quadratic = np.asarray(roots.multiply(discounts @ roots).sum(axis=0)).ravel()
+    diagonal = np.asarray(roots.multiply(roots).T @ discounts.diagonal()).ravel()
+
+    return (quadratic - diagonal) / 2
+
+
+def calculate_clr_sparse(curr_agg, trust_dict, v_threshold, total_pot):
+    '''
+        sparse-matrix drop in for grants.clr.get_totals_by_pair + grants.clr.calculate_clr
+
+        args:
+            curr_agg
+                {grant_id (str): {user_id (str): aggregated_amount (float)}}
+            trust_dict
+                {user_id (str): trust_score (float)}
+            v_threshold
+                float
+            total_pot
+                float
+        returns:
+            total clr award (bigtot) and totals by grant, in the same format as grants.clr.calculate_clr
+                {proj: {'id': proj, 'number_contributions': _num, 'contribution_amount': _sum, 'clr_amount': tot}}
+    '''
+    return calculate_clr_totals(ContributionMatrix.from_agg(curr_agg, trust_dict), v_threshold)
+
+
+def calculate_clr_totals(matrix, v_threshold):
+    '''
+        the shared pairwise kernel behind grant rounds, historical analytics and townsquare
+        match rounds - callers adapt their input with one of the ContributionMatrix builders
+
+        args:
+            matrix      : ContributionMatrix
+            v_threshold : float
+        returns:
+            total clr award (bigtot) and raw totals by grant, in the same format as grants.clr.calculate_clr
+                {proj: {'id': proj, 'number_contributions': _num, 'contribution_amount': _sum, 'clr_amount': tot}}
+    '''
+    if not matrix.grant_ids:
+        return 0, {}
+
+    clr_amounts = calculate_raw_matches(matrix, v_threshold)
+    nums = np.diff(matrix.amounts.tocsc().indptr)
+    sums = np.asarray(matrix.amounts.sum(axis=0)).ravel()
+
+    totals = {}
+    for i, proj in enumerate(matrix.grant_ids):
+        totals[proj] = {
+            'id': proj,
+            'number_contributions': int(nums[i]),
+            'contribution_amount': float(sums[i]),
+            'clr_amount': float(clr_amounts[i]),
+        }
+
+    return float(clr_amounts.sum()), totals
+
+
+def cap_matches(matches, match_cap_per_grant, should_spread):
+    '''
+        closed form of grants.clr.apply_cap
+
+        capping and spreading the remainder proportionally only ever caps the largest grants,
+        so the final distribution is: the top k grants at the cap and the rest scaled by
+        f_k = (total - k * cap) / (total - sum of the top k). The recursive version settles on
+        the smallest k >= k0 (grants capped outright) for which the (k + 1)th grant stays under
+        the cap once scaled by f_k, which can be read off the sorted matches in one pass
+
+        args:
+            matches             : np.array of normalised clr amounts
+            match_cap_per_grant : float
+            should_spread       : redistribute the capped remainder (only when the round is saturated)
+        returns:
+            np.array of capped clr amounts
+    '''
+    capped = np.minimum(matches, match_cap_per_grant)
+    n = len(matches)
+    if not should_spread or not n:
+        return capped
+
+    order = np.argsort(-matches, kind='stable')
+    ranked = matches[order]
+    total = ranked.sum()
+    k0 = int(np.count_nonzero(ranked >= match_cap_per_grant))
+    if k0 == 0 or k0 == n:
+        return capped
+
+    # rest[k] is the sum of the grants left uncapped when the top k are capped (summed from the
+    # tail, as total - cumsum cancels badly when one grant dwarfs the rest)
+    rest = np.cumsum(ranked[::-1])[::-1]
+    ks = np.arange(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = (total - ks * match_cap_per_grant) / rest
+        settled = (ranked * factors < match_cap_per_grant) | (rest <= 0)
+    settled[:k0] = False
+
+    candidates = np.flatnonzero(settled)
+    k = int(candidates[0]) if len(candidates) else n
+
+    result = np.empty(n)
+    result[order[:k]] = match_cap_per_grant
+    if k < n:
+        # once only zero matches are left uncapped there is nothing to spread the remainder over
+        result[order[k:]] = ranked[k:] * factors[k] if rest[k] > 0 else ranked[k:]
+    return result
+
+
+def normalise_matches(raw_matches, total_pot, match_cap_per_grant):
+    '''
+        array version of grants.clr.normalise
+
+        args:
+            raw_matches         : np.array of raw clr amounts
+            total_pot           : float
+            match_cap_per_grant : float
+        returns:
+            np.array of normalised and capped clr amounts
+    '''
+    bigtot = raw_matches.sum()
+    is_saturated = bigtot >= total_pot
+    if is_saturated:
+        matches = raw_matches / bigtot * total_pot
+    else:
+        matches = raw_matches * (1 + np.log(total_pot / (bigtot or 1)) / 100)
+
+    # apply the match cap post-normalisation
+    return cap_matches(matches, match_cap_per_grant, is_saturated)
@@ -23,6 +23,7 @@
 
 import numpy as np
 from grants.clr_data_src import fetch_contributions, fetch_grants
+from grants.clr_engine import ContributionMatrix, calculate_clr_totals
 
 CLR_PERCENTAGE_DISTRIBUTED = 0
 
@@ -88,41 +89,7 @@ def aggregate_contributions(grant_contributions):
     return contrib_dict
 
 
-def get_totals_by_pair(contrib_dict):
-    '''
-        gets pair totals between current round, current round
-
-        args:
-            aggregated contributions by pair nested dict
-                {
-                    grant_id (str): {
-                        user_id (str): aggregated_amount (float)
-                    }
-                }
-
-        returns:
-            pair totals between current round
-                {user_id (str): {user_id (str): pair_total (float)}}
-
-    '''
-    tot_overlap = {}
-
-    # start pairwise match
-    for _, contribz in contrib_dict.items():
-        for k1, v1 in contribz.items():
-            if k1 not in tot_overlap:
-                tot_overlap[k1] = {}
-
-            # pairwise matches to current round
-            for k2, v2 in contribz.items():
-                if k2 not in tot_overlap[k1]:
-                    tot_overlap[k1][k2] = 0
-                tot_overlap[k1][k2] += (v1 * v2) ** 0.5
-
-    return tot_overlap
-
-
-def calculate_clr(aggregated_contributions, pair_totals, trust_dict, v_threshold, uv_threshold, total_pot):
+def calculate_clr(aggregated_contributions, trust_dict, v_threshold, uv_threshold, total_pot):
     '''
         calculates the clr amount at the given threshold and total pot
         args:
@@ -132,8 +99,6 @@ def calculate_clr(aggregated_contributions, pair_totals, trust_dict, v_threshold
                         user_id (str): aggregated_amount (float)
                     }
                 }
-            pair_totals
-                {user_id (str): {user_id (str): pair_total (float)}}
             trust_dict
                 {user_id (str): trust_score (float)}
             v_threshold
@@ -150,30 +115,10 @@ def calculate_clr(aggregated_contributions, pair_totals, trust_dict, v_threshold
                 boolean
     '''
 
-    bigtot = 0
-    totals = []
-
-    for proj, contribz in aggregated_contributions.items():
-        tot = 0
-        _num = 0
-        _sum = 0
-
-        # start pairwise matches
-        for k1, v1 in contribz.items():
-            _num += 1
-            _sum += v1
-
-            # pairwise matches to current round
-            for k2, v2 in contribz.items():
-                if k2 > k1:
-                    tot += ((v1 * v2) ** 0.5) / (pair_totals[k1][k2] / (v_threshold * max(trust_dict[k2], trust_dict[k1])) + 1)
-
-        if type(tot) == complex:
-            tot = float(tot.real)
-
-        bigtot += tot
-        totals.append({'id': proj, 'number_contributions': _num, 'contribution_amount': _sum, 'clr_amount': tot})
-        # totals.append({'id': proj, 'clr_amount': tot})
+    # pair totals and pairwise matches come from the shared kernel (see grants.clr_engine)
+    matrix = ContributionMatrix.from_agg(aggregated_contributions, trust_dict)
+    bigtot, totals = calculate_clr_totals(matrix, v_threshold)
+    totals = list(totals.values())
 
     global CLR_PERCENTAGE_DISTRIBUTED
 
@@ -219,11 +164,8 @@ def run_clr_calcs(grant_contribs_curr, v_threshold, uv_threshold, total_pot):
     # aggregate data
     curr_agg = aggregate_contributions(curr_round)
 
-    # get pair totals
-    ptots = get_totals_by_pair(curr_agg)
-
     # clr calcluation
-    totals = calculate_clr(curr_agg, ptots, trust_dict, v_threshold, uv_threshold, total_pot)
+    totals = calculate_clr(curr_agg, trust_dict, v_threshold, uv_threshold, total_pot)
 
     return totals
 
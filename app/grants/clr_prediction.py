@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Define the what-if CLR match predictor.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import pickle
+
+import numpy as np
+from app.services import RedisService
+from grants.clr_engine import normalise_matches
+
+PREDICTION_TTL = 60 * 60 * 6
+
+
+def get_contributor_vector(contribz, trust_dict):
+    '''
+        unpacks a grant's contributions into amount and trust arrays
+
+        args:
+            contribz    : {user_id (str): aggregated_amount (float)}
+            trust_dict  : {user_id (str): trust_score (float)}
+        returns:
+            (np.array of amounts, np.array of trust scores)
+    '''
+    amounts = np.array([float(amount) for amount in contribz.values()], dtype=np.float64)
+    trust = np.array([float(trust_dict[user_id]) for user_id in contribz.keys()], dtype=np.float64)
+    return amounts, trust
+
+
+def get_contributor_vectors(curr_agg, trust_dict):
+    '''
+        returns:
+            {grant_id: (np.array of amounts, np.array of trust scores)} for every grant in curr_agg
+    '''
+    return {grant_id: get_contributor_vector(contribz, trust_dict) for grant_id, contribz in curr_agg.items()}
+
+
+def get_marginal_clr(amounts, trust, v_threshold, amount):
+    '''
+        raw clr added to a grant by one more contribution of amount
+
+        the new contributor only pairs with the grant's existing contributors, so the pair
+        total of each new pair is just sqrt(amount * a_i) (see calculate_clr_for_prediction)
+    '''
+    pt = np.sqrt(float(amount) * np.clip(amounts, 0, None))
+    return float(np.sum(pt / (pt / (float(v_threshold) * np.maximum(trust, 1)) + 1)))
+
+
+class MatchPredictor:
+    '''
+        predicts the match a grant would receive with one additional contribution
+
+        keeps only the raw (pre-normalisation) match of every grant in the round, so a what-if
+        costs one pass over the grant's contributors and one array normalisation rather than a
+        copy of the whole round's totals
+    '''
+
+    def __init__(self, clr_round_pk, grant_ids, raw_matches, v_threshold, total_pot, match_cap_per_grant):
+        self.clr_round_pk = clr_round_pk
+        self.grant_ids = list(grant_ids)
+        self.raw_matches = np.asarray(raw_matches, dtype=np.float64)
+        self.v_threshold = float(v_threshold)
+        self.total_pot = float(total_pot)
+        self.match_cap_per_grant = float(match_cap_per_grant)
+        self.grant_index = {grant_id: i for i, grant_id in enumerate(self.grant_ids)}
+
+    @classmethod
+    def from_totals(cls, clr_round_pk, totals, v_threshold, total_pot, match_cap_per_grant):
+        '''
+            args:
+                totals : raw totals by grant, as returned by calculate_clr
+        '''
+        grant_ids = list(totals.keys())
+        raw_matches = [totals[grant_id]['clr_amount'] for grant_id in grant_ids]
+        return cls(clr_round_pk, grant_ids, raw_matches, v_threshold, total_pot, match_cap_per_grant)
+
+    def predict(self, grant_id, amounts, trust, amount):
+        '''
+            args:
+                grant_id    : clr grant id
+                amounts     : np.array of the grant's aggregated contribution amounts
+                trust       : np.array of the matching contributor trust scores
+                amount      : hypothetical contribution amount
+            returns:
+                normalised clr amount the grant would receive (float)
+        '''
+        i = self.grant_index.get(grant_id)
+        if i is None or not len(amounts):
+            return 0.0
+
+        raw_matches = self.raw_matches.copy()
+        if amount:
+            raw_matches[i] += get_marginal_clr(amounts, trust, self.v_threshold, amount)
+
+        return float(normalise_matches(raw_matches, self.total_pot, self.match_cap_per_grant)[i])
+
+    @staticmethod
+    def redis_keys(clr_round_pk):
+        return f'grants:clr_predictor:{clr_round_pk}', f'grants:clr_predictor:{clr_round_pk}:contributors'
+
+    def save(self, vectors):
+        '''
+            stores the predictor and every grant's contributor vector so that single grant
+            queries can be answered without touching the rest of the round
+
+            args:
+                vectors : {grant_id: (amounts, trust)}, from get_contributor_vectors or
+                          ContributionMatrix.contributor_vectors
+        '''
+        predictor_key, contributors_key = self.redis_keys(self.clr_round_pk)
+        vectors = {str(grant_id): pickle.dumps(vector) for grant_id, vector in vectors.items()}
+
+        pipe = RedisService().redis.pipeline()
+        pipe.set(predictor_key, pickle.dumps(self), PREDICTION_TTL)
+        pipe.delete(contributors_key)
+        if vectors:
+            pipe.hmset(contributors_key, vectors)
+            pipe.expire(contributors_key, PREDICTION_TTL)
+        pipe.execute()
+
+    @classmethod
+    def load(cls, clr_round_pk):
+        predictor_key, _ = cls.redis_keys(clr_round_pk)
+        data = RedisService().redis.get(predictor_key)
+        if not data:
+            return None
+        return pickle.loads(data)
+
+    def load_contributor_vector(self, grant_id):
+        _, contributors_key = self.redis_keys(self.clr_round_pk)
+        data = RedisService().redis.hget(contributors_key, str(grant_id))
+        if not data:
+            return np.array([]), np.array([])
+        return pickle.loads(data)
+
+    def predict_for_grant(self, grant_id, amounts):
+        '''
+            single grant query used by the cart, loading the grant's contributor vector once
+
+            args:
+                grant_id    : clr grant id
+                amounts     : hypothetical contribution amounts
+            returns:
+                [normalised clr amount the grant would receive with each amount]
+        '''
+        contributions, trust = self.load_contributor_vector(grant_id)
+        return [self.predict(grant_id, contributions, trust, amount) for amount in amounts]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Define the parallel CLR estimation scheduler.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import multiprocessing
+
+from django.db import connections
+
+import numpy as np
+from celery import group
+
+# five potential additional donations plus the base case of 0
+POTENTIAL_DONATIONS = [0, 1, 10, 100, 1000, 10000]
+
+# read-only round snapshot shared with forked workers (set before the pool is created)
+_snapshot = None
+
+
+def predict_grant_curve(predictor, grant_id, amounts, trust, what='full'):
+    '''
+        predicted clr for each of the POTENTIAL_DONATIONS
+
+        args:
+            predictor   : grants.clr_prediction.MatchPredictor
+            grant_id    : clr grant id
+            amounts     : np.array of the grant's aggregated contribution amounts
+            trust       : np.array of the matching contributor trust scores
+            what        : full | final (final only records the current distribution)
+        returns:
+            list of predicted clr amounts, one per potential donation
+    '''
+    # if no contributions have been made for this grant then the pairwise will fail and there will be no matching for this grant
+    if not len(amounts) or grant_id not in predictor.grant_index:
+        return [0.0 for x in range(0, len(POTENTIAL_DONATIONS))]
+
+    raw_clr_amount = predictor.raw_matches[predictor.grant_index[grant_id]]
+    potential_clr = []
+    for amount in POTENTIAL_DONATIONS:
+        # final will save the current distribution for every grant (ie without predictions)
+        if amount and (what == 'final' or raw_clr_amount == predictor.match_cap_per_grant):
+            potential_clr.append(0.0)
+        else:
+            potential_clr.append(predictor.predict(grant_id, amounts, trust, amount))
+
+    return potential_clr
+
+
+def partition_grant_ids(grant_ids, partitions):
+    '''splits the grant ids into contiguous, sorted partitions'''
+    grant_ids = sorted(grant_ids)
+    partitions = max(1, min(partitions, len(grant_ids)))
+    return [chunk.tolist() for chunk in np.array_split(grant_ids, partitions)] if grant_ids else []
+
+
+def _predict_partition(grant_ids):
+    predictor, vectors, what = _snapshot
+    empty = (np.array([]), np.array([]))
+    return {
+        grant_id: predict_grant_curve(predictor, grant_id, *vectors.get(grant_id, empty), what=what)
+        for grant_id in grant_ids
+    }
+
+
+def predict_curves(predictor, vectors, grant_ids, what='full', processes=1):
+    '''
+        predicts the curve of every grant, optionally over a pool of forked processes
+
+        the predictor and contributor vectors are inherited by the workers when they fork
+        rather than pickled per task, and partitions are merged in grant id order so the
+        result doesn't depend on which worker finished first
+
+        args:
+            predictor   : grants.clr_prediction.MatchPredictor
+            vectors     : {grant_id: (amounts, trust)}
+            grant_ids   : grants to predict
+            what        : full | final
+            processes   : size of the process pool (1 = run inline)
+        returns:
+            {grant_id: [predicted clr per potential donation]}
+    '''
+    global _snapshot
+    _snapshot = (predictor, vectors, what)
+    partitions = partition_grant_ids(grant_ids, processes * 4)
+
+    try:
+        # celery's prefork workers are daemonic and can't have children, so run inline there
+        if processes > 1 and len(partitions) > 1 and not multiprocessing.current_process().daemon:
+            # forked children must not reuse the parent's db connections
+            connections.close_all()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(_predict_partition, partitions)
+        else:
+            results = [_predict_partition(partition) for partition in partitions]
+    finally:
+        _snapshot = None
+
+    curves = {}
+    for result in results:
+        curves.update(result)
+    return {grant_id: curves[grant_id] for grant_id in sorted(curves)}
+
+
+def schedule_predict_clr(clr_rounds, network='mainnet', what='full', use_sql=False, engine='sparse', save_to_db=True, use_snapshot=False):
+    '''
+        fans every round out to its own celery worker, rather than walking them one after
+        another, so overlapping rounds are estimated concurrently
+
+        each round's grants are predicted inline in its worker - prefork workers can't fork a
+        process pool of their own (see predict_curves)
+
+        args:
+            clr_rounds  : GrantCLR queryset / list
+        returns:
+            celery GroupResult
+    '''
+    from grants.tasks import process_predict_clr
+
+    jobs = group(
+        process_predict_clr.si(
+            save_to_db, None, clr_round.pk, network, what, use_sql=use_sql, engine=engine, use_snapshot=use_snapshot
+        ) for clr_round in clr_rounds
+    )
+    return jobs.apply_async()
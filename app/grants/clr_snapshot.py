@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Define the memory-mapped CLR round snapshots.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import numpy as np
+from grants.clr_engine import ContributionMatrix
+
+MAX_SNAPSHOT_AGE = timezone.timedelta(hours=1)
+COLUMNS = (
+    ('grant_ids', np.int64),
+    ('user_ids', np.int64),
+    ('amounts', np.float64),
+    ('trust', np.float64),
+)
+
+
+class RoundSnapshot:
+    '''
+        columnar snapshot of a round's aggregated contributions
+
+        one row per (clr grant, contributor) pair, each column stored as its own .npy file
+        so that workers can memory-map the round rather than re-running the summed
+        contributions query and rebuilding the dicts from scratch
+    '''
+
+    def __init__(self, clr_round_pk, network, grant_ids, user_ids, amounts, trust, created_on=None):
+        '''
+            Args:
+                clr_round_pk    : GrantCLR pk
+                network         : mainnet | rinkeby
+                grant_ids       : np.array of clr grant ids (one per row)
+                user_ids        : np.array of contributor profile ids (one per row)
+                amounts         : np.array of aggregated amounts (one per row)
+                trust           : np.array of the contributor's trust score (one per row)
+                created_on      : when the data was read from the db
+        '''
+        self.clr_round_pk = clr_round_pk
+        self.network = network
+        self.grant_ids = grant_ids
+        self.user_ids = user_ids
+        self.amounts = amounts
+        self.trust = trust
+        self.created_on = created_on or timezone.now()
+
+    def __len__(self):
+        return len(self.grant_ids)
+
+    @classmethod
+    def from_agg(cls, clr_round_pk, network, curr_agg, trust_dict):
+        '''
+            args:
+                curr_agg
+                    {grant_id (int): {user_id (int): aggregated_amount (float)}}
+                trust_dict
+                    {user_id (int): trust_score (float)}
+        '''
+        rows = [
+            (grant_id, user_id, float(amount), float(trust_dict[user_id]))
+            for grant_id, contribz in curr_agg.items() for user_id, amount in contribz.items()
+        ]
+        columns = list(zip(*rows)) if rows else [[], [], [], []]
+        return cls(clr_round_pk, network, *[
+            np.array(column, dtype=dtype) for column, (_, dtype) in zip(columns, COLUMNS)
+        ])
+
+    @classmethod
+    def from_matrix(cls, clr_round_pk, network, matrix):
+        '''
+            args:
+                matrix : ContributionMatrix
+        '''
+        entries = matrix.amounts.tocoo()
+        return cls(
+            clr_round_pk, network,
+            np.asarray(matrix.grant_ids, dtype=np.int64)[entries.col],
+            np.asarray(matrix.user_ids, dtype=np.int64)[entries.row],
+            entries.data.astype(np.float64),
+            matrix.trust[entries.row],
+        )
+
+    @staticmethod
+    def path(clr_round_pk, network):
+        return os.path.join(settings.CLR_SNAPSHOT_DIR, f'{clr_round_pk}-{network}')
+
+    def save(self):
+        '''
+            writes the snapshot next to its final location and swaps it in, so readers
+            only ever see a complete snapshot (or none at all)
+        '''
+        path = self.path(self.clr_round_pk, self.network)
+        os.makedirs(settings.CLR_SNAPSHOT_DIR, exist_ok=True)
+
+        tmp_path = tempfile.mkdtemp(dir=settings.CLR_SNAPSHOT_DIR)
+        for name, _ in COLUMNS:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'clr_round_pk': self.clr_round_pk, 'created_on': self.created_on.isoformat()}, f)
+
+        # directories can't be replaced in one step, move the old one out of the way first
+        old_path = f'{path}.{uuid.uuid4().hex}.old'
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, clr_round_pk, network, max_age=MAX_SNAPSHOT_AGE):
+        '''
+            memory-maps the round's snapshot
+
+            returns:
+                RoundSnapshot, or None when there is no snapshot or it is older than max_age
+        '''
+        path = cls.path(clr_round_pk, network)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            created_on = parse_datetime(meta['created_on'])
+            if not created_on or (max_age is not None and created_on < timezone.now() - max_age):
+                return None
+
+            columns = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name, _ in COLUMNS]
+        except (OSError, ValueError, KeyError):
+            # missing, mid-swap or unreadable - the caller falls back to the db
+            return None
+
+        return cls(clr_round_pk, network, *columns, created_on=created_on)
+
+    def to_agg(self):
+        '''
+            returns:
+                the curr_agg and trust_dict returned by grants.clr_data_src.fetch_summed_contributions
+        '''
+        curr_agg = {}
+        trust_dict = {}
+        for grant_id, user_id, amount, trust in zip(
+            self.grant_ids.tolist(), self.user_ids.tolist(), self.amounts.tolist(), self.trust.tolist()
+        ):
+            curr_agg.setdefault(grant_id, {})[user_id] = amount
+            trust_dict[user_id] = trust
+
+        return curr_agg, trust_dict
+
+    def to_matrix(self):
+        '''
+            returns:
+                the ContributionMatrix for the round, built straight from the columns
+        '''
+        return ContributionMatrix.from_columns(self.grant_ids, self.user_ids, self.amounts, self.trust)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Define the persistent CLR round state used for incremental match updates.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import pickle
+
+from django.utils import timezone
+
+from app.services import RedisService
+
+# a full rebuild picks up squelches, trust bonus changes and match toggles that deltas can't see
+MAX_STATE_AGE = timezone.timedelta(hours=1)
+STATE_TTL = 60 * 60 * 6
+
+
+def _root(amount):
+    return max(float(amount), 0) ** 0.5
+
+
+class CLRRoundState:
+    '''
+        pair totals and per-grant raw matches for a round, kept between runs so that new
+        contributions can be applied as deltas instead of rebuilding everything
+    '''
+
+    def __init__(self, clr_round_pk, v_threshold, grant_map, curr_agg, trust_dict, pair_totals, totals, contribution_ids):
+        '''
+            Args:
+                clr_round_pk        : GrantCLR pk
+                v_threshold         : float
+                grant_map           : {grant_id (int): clr grant_id (int)} (resolves defer_clr_to)
+                curr_agg            : {grant_id: {user_id (str): aggregated_amount (float)}}
+                trust_dict          : {user_id (str): trust_score (float)}
+                pair_totals         : {user_id (str): {user_id (str): pair_total (float)}}
+                totals              : {grant_id: {'id', 'number_contributions', 'contribution_amount', 'clr_amount'}}
+                contribution_ids    : pks of the contributions already accounted for
+        '''
+        self.clr_round_pk = clr_round_pk
+        self.v_threshold = float(v_threshold)
+        self.grant_map = grant_map
+        self.curr_agg = curr_agg
+        self.trust_dict = trust_dict
+        self.pair_totals = pair_totals
+        self.totals = totals
+        self.contribution_ids = set(contribution_ids)
+        self.built_on = timezone.now()
+        self.synced_on = self.built_on
+
+        self.user_grants = {}
+        for proj, contribz in curr_agg.items():
+            for user_id in contribz:
+                self.user_grants.setdefault(user_id, set()).add(proj)
+
+    @staticmethod
+    def redis_key(clr_round_pk):
+        return f'grants:clr_state:{clr_round_pk}'
+
+    @classmethod
+    def load(cls, clr_round_pk):
+        data = RedisService().redis.get(cls.redis_key(clr_round_pk))
+        if not data:
+            return None
+        return pickle.loads(data)
+
+    def save(self):
+        RedisService().redis.set(self.redis_key(self.clr_round_pk), pickle.dumps(self), STATE_TTL)
+
+    @property
+    def is_stale(self):
+        return self.built_on < timezone.now() - MAX_STATE_AGE
+
+    @property
+    def bigtot(self):
+        return sum(t['clr_amount'] for t in self.totals.values())
+
+    def _user_terms(self, proj, user_id):
+        '''sum of the calculate_clr pairwise terms between user_id and the other contributors of proj'''
+        contribz = self.curr_agg.get(proj, {})
+        if user_id not in contribz:
+            return 0
+
+        tot = 0
+        v1 = contribz[user_id]
+        for k2, v2 in contribz.items():
+            if k2 == user_id:
+                continue
+            trust = float(max(self.trust_dict[k2], self.trust_dict[user_id]))
+            tot += (_root(v1) * _root(v2)) / (self.pair_totals[user_id][k2] / (self.v_threshold * trust) + 1)
+
+        return tot
+
+    def apply_contribution(self, grant_id, user_id, amount, trust_bonus):
+        '''
+            applies a single new contribution as a delta
+
+            only the grants user_id contributes to are touched: every pairwise term involving
+            user_id is backed out, the pair totals for the grant receiving the contribution are
+            updated, and the terms are added back with the new pair totals
+
+            args:
+                grant_id    : clr grant id (after defer_clr_to)
+                user_id     : str profile id
+                amount      : contribution amount (after the round's contribution multiplier)
+                trust_bonus : float
+        '''
+        amount = float(amount)
+        self.trust_dict.setdefault(user_id, trust_bonus)
+        self.pair_totals.setdefault(user_id, {})
+        contribz = self.curr_agg.setdefault(grant_id, {})
+        total = self.totals.setdefault(
+            grant_id, {'id': grant_id, 'number_contributions': 0, 'contribution_amount': 0, 'clr_amount': 0}
+        )
+        affected = self.user_grants.setdefault(user_id, set())
+        affected.add(grant_id)
+
+        for proj in affected:
+            self.totals[proj]['clr_amount'] -= self._user_terms(proj, user_id)
+
+        old = float(contribz.get(user_id, 0))
+        new = old + amount
+        delta_root = _root(new) - _root(old)
+        for k2, v2 in contribz.items():
+            if k2 == user_id:
+                continue
+            delta = delta_root * _root(v2)
+            self.pair_totals[user_id][k2] = self.pair_totals[user_id].get(k2, 0) + delta
+            self.pair_totals[k2][user_id] = self.pair_totals[k2].get(user_id, 0) + delta
+        self.pair_totals[user_id][user_id] = self.pair_totals[user_id].get(user_id, 0) + abs(new) - abs(old)
+
+        if user_id not in contribz:
+            total['number_contributions'] += 1
+        total['contribution_amount'] = float(total['contribution_amount']) + amount
+        contribz[user_id] = new
+
+        for proj in affected:
+            self.totals[proj]['clr_amount'] += self._user_terms(proj, user_id)
+
+    def apply_contributions(self, contributions, multiplier):
+        '''
+            applies every contribution which hasn't been accounted for yet
+
+            args:
+                contributions   : Contribution queryset (already filtered to the round)
+                multiplier      : the round's contribution_multiplier
+            returns:
+                number of contributions applied
+        '''
+        applied = 0
+        synced_on = timezone.now()
+        for contribution in contributions.filter(modified_on__gte=self.synced_on - timezone.timedelta(minutes=5)):
+            if contribution.pk in self.contribution_ids:
+                continue
+            self.contribution_ids.add(contribution.pk)
+
+            grant_id = self.grant_map.get(contribution.grant_id)
+            prof = contribution.profile_for_clr
+            if not grant_id or not prof:
+                continue
+
+            self.apply_contribution(
+                grant_id, str(prof.id), contribution.amount_per_period_usdt * multiplier, prof.trust_bonus
+            )
+            applied += 1
+
+        self.synced_on = synced_on
+        return applied
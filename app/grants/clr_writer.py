@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Define the batched writer for CLR prediction curves.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from cacheops import invalidate_model
+from grants.listing_cache import bump_grant_versions
+from grants.models import Grant, GrantCLRCalculation
+from grants.utils import sum_clr_prediction_curves
+
+BATCH_SIZE = 500
+
+
+class CLRPredictionCurveWriter:
+    '''
+        stages the prediction curves of a whole round and writes them in one transaction
+
+        replaces a record_clr_prediction_curve + grant.save() per grant (one update, one
+        create and one save, each with its own signals and cacheops invalidation) with
+        one update, one bulk_create and one bulk_update for the round
+    '''
+
+    def __init__(self, clr_round, update_grants=True):
+        '''
+            Args:
+                clr_round       : GrantCLR
+                update_grants   : also refresh the denormalised clr fields on each Grant
+        '''
+        self.clr_round = clr_round
+        self.update_grants = update_grants
+        self.grants = {}
+        self.curves = {}
+
+    def __len__(self):
+        return len(self.curves)
+
+    def stage(self, grant, clr_prediction_curve):
+        self.grants[grant.pk] = grant
+        self.curves[grant.pk] = clr_prediction_curve
+
+    def commit(self):
+        if not self.curves:
+            return
+
+        grant_ids = list(self.curves.keys())
+        now = timezone.now()
+        with transaction.atomic():
+            self.clr_round.clr_calculations.filter(grant_id__in=grant_ids, latest=True).update(active=False, latest=False)
+            GrantCLRCalculation.objects.bulk_create([
+                GrantCLRCalculation(
+                    grantclr=self.clr_round,
+                    grant_id=grant_id,
+                    clr_prediction_curve=clr_prediction_curve,
+                    active=True if self.clr_round.is_active else False,
+                    latest=True,
+                ) for grant_id, clr_prediction_curve in self.curves.items()
+            ], batch_size=BATCH_SIZE)
+
+            if self.update_grants:
+                # a grant's curve is the sum of its latest curves across every round it is in
+                curves_by_grant = {}
+                calcs = GrantCLRCalculation.objects.filter(
+                    grant_id__in=grant_ids, latest=True, active=True
+                ).order_by('-created_on').values_list('grant_id', 'clr_prediction_curve')
+                for grant_id, clr_prediction_curve in calcs:
+                    curves_by_grant.setdefault(grant_id, []).append(clr_prediction_curve)
+
+                grants = []
+                for grant_id, grant in self.grants.items():
+                    grant.clr_prediction_curve = sum_clr_prediction_curves(curves_by_grant.get(grant_id, []))
+                    grant.last_clr_calc_date = now
+                    grant.next_clr_calc_date = now + timezone.timedelta(minutes=60)
+                    grants.append(grant)
+
+                Grant.objects.bulk_update(
+                    grants, ['clr_prediction_curve', 'last_clr_calc_date', 'next_clr_calc_date'], batch_size=BATCH_SIZE
+                )
+
+        # bulk writes skip cacheops and Grant.save, so invalidate once for the whole round
+        invalidate_model(GrantCLRCalculation)
+        if self.update_grants:
+            invalidate_model(Grant)
+            bump_grant_versions(grant_ids)
+
+        self.grants = {}
+        self.curves = {}
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Define the maintained facet counts behind the grants explorer sidebar.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import logging
+
+from django.db.models import Count
+
+from app.services import RedisService
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+FACETS_KEY = 'grants:facets'
+NETWORKS = ('mainnet', 'rinkeby')
+# grant columns the facets are derived from, Grant.save only touches the counts when one of them changes
+FACET_FIELDS = ('network', 'active', 'hidden', 'grant_type_id')
+
+
+def facet_values(grant):
+    '''
+        returns:
+            the FACET_FIELDS values of a grant, or None when the instance was loaded without
+            one of the fields (eg .only()) and its facets aren't known
+    '''
+    if any(attname not in grant.__dict__ for attname in FACET_FIELDS):
+        return None
+    return tuple(grant.__dict__[attname] for attname in FACET_FIELDS)
+
+
+def facets_for(values):
+    '''
+        the facets a grant with these facet_values is counted under - only active, visible grants count
+
+        returns:
+            set of '{network}:grant_type:{pk}' keys, or None when the values aren't known
+    '''
+    if values is None:
+        return None
+
+    network, active, hidden, grant_type_id = values
+    if not active or hidden or not grant_type_id:
+        return set()
+    return {f'{network}:grant_type:{grant_type_id}'}
+
+
+def grant_facets(grant):
+    return facets_for(facet_values(grant))
+
+
+def update_facet_counts(old_facets, new_facets):
+    '''
+        moves a saved grant between facets
+
+        nothing is written until refresh_facet_counts has built the counts, and when the
+        previous facets are unknown (None) the next refresh picks the change up instead
+    '''
+    if old_facets is None or new_facets is None or old_facets == new_facets:
+        return
+
+    try:
+        redis = RedisService().redis
+        if not redis.exists(FACETS_KEY):
+            return
+
+        pipe = redis.pipeline()
+        for facet in old_facets - new_facets:
+            pipe.hincrby(FACETS_KEY, facet, -1)
+        for facet in new_facets - old_facets:
+            pipe.hincrby(FACETS_KEY, facet, 1)
+        pipe.execute()
+    except RedisError as e:
+        # a grant save must not fail on the counts, the next refresh repairs them
+        logger.warning(f'could not update grant facet counts: {e}')
+
+
+def count_facets(network):
+    '''
+        counts the grants of every grant type on the network with one grouped query
+
+        returns:
+            {'{network}:grant_type:{pk}': count}
+    '''
+    from grants.models import Grant
+
+    grants = Grant.objects.filter(network=network, hidden=False, active=True).order_by()
+    return {
+        f'{network}:grant_type:{grant_type_id}': count
+        for grant_type_id, count in grants.values_list('grant_type').annotate(count=Count('pk'))
+        if grant_type_id
+    }
+
+
+def refresh_facet_counts(networks=NETWORKS):
+    '''rebuilds the counts from the db, swapping them in as a single transaction'''
+    counts = {}
+    for network in networks:
+        counts.update(count_facets(network))
+
+    try:
+        pipe = RedisService().redis.pipeline()
+        pipe.delete(FACETS_KEY)
+        if counts:
+            pipe.hmset(FACETS_KEY, counts)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f'could not store grant facet counts: {e}')
+    return counts
+
+
+def get_facet_counts(network):
+    '''
+        counts from the facet store, or counted in the db for this request when redis can't be
+        read or the counts haven't been built yet (the next refresh_facet_counts builds them)
+
+        returns:
+            {'grant_type:{pk}': count} for the network, eg {'grant_type:1': 120}
+    '''
+    try:
+        counts = RedisService().redis.hgetall(FACETS_KEY)
+    except RedisError as e:
+        logger.warning(f'could not read grant facet counts: {e}')
+        counts = None
+    if not counts:
+        counts = count_facets(network)
+
+    prefix = f'{network}:'
+    facets = {}
+    for facet, count in counts.items():
+        facet = facet.decode() if isinstance(facet, bytes) else facet
+        if facet.startswith(prefix):
+            facets[facet[len(prefix):]] = max(int(count), 0)
+    return facets
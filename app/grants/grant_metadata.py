@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Define the batched recompute of the denormalised Grant stats and metadata.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import json
+import logging
+import math
+import time
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.text import slugify
+
+from cacheops import invalidate_model
+from grants.listing_cache import bump_grant_versions
+from grants.models import Contribution, Grant, GrantCLR, GrantCLRCalculation, PhantomFunding, Subscription
+from grants.utils import get_clr_rounds_metadata, sum_clr_prediction_curves
+from search.models import SearchResult
+from unidecode import unidecode
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MAX_SYBIL_SCORE = 5
+# subscriptions this recent without a usd value get converted again
+CONVERT_USDT_WITHIN = timezone.timedelta(days=10)
+# comments left by the ingestion scripts aren't shown on the wall of love
+INGEST_COMMENT = 'created by ingest'
+
+UPDATE_FIELDS = [
+    'contribution_count', 'contributor_count', 'positive_round_contributor_count',
+    'negative_round_contributor_count', 'slug', 'twitter_handle_1', 'twitter_handle_2', 'amount_received',
+    'amount_received_in_round', 'monthly_amount_subscribed', 'amount_received_with_phantom_funds', 'sybil_score',
+    'weighted_risk_score', 'is_clr_active', 'clr_round_num', 'clr_prediction_curve', 'modified_on',
+]
+
+MERGE_METADATA_SQL = '''
+    UPDATE grants_grant
+    SET metadata = COALESCE(grants_grant.metadata, '{}'::jsonb) || patch.metadata
+    FROM unnest(%(grant_ids)s::int[], %(patches)s::jsonb[]) AS patch(grant_id, metadata)
+    WHERE grants_grant.id = patch.grant_id
+'''
+
+
+def merge_grant_metadata(patches):
+    '''
+        merges {grant_id: {key: value}} into each grant's metadata in one statement, leaving
+        the other metadata keys untouched
+    '''
+    if not patches:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(MERGE_METADATA_SQL, {
+            'grant_ids': list(patches.keys()),
+            'patches': [json.dumps(patch) for patch in patches.values()],
+        })
+
+
+def sync_active_clrs(grants):
+    '''
+        Grant.calc_clr_round for many grants: one query per active round for its members and
+        a bulk diff of the in_active_clrs rows
+
+        returns:
+            {grant_id: [GrantCLR]} of the rounds each grant is now in, ordered by pk
+    '''
+    now = timezone.now()
+    clr_rounds = list(GrantCLR.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now).order_by('pk'))
+    pks = [grant.pk for grant in grants]
+
+    members = {
+        clr_round.pk: set(clr_round.grants.filter(pk__in=pks).values_list('pk', flat=True))
+        for clr_round in clr_rounds
+    }
+    wanted = {
+        (grant.pk, clr_round.pk) for grant in grants if grant.active and not grant.hidden
+        for clr_round in clr_rounds if grant.pk in members[clr_round.pk]
+    }
+
+    through = Grant.in_active_clrs.through
+    current = set(through.objects.filter(grant_id__in=pks).values_list('grant_id', 'grantclr_id'))
+    stale = current - wanted
+    for clr_round_pk in {clr_round_pk for _, clr_round_pk in stale}:
+        grant_ids = [grant_id for grant_id, _clr_round_pk in stale if _clr_round_pk == clr_round_pk]
+        through.objects.filter(grantclr_id=clr_round_pk, grant_id__in=grant_ids).delete()
+    through.objects.bulk_create([
+        through(grant_id=grant_id, grantclr_id=clr_round_pk) for grant_id, clr_round_pk in wanted - current
+    ], batch_size=BATCH_SIZE)
+
+    clr_rounds_by_pk = {clr_round.pk: clr_round for clr_round in clr_rounds}
+    active_clrs = {}
+    for grant_id, clr_round_pk in sorted(wanted):
+        active_clrs.setdefault(grant_id, []).append(clr_rounds_by_pk[clr_round_pk])
+    return active_clrs
+
+
+def sync_search_results(grants):
+    '''SearchResult.update_or_create for many grants with one read and two bulk writes'''
+    source_type = ContentType.objects.get_for_model(Grant)
+    existing = {
+        result.source_id: result
+        for result in SearchResult.objects.filter(source_type=source_type, source_id__in=[grant.pk for grant in grants])
+    }
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for grant in grants:
+        values = {
+            'created_on': grant.created_on,
+            'title': grant.title,
+            'description': grant.description,
+            'url': grant.url,
+            'visible_to': None,
+            'img_url': grant.logo.url if grant.logo else None,
+        }
+        result = existing.get(grant.pk)
+        if result:
+            for field, value in values.items():
+                setattr(result, field, value)
+            result.modified_on = now
+            to_update.append(result)
+        else:
+            to_create.append(SearchResult(source_type=source_type, source_id=grant.pk, **values))
+
+    SearchResult.objects.bulk_update(
+        to_update, ['created_on', 'title', 'description', 'url', 'visible_to', 'img_url', 'modified_on'],
+        batch_size=BATCH_SIZE
+    )
+    SearchResult.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+
+def convert_recent_subscriptions(grant_ids, network):
+    '''fills in amount_per_period_usdt on recent subscriptions that are still missing it'''
+    subscriptions = Subscription.objects.filter(
+        grant_id__in=grant_ids, network=network, created_on__gt=timezone.now() - CONVERT_USDT_WITHIN,
+    ).filter(Q(amount_per_period_usdt__isnull=True) | Q(amount_per_period_usdt=0))
+
+    for subscription in subscriptions:
+        value_usdt = subscription.get_converted_amount(True)
+        if value_usdt:
+            subscription.amount_per_period_usdt = value_usdt
+            subscription.save()
+
+
+def aggregate_grant_stats(grant_ids, round_starts, network):
+    '''
+        the contribution counts, contributor counts, amounts and sybil totals of every grant,
+        with one set of grouped queries per distinct round start date
+
+        returns:
+            {grant_id: {stat: value}}
+    '''
+    stats = {
+        grant_id: {
+            'contribution_count': 0, 'contributor_count': 0, 'positive_round_contributor_count': 0,
+            'negative_round_contributor_count': 0, 'amount_received': 0, 'amount_received_in_round': 0,
+            'sybil_score': 0, 'phantom_funds': 0,
+        } for grant_id in grant_ids
+    }
+
+    grants_by_round_start = {}
+    for grant_id in grant_ids:
+        grants_by_round_start.setdefault(round_starts[grant_id], []).append(grant_id)
+
+    for since, ids in grants_by_round_start.items():
+        # subscriptions without a profile count as one contributor, as count_contributors does
+        anonymous = Q(contributor_profile__isnull=True)
+        positive, positive_in_round = Q(is_postive_vote=True), Q(is_postive_vote=True, created_on__gt=since)
+        negative_in_round = Q(is_postive_vote=False, created_on__gt=since)
+        counts = Subscription.objects.filter(
+            grant_id__in=ids, subscription_contribution__success=True
+        ).values_list('grant_id').annotate(
+            contribution_count=Count('subscription_contribution', filter=positive),
+            contributor_count=Count('contributor_profile', distinct=True, filter=positive),
+            positive_round_contributor_count=Count('contributor_profile', distinct=True, filter=positive_in_round),
+            negative_round_contributor_count=Count('contributor_profile', distinct=True, filter=negative_in_round),
+            anonymous_count=Count('pk', filter=positive & anonymous),
+            anonymous_positive_round_count=Count('pk', filter=positive_in_round & anonymous),
+            anonymous_negative_round_count=Count('pk', filter=negative_in_round & anonymous),
+        ).order_by()
+        for grant_id, contribution_count, *values in counts:
+            profiles, anonymous_counts = values[:3], values[3:]
+            stats[grant_id]['contribution_count'] = contribution_count
+            stats[grant_id].update(
+                (stat, num_profiles + min(num_anonymous, 1)) for stat, num_profiles, num_anonymous in zip(
+                    ['contributor_count', 'positive_round_contributor_count', 'negative_round_contributor_count'],
+                    profiles, anonymous_counts
+                )
+            )
+
+        # only contributions whose subscription has a usd value count towards the amounts
+        value_usdt = 'subscription__amount_per_period_usdt'
+        amounts = Contribution.objects.filter(
+            success=True, subscription__grant_id__in=ids, subscription__network=network
+        ).exclude(**{value_usdt: 0}).exclude(**{f'{value_usdt}__isnull': True}).values_list(
+            'subscription__grant_id'
+        ).annotate(
+            amount_received=Sum(value_usdt),
+            amount_received_in_round=Sum(value_usdt, filter=Q(created_on__gt=since)),
+            sybil_score=Sum('subscription__contributor_profile__sybil_score', filter=Q(created_on__gt=since)),
+        ).order_by()
+        for grant_id, *values in amounts:
+            stats[grant_id].update(
+                (stat, value or 0)
+                for stat, value in zip(['amount_received', 'amount_received_in_round', 'sybil_score'], values)
+            )
+
+    # phantom funding counts as a contribution, and as a contributor when they didn't also subscribe
+    phantoms = list(PhantomFunding.objects.filter(grant_id__in=grant_ids).values_list(
+        'grant_id', 'profile_id', 'round_number', 'created_on'
+    ))
+    if phantoms:
+        profile_ids = {profile_id for _, profile_id, _, _ in phantoms}
+        competing = {
+            (profile_id, round_number): count for profile_id, round_number, count in PhantomFunding.objects.filter(
+                profile_id__in=profile_ids
+            ).values_list('profile_id', 'round_number').annotate(count=Count('pk')).order_by()
+        }
+        subscribed = set(Subscription.objects.filter(
+            grant_id__in=grant_ids, contributor_profile_id__in=profile_ids
+        ).values_list('grant_id', 'contributor_profile_id'))
+
+        for grant_id, profile_id, round_number, created_on in phantoms:
+            stats[grant_id]['contribution_count'] += 1
+            stats[grant_id]['phantom_funds'] += 5 / competing[(profile_id, round_number)]
+            if (grant_id, profile_id) not in subscribed:
+                stats[grant_id]['contributor_count'] += 1
+                if created_on > round_starts[grant_id]:
+                    stats[grant_id]['positive_round_contributor_count'] += 1
+
+    return stats
+
+
+def fetch_walls_of_love(grant_ids):
+    '''
+        returns:
+            {grant_id: [[comment, times left]]}, most left first
+    '''
+    walls = {grant_id: [] for grant_id in grant_ids}
+    comments = Subscription.objects.filter(grant_id__in=grant_ids).exclude(comments='').exclude(
+        comments__contains=INGEST_COMMENT
+    ).values_list('grant_id', 'comments').annotate(count=Count('pk')).order_by('grant_id', '-count', 'comments')
+    for grant_id, comment, count in comments:
+        walls[grant_id].append([comment, count])
+    return walls
+
+
+def update_grants_metadata(grant_ids, network='mainnet'):
+    '''
+        the update_grant_metadata task for many grants at once: grouped aggregates instead of
+        looping over every subscription and contribution, then bulk writes for the grants, their
+        metadata and search results
+
+        returns:
+            the updated grants
+    '''
+    grants = list(Grant.objects.filter(pk__in=grant_ids).nocache())
+    if not grants:
+        return []
+    pks = [grant.pk for grant in grants]
+
+    active_clrs = sync_active_clrs(grants)
+    default_round_start = get_clr_rounds_metadata()['round_start_date']
+    if timezone.is_naive(default_round_start):
+        # CLR_ROUND dates are configured in UTC
+        default_round_start = timezone.make_aware(default_round_start, timezone.utc)
+    round_starts = {
+        pk: min(clr_round.start_date for clr_round in active_clrs[pk]) if pk in active_clrs else default_round_start
+        for pk in pks
+    }
+
+    convert_recent_subscriptions(pks, network)
+    stats = aggregate_grant_stats(pks, round_starts, network)
+    walls_of_love = fetch_walls_of_love(pks)
+
+    curves = {}
+    calcs = GrantCLRCalculation.objects.using('default').filter(
+        grant_id__in=pks, latest=True, active=True
+    ).order_by('-created_on').values_list('grant_id', 'clr_prediction_curve')
+    for grant_id, clr_prediction_curve in calcs:
+        curves.setdefault(grant_id, []).append(clr_prediction_curve)
+
+    now = timezone.now()
+    calc_time = time.time()
+    metadata = {}
+    for grant in grants:
+        grant_stats = stats[grant.pk]
+        grant.contribution_count = grant_stats['contribution_count']
+        grant.contributor_count = grant_stats['contributor_count']
+        grant.positive_round_contributor_count = grant_stats['positive_round_contributor_count']
+        grant.negative_round_contributor_count = grant_stats['negative_round_contributor_count']
+
+        grant.slug = slugify(unidecode(grant.title))[:49]
+        grant.twitter_handle_1 = grant.twitter_handle_1.replace('@', '')
+        grant.twitter_handle_2 = grant.twitter_handle_2.replace('@', '')
+
+        grant.amount_received = Decimal(grant_stats['amount_received'])
+        grant.amount_received_in_round = Decimal(grant_stats['amount_received_in_round'])
+        grant.monthly_amount_subscribed = 0
+        grant.amount_received_with_phantom_funds = Decimal(
+            round(float(grant.amount_received) + grant_stats['phantom_funds'], 2)
+        )
+
+        positive = grant.positive_round_contributor_count
+        grant.sybil_score = min(Decimal(grant_stats['sybil_score']) / positive if positive else -1, MAX_SYBIL_SCORE)
+        grant.clr_prediction_curve = sum_clr_prediction_curves(curves.get(grant.pk, []))
+        ss = float(grant.sybil_score)
+        if ss < 0:
+            grant.weighted_risk_score = 0
+        elif grant.clr_prediction_curve:
+            try:
+                grant.weighted_risk_score = ss ** 2 * math.sqrt(float(grant.clr_prediction_curve[0][1]))
+            except (TypeError, ValueError) as e:
+                # a missing or negative match estimate, the previous score stands
+                logger.warning(f'could not compute the weighted risk score of grant {grant.pk}: {e}')
+
+        in_active_clrs = active_clrs.get(grant.pk, [])
+        grant.is_clr_active = bool(in_active_clrs) and grant.is_clr_eligible
+        grant.clr_round_num = ', '.join(filter(None, [clr_round.display_text for clr_round in in_active_clrs]))
+        grant.modified_on = now
+
+        metadata[grant.pk] = {
+            'last_calc_time_contributor_counts': calc_time,
+            'last_calc_time_sybil_and_contrib_amounts': calc_time,
+            'wall_of_love': walls_of_love[grant.pk],
+        }
+
+    with transaction.atomic():
+        Grant.objects.bulk_update(grants, UPDATE_FIELDS, batch_size=BATCH_SIZE)
+        merge_grant_metadata(metadata)
+        sync_search_results(grants)
+
+    # bulk writes skip cacheops and Grant.save
+    invalidate_model(Grant)
+    invalidate_model(Grant.in_active_clrs.through)
+    bump_grant_versions(pks)
+
+    return grants
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Define the grouped contribution history and counts behind the grant pages.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, Q, Sum, When
+from django.db.models.functions import TruncQuarter
+from django.utils import timezone
+
+# contributions from these profiles are CLR payouts rather than contributions
+CLR_PAYOUT_HANDLES = ['vs77bb', 'gitcoinbot', 'notscottmoore', 'owocki']
+SUMMARY_TIMEOUT = 60 * 60
+HISTORY_HEADER = ["", "Contributions", "CLR Matching Funds"]
+
+
+def grant_summary_key(grant_id):
+    return f'grants:summary:{grant_id}'
+
+
+def successful_contributions(grant_id):
+    from grants.models import Contribution
+
+    return Contribution.objects.filter(subscription__grant_id=grant_id, success=True)
+
+
+def contribution_history(grant_id):
+    '''
+        the usd contributed to a grant per quarter, with one date_trunc / GROUP BY query
+
+        returns:
+            [["", "Contributions", "CLR Matching Funds"], ["2020/Q3", 5534.0, 0.0], ...] for each
+            quarter the grant has contributions in
+    '''
+    quarters = successful_contributions(grant_id).annotate(
+        quarter=TruncQuarter('created_on', tzinfo=timezone.utc),
+        is_clr=Case(
+            When(subscription__contributor_profile__handle__in=CLR_PAYOUT_HANDLES, then=True),
+            default=False, output_field=BooleanField()
+        ),
+    ).values_list('quarter', 'is_clr').annotate(amount=Sum('subscription__amount_per_period_usdt')).order_by()
+
+    history = {}
+    for quarter, is_clr, amount in quarters:
+        key = f'{quarter.year}/Q{(quarter.month + 2) // 3}'
+        amounts = history.setdefault(key, [0.0, 0.0])
+        amounts[1 if is_clr else 0] += float(amount or 0)
+
+    return [HISTORY_HEADER] + [[key, *amounts] for key, amounts in sorted(history.items())]
+
+
+def count_contributions(grant_id):
+    '''successful positive contributions plus phantom funding'''
+    from grants.models import PhantomFunding
+
+    contributions = successful_contributions(grant_id).filter(subscription__is_postive_vote=True)
+    return contributions.count() + PhantomFunding.objects.filter(grant_id=grant_id).count()
+
+
+def count_contributors(grant_id, since=None, is_postive_vote=True):
+    '''
+        distinct profiles with a successful contribution, plus the phantom funders that never
+        subscribed when counting positive votes
+
+        subscriptions without a profile count as one contributor, as distinct('contributor_profile') did
+    '''
+    from grants.models import PhantomFunding, Subscription
+
+    since = since or timezone.datetime(1990, 1, 1)
+    subscriptions = Subscription.objects.filter(
+        grant_id=grant_id, is_postive_vote=is_postive_vote, subscription_contribution__success=True,
+        created_on__gt=since
+    )
+    counts = subscriptions.aggregate(
+        profiles=Count('contributor_profile', distinct=True),
+        anonymous=Count('pk', filter=Q(contributor_profile__isnull=True)),
+    )
+    num = counts['profiles'] + min(counts['anonymous'], 1)
+    if is_postive_vote:
+        num += PhantomFunding.objects.filter(grant_id=grant_id, created_on__gt=since).exclude(
+            profile__in=Subscription.objects.filter(grant_id=grant_id).values_list('contributor_profile')
+        ).count()
+    return num
+
+
+def contributor_profile_ids(grant_id):
+    '''
+        the profile behind every successful positive contribution and phantom funding, one entry
+        per contribution as Grant.contributors has always returned
+    '''
+    from grants.models import PhantomFunding
+
+    profile_ids = list(successful_contributions(grant_id).filter(
+        subscription__is_postive_vote=True
+    ).order_by('pk').values_list('subscription__contributor_profile_id', flat=True))
+    profile_ids += PhantomFunding.objects.filter(grant_id=grant_id).order_by('pk').values_list('profile_id', flat=True)
+    return profile_ids
+
+
+def grant_summary(grant_id):
+    '''
+        the contribution history shown on a grant page, cached until its next contribution
+
+        the counts are left out, Grant.get_contribution_count and get_contributor_count query
+        them directly since update_grant_metadata can't take them from a stale cache
+
+        returns:
+            {'history': contribution_history}
+    '''
+    key = grant_summary_key(grant_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = {'history': contribution_history(grant_id)}
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_grant_summary(grant_id):
+    cache.delete(grant_summary_key(grant_id))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Define the anonymous grants explorer response cache.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app.services import RedisService
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+LISTING_VERSION_KEY = 'grants:listing_version'
+# get_grants query params and their defaults, anything else (eg cache busters) doesn't change the response
+LISTING_PARAMS = {
+    'grant_types': '',
+    'limit': '6',
+    'page': '1',
+    'cursor': None,
+    'network': 'mainnet',
+    'keyword': '',
+    'state': 'active',
+    'grant_tags': '',
+    'idle': '',
+    'featured': '',
+    'collection_id': '',
+    'round_type': '',
+    'round_num': '',
+    'sub_round_slug': '',
+    'customer_name': '',
+    'sort_option': '',
+    'tenants': '',
+    'grant_regions': '',
+}
+# comma separated filters whose order doesn't matter
+LIST_PARAMS = ('grant_types', 'grant_tags', 'tenants', 'grant_regions')
+
+
+def grant_version_key(pk):
+    return f'grants:version:{pk}'
+
+
+def bump_grant_versions(pks, listings=False):
+    '''
+        marks grants as changed, dropping every cached listing that shows one of them
+
+        Args:
+            pks         : the changed grants
+            listings    : the change can also move grants in or out of listings (new grant,
+                          filter fields), so every cached listing is dropped
+    '''
+    try:
+        pipe = RedisService().redis.pipeline()
+        for pk in pks:
+            pipe.incr(grant_version_key(pk))
+        if listings:
+            pipe.incr(LISTING_VERSION_KEY)
+        pipe.execute()
+    except RedisError as e:
+        # saves must not fail on the cache, stale listings still expire after GRANTS_LISTING_CACHE_TIMEOUT
+        logger.warning(f'could not bump grant versions: {e}')
+
+
+def normalize_listing_params(query_params):
+    '''the get_grants params that affect the response, with defaults filled in and list filters sorted'''
+    params = {}
+    for param, default in LISTING_PARAMS.items():
+        value = query_params.get(param, default)
+        if value is None:
+            continue
+        value = value.strip()
+        if param == 'keyword':
+            value = value.lower()
+        elif param in LIST_PARAMS:
+            value = ','.join(sorted(filter(None, value.split(','))))
+        params[param] = value
+    return params
+
+
+def listing_cache_key(query_params):
+    '''
+        returns:
+            cache key of the listing under the current listing version, or None when the
+            cache is disabled or the version can't be read (the request then skips the cache)
+    '''
+    if not settings.GRANTS_LISTING_CACHE_TIMEOUT:
+        return None
+
+    try:
+        version = int(RedisService().redis.get(LISTING_VERSION_KEY) or 0)
+    except RedisError:
+        return None
+
+    params = json.dumps(normalize_listing_params(query_params), sort_keys=True)
+    return f'grants:listing:{version}:' + hashlib.md5(params.encode()).hexdigest()
+
+
+def get_cached_listing(key):
+    '''
+        returns:
+            (response data, grant pks) cached under key, or None when missing, when one of
+            its grants has changed since or when redis can't be read
+    '''
+    try:
+        cached = cache.get(key)
+        if not cached:
+            return None
+
+        data, pks, versions = cached
+        if pks and RedisService().redis.mget([grant_version_key(pk) for pk in pks]) != versions:
+            return None
+    except RedisError as e:
+        logger.warning(f'could not read cached listing: {e}')
+        return None
+
+    return data, pks
+
+
+def cache_listing(key, data, pks):
+    try:
+        # versions are read once the response is built, a grant saved meanwhile can be stale until the timeout
+        versions = RedisService().redis.mget([grant_version_key(pk) for pk in pks]) if pks else []
+        cache.set(key, (data, pks, versions), settings.GRANTS_LISTING_CACHE_TIMEOUT)
+    except RedisError as e:
+        logger.warning(f'could not cache listing: {e}')
@@ -22,8 +22,10 @@
 from django.db import connection
 from django.utils import timezone
 
-from grants.clr import calculate_clr, get_totals_by_pair, normalise
+from grants.clr import normalise
 from grants.clr_data_src import fetch_grants, fetch_summed_contributions
+from grants.clr_engine import ContributionMatrix, calculate_clr_totals
+from grants.clr_snapshot import RoundSnapshot
 from grants.models import GrantCLR
 
 
@@ -35,20 +37,26 @@ def analytics_clr(from_date=None, clr_round=None, network='mainnet'):
     total_pot = float(clr_round.total_pot)
     v_threshold = float(clr_round.verified_threshold)
 
+    grant_clr_percentage_cap = clr_round.grant_clr_percentage_cap if clr_round.grant_clr_percentage_cap else 100
+    match_cap_per_grant = total_pot * (float(grant_clr_percentage_cap) / 100)
+
     print(total_pot)
 
-    # fetch data
+    # fetch data - from the round's snapshot when the estimator has written a fresh one
     grants = fetch_grants(clr_round, network)
-    curr_agg, trust_dict = fetch_summed_contributions(grants, clr_round, network)
+    snapshot = RoundSnapshot.load(clr_round.pk, network)
+    if snapshot:
+        matrix = snapshot.to_matrix()
+    else:
+        matrix = ContributionMatrix.from_agg(*fetch_summed_contributions(grants, clr_round, network))
 
     # run calculation
-    ptots = get_totals_by_pair(curr_agg)
-    bigtot, totals = calculate_clr(curr_agg, ptots, trust_dict, v_threshold, total_pot)
-    curr_grants_clr = normalise(bigtot, totals, total_pot)
-    
+    bigtot, totals = calculate_clr_totals(matrix, v_threshold)
+    curr_grants_clr = normalise(bigtot, totals, total_pot, match_cap_per_grant)
+
     # calculate clr analytics output
     for grant in grants:
-        num_contribs, contrib_amount, clr_amount = curr_grants_clr.get(grant.id, {'num_contribs': 0, 'contrib_amount': 0, 'clr_amount': None}).values()
+        _, num_contribs, contrib_amount, clr_amount = curr_grants_clr.get(grant.id, {'id': grant.id, 'num_contribs': 0, 'contrib_amount': 0, 'clr_amount': None}).values()
         # debug_output.append([grant.id, grant.title, num_contribs, contrib_amount, clr_amount])
         debug_output.append([grant.id, grant.title, grant.positive_round_contributor_count, float(grant.amount_received_in_round), clr_amount])
 
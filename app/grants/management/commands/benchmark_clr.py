@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Define the CLR benchmark management command.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from grants.clr_benchmark import SyntheticRound, benchmark_grants_clr, benchmark_townsquare_clr
+
+
+class Command(BaseCommand):
+
+    help = 'times the CLR calculations against a synthetic in-memory round (no db or network access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grants', type=int, default=100)
+        parser.add_argument('--contributors', type=int, default=2000)
+        parser.add_argument('--contributions', type=int, default=20000)
+        parser.add_argument('--alpha', type=float, default=1.5, help='pareto shape of contribution amounts')
+        parser.add_argument('--popularity', type=float, default=1.1, help='zipf exponent of grant / contributor activity')
+        parser.add_argument('--sybil-rate', type=float, default=0.1, help='share of contributors at the minimum trust bonus')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--engine', type=str, default='sparse', choices=['dict', 'sparse'])
+        parser.add_argument('--what', type=str, default='full', choices=['full', 'slim'])
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--townsquare', type=bool, default=False, help='also time townsquare.clr')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        synthetic_round = SyntheticRound(
+            num_grants=options['grants'],
+            num_contributors=options['contributors'],
+            num_contributions=options['contributions'],
+            alpha=options['alpha'],
+            popularity=options['popularity'],
+            sybil_rate=options['sybil_rate'],
+            seed=options['seed'],
+        )
+        print(
+            f"generated {options['grants']} grants / {options['contributors']} contributors / "
+            f"{options['contributions']} contributions in {time.perf_counter() - start:.2f}s"
+        )
+
+        results = benchmark_grants_clr(
+            synthetic_round, engine=options['engine'], what=options['what'], repeat=options['repeat'],
+            processes=options['processes']
+        )
+        if options['townsquare']:
+            results += benchmark_townsquare_clr(synthetic_round, repeat=options['repeat'])
+
+        print(f"{'stage':<32} {'min (s)':>10} {'median (s)':>12}")
+        for stage, fastest, median in results:
+            print(f"{stage:<32} {fastest:>10.4f} {median:>12.4f}")
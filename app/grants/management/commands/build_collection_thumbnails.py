@@ -2,6 +2,7 @@
 
 from grants.models import GrantCollection
 from grants.tasks import generate_collection_cache
+from grants.thumbnails import evict_logo_cache
 
 
 class Command(BaseCommand):
@@ -9,5 +10,6 @@ class Command(BaseCommand):
     help = 'Generate thumbnails for collections'
 
     def handle(self, *args, **kwargs):
+        evict_logo_cache()
         for collection in GrantCollection.objects.filter(hidden=False):
             generate_collection_cache.delay(collection.pk)
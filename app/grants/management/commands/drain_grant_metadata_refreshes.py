@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Define the management command that drains the grant metadata refresh queue.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from django.core.management.base import BaseCommand
+
+from grants.metadata_queue import DRAIN_BATCH_SIZE, drain_metadata_refreshes, get_refresh_counters
+
+
+class Command(BaseCommand):
+
+    help = 'enqueues one batched metadata refresh for every grant queued since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DRAIN_BATCH_SIZE, help='grants per refresh task')
+
+    def handle(self, *args, **options):
+        drained = drain_metadata_refreshes(options['batch_size'])
+        counters = get_refresh_counters()
+        print(
+            f"drained {drained} grants - requested: {counters['requested']}, queued: {counters['queued']}, "
+            f"collapsed: {counters['collapsed']}, executed: {counters['executed']}, pending: {counters['pending']}"
+        )
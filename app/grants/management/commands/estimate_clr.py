@@ -20,12 +20,12 @@
 
 import argparse
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
 from grants.clr import predict_clr
+from grants.clr_scheduler import schedule_predict_clr
 from grants.models import GrantCLR
-from grants.tasks import process_predict_clr
 
 
 class Command(BaseCommand):
@@ -39,8 +39,15 @@ def add_arguments(self, parser):
         parser.add_argument('sync', type=str, default="false")
         parser.add_argument('--use-sql', type=bool, default=False)
         parser.add_argument('--skip-save', type=bool, default=False)
+        parser.add_argument('--engine', type=str, default='sparse', choices=['dict', 'sparse'])
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='process pool size for each round\'s grant partitions, only when run sync'
+        )
+        parser.add_argument('--use-snapshot', type=bool, default=False, help='read the round from its snapshot when fresh')
         # slim = just run 0 contribution match upcate calcs
         # full, run [0, 1, 10, 100, calcs across all grants]
+        # incremental = slim, but only applies contributions made since the last run to the stored round state
 
 
     def handle(self, *args, **options):
@@ -50,34 +57,44 @@ def handle(self, *args, **options):
         sync = options['sync']
         use_sql = options['use_sql']
         skip_save = options['skip_save']
-        print (network, clr_pk, what, sync, use_sql)
+        engine = options['engine']
+        processes = options['processes']
+        use_snapshot = options['use_snapshot']
+        print (network, clr_pk, what, sync, use_sql, engine, processes)
+
+        if processes > 1 and sync != 'true':
+            # queued rounds run in celery's prefork workers, which can't fork a process pool
+            raise CommandError('--processes only applies when run sync, queued rounds predict their grants inline')
 
         if clr_pk and clr_pk.isdigit():
             active_clr_rounds = GrantCLR.objects.filter(pk=clr_pk)
         else:
             active_clr_rounds = GrantCLR.objects.filter(is_active=True)
 
-        if active_clr_rounds:
+        if not active_clr_rounds:
+            print("No active CLRs found")
+        elif sync == 'true':
+            # run it sync -> useful for payout / debugging
             for clr_round in active_clr_rounds:
-                if sync == 'true':
-                    # run it sync -> useful for payout / debugging
-                    predict_clr(
-                        save_to_db=True if not skip_save else False,
-                        from_date=timezone.now(),
-                        clr_round=clr_round,
-                        network=network,
-                        what=what,
-                        use_sql=use_sql,
-                    )
-                else:
-                    # runs it as celery task.
-                    process_predict_clr(
-                        save_to_db=True if not skip_save else False,
-                        from_date=timezone.now(),
-                        clr_round=clr_round,
-                        network=network,
-                        what=what,
-                        use_sql=use_sql,
-                    )
+                predict_clr(
+                    save_to_db=True if not skip_save else False,
+                    from_date=timezone.now(),
+                    clr_round=clr_round,
+                    network=network,
+                    what=what,
+                    use_sql=use_sql,
+                    engine=engine,
+                    processes=processes,
+                    use_snapshot=use_snapshot,
+                )
         else:
-            print("No active CLRs found")
+            # runs each round as its own celery task, so overlapping rounds are estimated in parallel
+            schedule_predict_clr(
+                active_clr_rounds,
+                network=network,
+                what=what,
+                use_sql=use_sql,
+                engine=engine,
+                save_to_db=True if not skip_save else False,
+                use_snapshot=use_snapshot,
+            )
@@ -18,40 +18,38 @@
 
 """
 
-import time
-
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from grants.models import Grant
+from grants.related import TOP_RELATED, fetch_related_grants, recently_funded_grant_ids, save_related_grants
+
+# grants per query / update
+BATCH_SIZE = 500
 
 
 class Command(BaseCommand):
 
     help = 'calculate related grants'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since-minutes', type=int, default=0,
+            help='only refresh grants funded in the last N minutes (default: every active grant)'
+        )
+        parser.add_argument('--top', type=int, default=TOP_RELATED, help='related grants kept per grant (0 = all)')
+
     def handle(self, *args, **options):
         # save related addresses
         # related = same contirbutor, same cart
-        grants = Grant.objects.filter(active=True).order_by('-contributor_count')
-        for instance in grants:
-            pk = instance.pk
-            print(pk)
-            related = {}
-            then = timezone.now() - timezone.timedelta(days=90)
-            subs = instance.subscriptions.filter(created_on__gt=then).all()
-            # for perf reasons, bound this
-            subs = subs[0:2000]
-            for subscription in subs:
-                _from = subscription.created_on - timezone.timedelta(hours=1)
-                _to = subscription.created_on + timezone.timedelta(hours=1)
-                profile = subscription.contributor_profile
-                for _subs in profile.grant_contributor.filter(created_on__gt=_from, created_on__lt=_to).exclude(grant__id=pk):
-                    key = _subs.grant.pk
-                    if key not in related.keys():
-                        related[key] = 0
-                    related[key] += 1
-            instance = Grant.objects.get(pk=pk)
-            instance.metadata['related'] = sorted(related.items() ,  key=lambda x: x[1], reverse=True)
-            instance.metadata['last_calc_time_related'] = time.time()
-            instance.save()
+        if options['since_minutes']:
+            since = timezone.now() - timezone.timedelta(minutes=options['since_minutes'])
+            grant_ids = recently_funded_grant_ids(since)
+        else:
+            grant_ids = Grant.objects.filter(active=True).values_list('pk', flat=True)
+
+        grant_ids = sorted(grant_ids)
+        for i in range(0, len(grant_ids), BATCH_SIZE):
+            batch = grant_ids[i:i + BATCH_SIZE]
+            save_related_grants(fetch_related_grants(batch, top=options['top']))
+            print(f'{i + len(batch)}/{len(grant_ids)}')
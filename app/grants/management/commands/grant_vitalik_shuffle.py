@@ -21,33 +21,30 @@
 import random
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from cacheops import invalidate_model
+from grants.listing_cache import bump_grant_versions
 from grants.models import Grant, GrantCLR
 
+BATCH_SIZE = 500
+# rank of every grant that isn't in an active CLR round
+DEFAULT_SHUFFLE = 99999
+
 # VB 2019/09/27
 # > To prevent a winner-takes-all effect from grants with already the most funding being shown at the top, how about a randomized sort, where your probability of being first is equal to (your expected CLR match) / (total expected CLR match) and then you just do that recursively to position everyone?
 
 
-def weighted_select(items):
-    stop = random.randrange(sum([ele[1] for ele in items]))
-    pos = 0
-    for ele in items:
-        i = ele[1]
-        if (pos + i) > stop:
-            return i
-        pos += i
+def weighted_shuffle(items, rng=random):
+    '''
+        orders [item, weight] pairs so that each position goes to one of the remaining items
+        with probability weight / (total weight of the remaining items)
 
-def custom_index(arr, item):
-    for i in range(0, len(arr)):
-        if arr[i][1] == item:
-            return i
+        sorting on exponential keys E / weight (Efraimidis-Spirakis) samples exactly that
+        ordering in O(n log n), rather than drawing and removing one item at a time
+    '''
+    return [item for item, weight in sorted(items, key=lambda ele: rng.expovariate(1) / ele[1])]
 
-def weighted_shuffle(items):
-    o = []
-    while items:
-        o.append(weighted_select(items))
-        items.pop(custom_index(items, o[-1]))
-    return o
 
 class Command(BaseCommand):
 
@@ -63,13 +60,10 @@ def handle(self, *args, **options):
 
         # TODO-SELF-SERVICE: Check if it's alright to shuffle all grants even if 1 CLR round is active
 
-        # set default, for when no CLR match enabled
-        for grant in Grant.objects.all():
-            grant.weighted_shuffle = 99999
-            grant.save()
-
         # get grants, and apply weighted shuffle rank to them
-        grants = Grant.objects.filter(clr_prediction_curve__0__1__isnull=False, is_clr_active=True).order_by('pk')
+        grants = Grant.objects.filter(
+            clr_prediction_curve__0__1__isnull=False, is_clr_active=True
+        ).order_by('pk').only('pk', 'clr_prediction_curve')
         weighted_list = []
         for grant in grants:
             try:
@@ -77,15 +71,18 @@ def handle(self, *args, **options):
                 weighted_list.append([grant, weight])
             except Exception as e:
                 print(e)
-        og_weighted_list = weighted_list.copy()
-        ws = weighted_shuffle(weighted_list)
-        counter = 0
-
-        # update grants in db
-        for ele in ws:
-            grant_idx = custom_index(og_weighted_list, ele)
-            grant = grants[grant_idx]
+
+        shuffled = weighted_shuffle(weighted_list)
+        for counter, grant in enumerate(shuffled):
             grant.random_shuffle = random.randint(0, 99999999)
             grant.weighted_shuffle = counter
-            grant.save()
-            counter+=1
+
+        # only the shuffle columns change, so write them directly rather than through Grant.save
+        with transaction.atomic():
+            # set default, for when no CLR match enabled
+            Grant.objects.exclude(pk__in=[grant.pk for grant in shuffled]).update(weighted_shuffle=DEFAULT_SHUFFLE)
+            Grant.objects.bulk_update(shuffled, ['weighted_shuffle', 'random_shuffle'], batch_size=BATCH_SIZE)
+
+        # bulk writes skip cacheops, and the new ranks reorder every explorer listing
+        invalidate_model(Grant)
+        bump_grant_versions([], listings=True)
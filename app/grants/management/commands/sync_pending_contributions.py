@@ -23,9 +23,9 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from grants.metadata_queue import request_metadata_refresh
 from grants.models import Contribution
-from grants.tasks import update_grant_metadata
-from grants.utils import sync_payout
+from grants.sync.engine import sync_pending_contributions
 
 
 class Command(BaseCommand):
@@ -51,7 +51,16 @@ def handle(self, *args, **options):
                 tx_cleared=False
             )
             for contribution in contrib_to_be_expired:
-                update_grant_metadata.delay(contribution.subscription.grant.pk)
-
-            for contribution in tenant_pending_contributions.all():
-                sync_payout(contribution)
+                request_metadata_refresh(contribution.subscription.grant_id)
+
+        # every tenant is checked at once, on its own workers, so a slow explorer only delays its own tenant
+        contributions_by_tenant = {
+            tenant: list(pending_contribution.filter(subscription__tenant=tenant).select_related('subscription__grant'))
+            for tenant in tenants
+        }
+        stats = sync_pending_contributions(contributions_by_tenant)
+        for tenant, tenant_stats in stats.items():
+            print(
+                f"{tenant}: checked {tenant_stats['checked']} ({tenant_stats['per_second']}/s), "
+                f"updated {tenant_stats['changed']}, errors {tenant_stats['errors']}"
+            )
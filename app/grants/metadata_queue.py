@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Define the coalescing queue in front of the grant metadata refresh.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import logging
+
+from app.services import RedisService
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# grant ids waiting for a refresh, a set so that repeated requests collapse into one entry
+PENDING_KEY = 'grants:metadata:pending'
+# {'requested', 'queued', 'collapsed', 'executed'} totals, every request is either queued or collapsed
+COUNTERS_KEY = 'grants:metadata:refreshes'
+COUNTERS = ('requested', 'queued', 'collapsed', 'executed')
+DRAIN_BATCH_SIZE = 500
+
+
+def request_metadata_refresh(grant_id):
+    '''
+        queues a grant for the next drain, instead of enqueuing update_grant_metadata for every
+        save and contribution
+
+        a grant already waiting is counted as collapsed, and when redis is unavailable the
+        refresh is enqueued directly so that it isn't lost
+    '''
+    try:
+        redis = RedisService().redis
+        added = redis.sadd(PENDING_KEY, grant_id)
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby(COUNTERS_KEY, 'requested', 1)
+        pipe.hincrby(COUNTERS_KEY, 'queued' if added else 'collapsed', 1)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f'could not queue grant {grant_id} for a metadata refresh: {e}')
+        from grants.tasks import update_grant_metadata
+        update_grant_metadata.delay(grant_id)
+
+
+def pop_pending_refreshes(count=DRAIN_BATCH_SIZE):
+    '''
+        returns:
+            up to count queued grant ids, removed from the queue - a grant requested again
+            afterwards is queued for the next drain
+    '''
+    return sorted(int(grant_id) for grant_id in RedisService().redis.spop(PENDING_KEY, count) or [])
+
+
+def drain_metadata_refreshes(batch_size=DRAIN_BATCH_SIZE):
+    '''
+        enqueues one batch_update_grant_metadata task per batch_size queued grants
+
+        returns:
+            the number of grants drained
+    '''
+    from grants.tasks import batch_update_grant_metadata
+
+    drained = 0
+    while True:
+        grant_ids = pop_pending_refreshes(batch_size)
+        if not grant_ids:
+            return drained
+        batch_update_grant_metadata.delay(grant_ids)
+        drained += len(grant_ids)
+
+
+def record_executed_refreshes(count):
+    try:
+        RedisService().redis.hincrby(COUNTERS_KEY, 'executed', count)
+    except RedisError as e:
+        logger.warning(f'could not count executed metadata refreshes: {e}')
+
+
+def get_refresh_counters():
+    '''
+        returns:
+            {'requested': n, 'queued': n, 'collapsed': n, 'executed': n, 'pending': n}
+    '''
+    redis = RedisService().redis
+    counters = {
+        (counter.decode() if isinstance(counter, bytes) else counter): int(value)
+        for counter, value in redis.hgetall(COUNTERS_KEY).items()
+    }
+    stats = {counter: counters.get(counter, 0) for counter in COUNTERS}
+    stats['pending'] = redis.scard(PENDING_KEY)
+    return stats
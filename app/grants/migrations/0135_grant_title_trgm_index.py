@@ -0,0 +1,18 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0134_granthalloffame_granthalloffamegrantee'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='grant',
+            index=GinIndex(fields=['title'], name='grants_grant_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0135_grant_title_trgm_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['contributor_profile', 'created_on'], name='grants_sub_profile_created_idx'),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
@@ -174,8 +174,14 @@ def leave_gitcoinbot_comment_for_status(self, status):
             print(e)
 
 
-    def update_tx_status(self):
-        """Updates tx status for Ethereum contributions."""
+    def update_tx_status(self, validation=None):
+        """Updates tx status for Ethereum contributions.
+
+        Args:
+            validation (dict): The validator response of this contribution from
+                economy.tx.grants_transactions_validator, when it was validated in a batch.
+
+        """
         try:
             from dashboard.utils import get_web3
             from economy.tx import grants_transaction_validator
@@ -249,13 +255,17 @@ def update_tx_status(self):
                 # get active chain std/polygon
                 chain =  self.checkout_type.split('_')[-1]
 
-                # Prepare web3 provider
-                w3 = get_web3(network, chain=chain)
+                if validation:
+                    # Already validated with the other contributions of its batch
+                    split_tx_status = validation['status']
+                else:
+                    # Prepare web3 provider
+                    w3 = get_web3(network, chain=chain)
 
-                # Handle dropped/replaced transactions
-                _, split_tx_status, _ = check_for_replaced_tx(
-                    self.split_tx_id, network, self.created_on, chain=chain
-                )
+                    # Handle dropped/replaced transactions
+                    _, split_tx_status, _ = check_for_replaced_tx(
+                        self.split_tx_id, network, self.created_on, chain=chain
+                    )
 
                 # Handle pending txns
                 if split_tx_status in ['pending']:
@@ -281,7 +291,7 @@ def update_tx_status(self):
                     return
 
                 # Validate that the token transfers occurred
-                response = grants_transaction_validator(self, w3, chain=chain)
+                response = validation or grants_transaction_validator(self, w3, chain=chain)
                 if len(response['originator']):
                     self.originated_address = response['originator'][0]
                 self.validator_passed = response['validation']['passed']
@@ -318,6 +328,11 @@ def psave_contrib(sender, instance, **kwargs):
 
     from django.contrib.contenttypes.models import ContentType
     from dashboard.models import Earning
+    from grants.history import invalidate_grant_summary
+    if instance.subscription:
+        # new contributions and ones whose status changed move the grant's history and counts
+        grant_id = instance.subscription.grant_id
+        transaction.on_commit(lambda: invalidate_grant_summary(grant_id))
     if instance.subscription and not instance.subscription.negative:
         try:
             Earning.objects.update_or_create(
@@ -3,10 +3,10 @@
 from django.contrib.humanize.templatetags.humanize import naturaltime
 from django.contrib.postgres.fields import ArrayField, JSONField
 from django.contrib.postgres.indexes import GinIndex
-from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity
 from django.core import serializers
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q, prefetch_related_objects
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
@@ -14,7 +14,10 @@
 
 from django_extensions.db.fields import AutoSlugField
 from economy.models import SuperModel
-from grants.utils import get_upload_filename, is_grant_team_member
+from grants.facets import facet_values, facets_for, update_facet_counts
+from grants.history import contributor_profile_ids, count_contributions, count_contributors, grant_summary
+from grants.listing_cache import bump_grant_versions
+from grants.utils import get_upload_filename, is_grant_team_member, sum_clr_prediction_curves
 from townsquare.models import Favorite
 from web3 import Web3
 
@@ -225,6 +228,26 @@ def keyword(self, keyword):
             Q(reference_url__icontains=keyword)
         )
 
+    def search(self, keyword):
+        """Full text search of the grant title and description, ranked by relevance.
+
+        Matches on the stored, GIN indexed vector_column (kept up to date by the vector_column_trigger)
+        and falls back to trigram matches on the title for partial or misspelt terms.
+
+        Args:
+            keyword (str): The search terms.
+
+        Returns:
+            GrantQuerySet: The matching grants, annotated with their search_rank.
+
+        """
+        search_query = SearchQuery(keyword, config='english')
+        return self.filter(
+            Q(vector_column=search_query) | Q(title__icontains=keyword) | Q(title__trigram_similar=keyword)
+        ).annotate(
+            search_rank=SearchRank(F('vector_column'), search_query) + TrigramSimilarity('title', keyword)
+        )
+
 
 class Grant(SuperModel):
     """Define the structure of a Grant."""
@@ -233,7 +256,11 @@ class Meta:
         """Define the metadata for Grant."""
 
         ordering = ['-created_on']
-        indexes = (GinIndex(fields=["vector_column"]),)
+        indexes = (
+            GinIndex(fields=["vector_column"]),
+            # backs the partial / fuzzy title matches of the grant search
+            GinIndex(fields=["title"], name="grants_grant_title_trgm", opclasses=["gin_trgm_ops"]),
+        )
         index_together = [
             ["last_update", "network", "active", "hidden"],
             ["last_update", "network", "active", "hidden", "weighted_shuffle"],
@@ -636,21 +663,8 @@ def calc_clr_round_label(self):
     def calc_clr_prediction_curve(self):
         # [amount_donated, match amount, bonus_from_match_amount ], etc..
         # [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
-        _clr_prediction_curve = []
-        for insert_clr_calc in self.clr_calculations.using('default').filter(latest=True, active=True).order_by('-created_on'):
-            insert_clr_calc = insert_clr_calc.clr_prediction_curve
-            if not _clr_prediction_curve:
-                _clr_prediction_curve = insert_clr_calc
-            else:
-                for j in [1,2]:
-                    for i in [0,1,2,3,4,5]:
-                        # add the 1 and 2 index of each clr prediction cuve
-                        _clr_prediction_curve[i][j] += insert_clr_calc[i][j]
-
-        if not _clr_prediction_curve:
-            _clr_prediction_curve = [[0.0, 0.0, 0.0] for x in range(0, 6)]
-
-        return _clr_prediction_curve
+        curves = self.clr_calculations.using('default').filter(latest=True, active=True).order_by('-created_on').values_list('clr_prediction_curve', flat=True)
+        return sum_clr_prediction_curves(curves)
 
 
     def updateActiveSubscriptions(self):
@@ -673,13 +687,8 @@ def recurring_funding_supported(self):
     @property
     def related_grants(self):
         pkg = self.metadata.get('related', [])
-        pks = [ele[0] for ele in pkg]
-        rg = Grant.objects.filter(pk__in=pks)
-        return_me = []
-        for ele in pkg:
-            grant = rg.get(pk=ele[0])
-            return_me.append([grant, ele[1]])
-        return return_me
+        rg = Grant.objects.in_bulk([ele[0] for ele in pkg])
+        return [[rg[ele[0]], ele[1]] for ele in pkg if ele[0] in rg]
 
 
     @property
@@ -697,10 +706,7 @@ def clr_match_estimate_this_round(self):
 
     @property
     def contributions(self):
-        pks = []
-        for subscription in self.subscriptions.all():
-            pks += list(subscription.subscription_contribution.values_list('pk', flat=True))
-        return Contribution.objects.filter(pk__in=pks)
+        return Contribution.objects.filter(subscription__grant=self)
 
 
     @property
@@ -724,28 +730,22 @@ def org_name(self):
 
     @property
     def get_contribution_count(self):
-        num = 0
-        num += self.subscriptions.filter(is_postive_vote=True, subscription_contribution__success=True).count()
-        num += self.phantom_funding.all().count()
-        return num
+        return count_contributions(self.pk)
 
     @property
     def contributors(self):
-        return_me = []
-        for sub in self.subscriptions.filter(is_postive_vote=True):
-            for contrib in sub.subscription_contribution.filter(success=True):
-                return_me.append(contrib.subscription.contributor_profile)
-        for pf in self.phantom_funding.all():
-            return_me.append(pf.profile)
-        return return_me
+        from dashboard.models import Profile
+        profile_ids = contributor_profile_ids(self.pk)
+        profiles = Profile.objects.in_bulk({pk for pk in profile_ids if pk})
+        return [profiles.get(pk) for pk in profile_ids]
 
     def get_contributor_count(self, since=None, is_postive_vote=True):
-        if not since:
-            since = timezone.datetime(1990, 1, 1)
-        num = self.subscriptions.filter(is_postive_vote=is_postive_vote, subscription_contribution__success=True, created_on__gt=since).distinct('contributor_profile').count()
-        if is_postive_vote:
-            num += self.phantom_funding.filter(created_on__gt=since).exclude(profile__in=self.subscriptions.values_list('contributor_profile')).all().count()
-        return num
+        return count_contributors(self.pk, since, is_postive_vote)
+
+    @property
+    def summary(self):
+        """Return the cached contribution history shown on the grant page."""
+        return grant_summary(self.pk)
 
 
     @property
@@ -758,32 +758,9 @@ def org_profile(self):
 
     @property
     def history_by_month(self):
-        import math
-        # gets the history of contributions to this grant month over month so they can be shown o grant details
-        # returns [["", "Subscription Billing",  "New Subscriptions", "One-Time Contributions", "CLR Matching Funds"], ["December 2017", 5534, 2011, 0, 0], ["January 2018", 10396, 0 , 0, 0 ], ... for each monnth in which this grant has contribution history];
-        CLR_PAYOUT_HANDLES = ['vs77bb', 'gitcoinbot', 'notscottmoore', 'owocki']
-        month_to_contribution_numbers = {}
-        subs = self.subscriptions.all().prefetch_related('subscription_contribution')
-        for sub in subs:
-            contribs = [sc for sc in sub.subscription_contribution.all() if sc.success]
-            for contrib in contribs:
-                #add all contributions
-                year = contrib.created_on.strftime("%Y")
-                quarter = math.ceil(int(contrib.created_on.strftime("%m"))/3.)
-                key = f"{year}/Q{quarter}"
-                subkey = 'One-Time'
-                if contrib.subscription.contributor_profile.handle in CLR_PAYOUT_HANDLES:
-                    subkey = 'CLR'
-                if key not in month_to_contribution_numbers.keys():
-                    month_to_contribution_numbers[key] = {"One-Time": 0, "Recurring-Recurring": 0, "New-Recurring": 0, 'CLR': 0}
-                if contrib.subscription.amount_per_period_usdt:
-                    month_to_contribution_numbers[key][subkey] += float(contrib.subscription.amount_per_period_usdt)
-
-        # sort and return
-        return_me = [["", "Contributions", "CLR Matching Funds"]]
-        for key, val in (sorted(month_to_contribution_numbers.items(), key=lambda kv:(kv[0]))):
-            return_me.append([key, val['One-Time'], val['CLR']])
-        return return_me
+        # gets the history of contributions to this grant quarter over quarter so they can be shown on grant details
+        # returns [["", "Contributions", "CLR Matching Funds"], ["2017/Q4", 5534.0, 0.0], ["2018/Q1", 10396.0, 0.0], ... for each quarter in which this grant has contribution history];
+        return self.summary['history']
 
     @property
     def history_by_month_max(self):
@@ -862,7 +839,7 @@ def cart_payload(self, build_absolute_uri, user=None):
             'is_on_team': is_grant_team_member(self, user.profile) if user and user.is_authenticated else False,
         }
 
-    def repr(self, user, build_absolute_uri):
+    def repr(self, user, build_absolute_uri, favorite_ids=None):
         team_members = serializers.serialize('json', self.team_members.all(),
                             fields=['handle', 'url', 'profile__lazy_avatar_url']
                         )
@@ -872,7 +849,15 @@ def repr(self, user, build_absolute_uri):
 
         grant_tags = serializers.serialize('json', self.tags.all(),fields=['id', 'name'])
 
-        active_round_names = list(self.in_active_clrs.values_list('display_text', flat=True))
+        # iterate .all() so a prefetch from repr_batch is used
+        active_round_names = [clr.display_text for clr in self.in_active_clrs.all()]
+
+        if not user.is_authenticated:
+            favorite = False
+        elif favorite_ids is not None:
+            favorite = self.id in favorite_ids
+        else:
+            favorite = self.favorite(user)
 
         return {
                 'id': self.id,
@@ -893,7 +878,7 @@ def repr(self, user, build_absolute_uri):
                     'handle': self.admin_profile.handle,
                     'avatar_url': self.admin_profile.lazy_avatar_url
                 },
-                'favorite': self.favorite(user) if user.is_authenticated else False,
+                'favorite': favorite,
                 'is_on_team': is_grant_team_member(self, user.profile) if user.is_authenticated else False,
                 'clr_prediction_curve': self.clr_prediction_curve,
                 'last_clr_calc_date':  naturaltime(self.last_clr_calc_date) if self.last_clr_calc_date else None,
@@ -939,24 +924,63 @@ def repr(self, user, build_absolute_uri):
                 'is_idle': self.is_idle
             }
 
+    @staticmethod
+    def repr_batch(grants, user, build_absolute_uri):
+        """Build the repr of a page of grants with a fixed number of queries.
+
+        Args:
+            grants (list): The grants to represent.
+            user (User): The requesting user.
+            build_absolute_uri (function): The request's build_absolute_uri.
+
+        Returns:
+            list: The repr of each grant, in the order given.
+
+        """
+        grants = list(grants)
+        prefetch_related_objects(
+            grants, 'admin_profile', 'grant_type', 'link_to_new_grant', 'team_members', 'tags', 'in_active_clrs'
+        )
+
+        favorite_ids = set()
+        if user.is_authenticated and grants:
+            favorite_ids = set(
+                Favorite.objects.filter(user=user, grant__in=grants).values_list('grant_id', flat=True)
+            )
+
+        return [grant.repr(user, build_absolute_uri, favorite_ids=favorite_ids) for grant in grants]
+
     def favorite(self, user):
         return Favorite.objects.filter(user=user, grant=self).exists()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the facet fields as loaded so save can move the grant between facets."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_facet_values = facet_values(instance)
+        return instance
+
     def save(self, update=True, *args, **kwargs):
         """Override the Grant save to optionally handle modified_on logic."""
 
         self.clr_prediction_curve = self.calc_clr_prediction_curve
         self.clr_round_num = self.calc_clr_round_label
-        self.search_vector = (
-            SearchVector('title', weight='A') + SearchVector('description', weight='B')
-        )
 
         if self.modified_on < (timezone.now() - timezone.timedelta(minutes=15)):
-            from grants.tasks import update_grant_metadata
-            update_grant_metadata.delay(self.pk)
+            from grants.metadata_queue import request_metadata_refresh
+            request_metadata_refresh(self.pk)
 
         from economy.models import get_time
         if update:
             self.modified_on = get_time()
 
-        return super(Grant, self).save(*args, **kwargs)
+        old_facets = set() if self._state.adding else facets_for(getattr(self, '_loaded_facet_values', None))
+        result = super(Grant, self).save(*args, **kwargs)
+
+        self._loaded_facet_values = facet_values(self)
+        new_facets = facets_for(self._loaded_facet_values)
+        transaction.on_commit(lambda: update_facet_counts(old_facets, new_facets))
+        # a grant changing facets can enter or leave any listing, otherwise only listings showing it are stale
+        transaction.on_commit(lambda: bump_grant_versions([self.pk], listings=old_facets != new_facets))
+
+        return result
@@ -1,5 +1,4 @@
 import traceback
-from io import BytesIO
 
 from django.contrib.postgres.fields import JSONField
 from django.core.files.base import ContentFile
@@ -10,7 +9,7 @@
 from django.utils.translation import gettext_lazy as _
 
 from economy.models import SuperModel
-from grants.utils import generate_collection_thumbnail, get_upload_filename
+from grants.utils import generate_collection_thumbnail_png, get_upload_filename
 
 
 class CollectionsQuerySet(models.QuerySet):
@@ -59,11 +58,9 @@ def generate_cache(self):
         }
 
         try:
-            cover = generate_collection_thumbnail(self, 348 * 5, 175 * 5)
+            cover = generate_collection_thumbnail_png(self, 348 * 5, 175 * 5, strict=True)
             filename = f'thumbnail_{self.id}.png'
-            buffer = BytesIO()
-            cover.save(fp=buffer, format='PNG')
-            tempfile = ContentFile(buffer.getvalue())
+            tempfile = ContentFile(cover)
             image_file = InMemoryUploadedFile(tempfile, None, filename, 'image/png', tempfile.tell, None)
             self.cover.save(filename, image_file)
         except Exception:
@@ -578,7 +578,7 @@ def successful_contribution(self, tx_id, include_for_clr=True, **kwargs):
 
     def create_contribution(self, tx_id, is_successful_contribution=True):
         from marketing.mails import successful_contribution
-        from grants.tasks import update_grant_metadata
+        from grants.metadata_queue import request_metadata_refresh
 
         now = timezone.now()
         self.last_contribution_date = now
@@ -615,10 +615,11 @@ def create_contribution(self, tx_id, is_successful_contribution=True):
         if is_successful_contribution:
             successful_contribution(self.grant, self, contribution)
 
-        update_grant_metadata.delay(self.pk)
+        request_metadata_refresh(grant.pk)
         return contribution
 
     class Meta:
         indexes = [
             models.Index(fields=['contributor_address',]),
+            models.Index(fields=['contributor_profile', 'created_on'], name='grants_sub_profile_created_idx'),
         ]
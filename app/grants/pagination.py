@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Define the keyset (cursor) pagination used by the grants explorer.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db.models import Q
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _cursor_value(value):
+    # full precision on purpose, DjangoJSONEncoder drops the microseconds the page boundary depends on
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} can not be used as a cursor')
+
+
+def encode_cursor(value, pk):
+    '''opaque, url safe cursor for the row (value, pk)'''
+    payload = json.dumps([value, pk], default=_cursor_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    '''
+        returns:
+            (value, pk) of the last row of the previous page
+
+        raises:
+            InvalidCursor when the cursor wasn't produced by encode_cursor
+    '''
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(payload.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+    if not isinstance(pk, int):
+        raise InvalidCursor(cursor)
+    return value, pk
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    '''
+        COUNT(*) of the queryset, shared for timeout seconds by every request running
+        the same query - good enough for "N grants" and far cheaper than counting per page
+    '''
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    key = 'grants_count_' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, timeout)
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor, has_previous):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.has_previous = has_previous
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    '''
+        paginates a queryset on (key, pk) rather than OFFSET, so every page is a single
+        index range scan no matter how deep the client has scrolled
+
+        the key may be nullable: postgres puts NULLs first when descending and last when
+        ascending, and the page boundary follows the same rule
+    '''
+
+    def __init__(self, queryset, key, descending=False, per_page=6):
+        '''
+            Args:
+                queryset    : the filtered queryset, its ordering is replaced by (key, pk)
+                key         : field or annotation name to page on
+                descending  : order by -key, -pk rather than key, pk
+                per_page    : rows per page
+        '''
+        self.key = key
+        self.descending = descending
+        self.per_page = int(per_page)
+        try:
+            self.nullable = queryset.model._meta.get_field(key).null
+        except FieldDoesNotExist:
+            # annotations are only used on non-null expressions (eg Lower('title'))
+            self.nullable = False
+        order = '-' if descending else ''
+        self.queryset = queryset.order_by(f'{order}{key}', f'{order}pk')
+
+    def after(self, value, pk):
+        '''the rows ordered after (value, pk)'''
+        key = self.key
+        lookup = 'lt' if self.descending else 'gt'
+        if value is None:
+            after = Q(**{f'{key}__isnull': True, f'pk__{lookup}': pk})
+            return (after | Q(**{f'{key}__isnull': False})) if self.descending else after
+
+        after = Q(**{f'{key}__{lookup}': value}) | Q(**{key: value, f'pk__{lookup}': pk})
+        if self.nullable and not self.descending:
+            after |= Q(**{f'{key}__isnull': True})
+        return after
+
+    def get_page(self, cursor=None):
+        '''
+            Args:
+                cursor      : next_cursor of the previous page, or empty for the first page
+
+            returns:
+                KeysetPage
+
+            raises:
+                InvalidCursor
+        '''
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self.after(*decode_cursor(cursor)))
+
+        # one extra row tells us whether there is a next page without counting
+        rows = list(queryset[:self.per_page + 1])
+        object_list = rows[:self.per_page]
+        next_cursor = None
+        if len(rows) > self.per_page:
+            last = object_list[-1]
+            next_cursor = encode_cursor(getattr(last, self.key), last.pk)
+
+        return KeysetPage(object_list, next_cursor, bool(cursor))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Define the co-contribution index behind Grant.related_grants.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from cacheops import invalidate_model
+from grants.grant_metadata import merge_grant_metadata
+from grants.listing_cache import bump_grant_versions
+from grants.models import Grant
+
+# contributions to two grants count as related when made this close together (same cart)
+RELATED_WINDOW = timezone.timedelta(hours=1)
+# how far back contributions are considered
+RELATED_HISTORY = timezone.timedelta(days=90)
+# related grants kept per grant, 0 keeps them all
+TOP_RELATED = 100
+
+RELATED_GRANTS_SQL = '''
+    -- for each grant, the other grants its contributors funded within the window, most shared first
+    SELECT grant_id, related_grant_id, hits FROM (
+        SELECT
+            s.grant_id,
+            t.grant_id AS related_grant_id,
+            COUNT(*) AS hits,
+            ROW_NUMBER() OVER (PARTITION BY s.grant_id ORDER BY COUNT(*) DESC, t.grant_id) AS position
+        FROM grants_subscription s
+        INNER JOIN grants_subscription t ON
+            t.contributor_profile_id = s.contributor_profile_id
+            AND t.created_on > s.created_on - %(window)s
+            AND t.created_on < s.created_on + %(window)s
+            AND t.grant_id <> s.grant_id
+        WHERE
+            s.created_on > %(since)s
+            AND s.grant_id = ANY(%(grant_ids)s)
+        GROUP BY s.grant_id, t.grant_id
+    ) related
+    WHERE %(top)s = 0 OR position <= %(top)s
+    ORDER BY grant_id, hits DESC, related_grant_id
+'''
+
+def fetch_related_grants(grant_ids, top=TOP_RELATED, window=RELATED_WINDOW, history=RELATED_HISTORY):
+    '''
+        one self-join of grants_subscription on the contributor, rather than a query per
+        subscription per contributor
+
+        returns:
+            {grant_id: [[related_grant_id, hits]]}, most hits first, for every grant in grant_ids
+    '''
+    related = {grant_id: [] for grant_id in grant_ids}
+    with connection.cursor() as cursor:
+        cursor.execute(RELATED_GRANTS_SQL, {
+            'grant_ids': list(grant_ids),
+            'since': timezone.now() - history,
+            'window': window,
+            'top': top,
+        })
+        for grant_id, related_grant_id, hits in cursor.fetchall():
+            related[grant_id].append([related_grant_id, hits])
+
+    return related
+
+
+def recently_funded_grant_ids(since, window=RELATED_WINDOW):
+    '''
+        the grants whose related grants can have changed since the given time - anything
+        with a subscription in the window before it could pair with a new one
+    '''
+    return set(
+        Grant.objects.filter(active=True, subscriptions__created_on__gt=since - window).values_list('pk', flat=True)
+    )
+
+
+def save_related_grants(related):
+    '''merges metadata['related'] into each grant, leaving the other metadata keys untouched'''
+    if not related:
+        return
+
+    calc_time = time.time()
+    merge_grant_metadata({
+        grant_id: {'related': grants, 'last_calc_time_related': calc_time} for grant_id, grants in related.items()
+    })
+
+    # the raw update skips cacheops and Grant.save
+    invalidate_model(Grant)
+    bump_grant_versions(list(related.keys()))
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Define the BSCI sybil classification and the bulk squelch writer.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from app.services import RedisService
+from cacheops import invalidate_model
+from townsquare.models import SquelchProfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMMENT = 'added by bsci'
+# profiles looked up / squelches written per query
+WRITE_BATCH_SIZE = 5000
+
+# the rules a handle is classified by, first match wins. every rule is (is_sybil, label column)
+HUMAN_SYBIL, HEURISTIC_SYBIL, PREDICTION_SYBIL, HUMAN_NON_SYBIL, HEURISTIC_NON_SYBIL, NON_SYBIL = range(6)
+RULES = {
+    HUMAN_SYBIL: (True, 'flag_type_y'),
+    HEURISTIC_SYBIL: (True, 'flag_type_x'),
+    PREDICTION_SYBIL: (True, 'flag_type_x'),
+    HUMAN_NON_SYBIL: (False, 'flag_type_y'),
+    HEURISTIC_NON_SYBIL: (False, 'flag_type_x'),
+    NON_SYBIL: (False, 'flag_type_x'),
+}
+
+
+def classify(df):
+    '''
+        the rule each row of a bsci csv matches
+
+        - human labeled sybils ('reviewer_is_certain (0/1)_y' and 'is_sybil_y' can be adjusted,
+          human_sybil_score could also be used as a filter if wanted)
+        - heuristic labeled sybils
+        - ml predicted sybils. a higher ml_score means less people are likely to appeal, but
+          potentially some sybils slip through; a lower one catches more sybils but more people appeal
+        - the remaining users a human reviewed (with a certainty), and the heuristic non sybils
+        - everyone else
+
+        returns:
+            an array with one of the rules above per row
+    '''
+    human = df['flag_type_y'] == 'Human'
+    heuristic = df['flag_type_x'] == 'Heuristic'
+    certainty = df['reviewer_is_certain (0/1)_y']
+    conditions = [
+        human & (certainty >= 0.99) & (df['is_sybil_y'] >= 0.99),
+        heuristic & (df['ml_score'] >= 0.99),
+        (df['flag_type_x'] == 'Prediction') & (df['ml_score'] >= 0.9),
+        human & certainty.notna(),
+        heuristic & (df['ml_score'] <= 0.01),
+    ]
+    return np.select(conditions, [HUMAN_SYBIL, HEURISTIC_SYBIL, PREDICTION_SYBIL, HUMAN_NON_SYBIL, HEURISTIC_NON_SYBIL],
+                     default=NON_SYBIL)
+
+
+def classify_handles(df):
+    '''
+        classifies every handle by the first rule any of its rows match, labeled and commented
+        from the first of those rows
+
+        returns:
+            (sybil_users, non_sybil_users) as [{'handle', 'label', 'comment'}]
+    '''
+    df = df.assign(rule=classify(df))
+    df = df[df['rule'] == df.groupby('handle')['rule'].transform('min')].drop_duplicates('handle')
+
+    sybil_users, non_sybil_users = [], []
+    for rule, rows in df.groupby('rule'):
+        is_sybil, label = RULES[rule]
+        records = rows[['handle', label, 'notes']].rename(columns={label: 'label', 'notes': 'comment'})
+        (sybil_users if is_sybil else non_sybil_users).extend(records.to_dict('records'))
+    return sybil_users, non_sybil_users
+
+
+def _batches(items, size=WRITE_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _profile_ids(handles):
+    from dashboard.models import Profile
+
+    profile_ids = {}
+    for batch in _batches(handles):
+        profile_ids.update(Profile.objects.filter(handle__in=batch).values_list('handle', 'pk'))
+    return profile_ids
+
+
+def discard_clr_states():
+    '''the incremental CLR state can't see squelches, make the next run of each active round rebuild it'''
+    from grants.clr_state import CLRRoundState
+    from grants.models import GrantCLR
+
+    keys = [CLRRoundState.redis_key(pk) for pk in GrantCLR.objects.filter(is_active=True).values_list('pk', flat=True)]
+    if keys:
+        RedisService().redis.delete(*keys)
+
+
+def toggle_user_sybil(sybil_users, non_sybil_users):
+    '''
+        marks users as sybil / not, with a handful of queries however many users are passed
+
+        sybil users without a squelch get one, non sybil users lose every squelch not added by hand
+
+        Args:
+            sybil_users         : [{'handle', 'label', 'comment'}], the first entry per handle wins
+            non_sybil_users     : [{'handle'}] or [{'id'}] (profile pk)
+
+        returns:
+            {'squelched': n, 'unsquelched': n, 'not_found': n}
+    '''
+    sybil_users = sybil_users or []
+    non_sybil_users = non_sybil_users or []
+
+    handles = {user.get('handle') for user in sybil_users + non_sybil_users if user.get('handle')}
+    profile_ids = _profile_ids(handles)
+    stats = {'squelched': 0, 'unsquelched': 0, 'not_found': len(handles - set(profile_ids))}
+
+    squelches = {}
+    for user in sybil_users:
+        profile_id = profile_ids.get(user.get('handle'))
+        label = user.get('label')
+        comment = user.get('comment')
+        if comment and pd.isna(comment):
+            comment = DEFAULT_COMMENT
+        if profile_id and label and comment and profile_id not in squelches:
+            squelches[profile_id] = SquelchProfile(profile_id=profile_id, label=label, comments=comment)
+
+    for batch in _batches(squelches):
+        squelched = set(SquelchProfile.objects.filter(profile_id__in=batch).values_list('profile_id', flat=True))
+        new = [squelches[profile_id] for profile_id in batch if profile_id not in squelched]
+        SquelchProfile.objects.bulk_create(new, batch_size=WRITE_BATCH_SIZE)
+        stats['squelched'] += len(new)
+
+    non_sybil_ids = {
+        profile_ids.get(user['handle']) if user.get('handle') else user.get('id') for user in non_sybil_users
+    }
+    non_sybil_ids.discard(None)
+    for batch in _batches(non_sybil_ids):
+        # squelches added by hand stay
+        unsquelched, _ = SquelchProfile.objects.filter(profile_id__in=batch).exclude(label='Manual').delete()
+        stats['unsquelched'] += unsquelched
+
+    if stats['not_found']:
+        logger.warning(f"bsci: {stats['not_found']} profiles not found")
+    if stats['squelched'] or stats['unsquelched']:
+        invalidate_model(SquelchProfile)
+        discard_clr_states()
+    return stats
+
+
+def bsci_script(csv):
+    '''
+        classifies the users of a bsci csv and squelches / unsquelches them
+
+        returns:
+            toggle_user_sybil's stats, or None when the csv couldn't be processed
+    '''
+    try:
+        sybil_users, non_sybil_users = classify_handles(pd.read_csv(csv))
+        return toggle_user_sybil(sybil_users, non_sybil_users)
+    except Exception as e:
+        logger.error(f'error: bsci_sybil_script - {e}')
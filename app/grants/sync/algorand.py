@@ -1,7 +1,6 @@
 from django.conf import settings
 
-import requests
-from grants.sync.helpers import record_contribution_activity, txn_already_used
+from grants.sync.helpers import explorer_get, record_contribution_activity, save_contribution, txn_already_used
 
 API_KEY = settings.ALGORAND_API_KEY
 
@@ -26,7 +25,7 @@ def get_algorand_txn_status_paid_explorer(contribution):
     }
 
     url = f'https://mainnet-algorand.api.purestake.io/idx2/v2/transactions/{txnid}'
-    response = requests.get(url=url, headers=headers).json()
+    response = explorer_get(url=url, headers=headers).json()
     
     if response:
         if response.get("current-round") and response.get("transaction"):
@@ -63,7 +62,7 @@ def get_algorand_txn_status(contribution):
 
     url = f'https://api.algoexplorer.io/v2/transactions/pending/{txnid}?format=json'
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     if response.get('confirmed-round') and response.get('txn') and response.get('txn').get('txn'):
         txn = response["txn"]['txn']
@@ -99,8 +98,8 @@ def sync_algorand_payout(contribution):
             contribution.tx_cleared = True
             contribution.checkout_type = 'alogrand_std'
             record_contribution_activity(contribution)
-            contribution.save()
+            save_contribution(contribution)
         else:
             contribution.success = True
             contribution.tx_cleared = False
-            contribution.save()
+            save_contribution(contribution)
@@ -1,5 +1,4 @@
-import requests
-from grants.sync.helpers import record_contribution_activity
+from grants.sync.helpers import explorer_post, record_contribution_activity, save_contribution
 
 
 def get_binance_txn_status(contribution):
@@ -24,7 +23,7 @@ def get_binance_txn_status(contribution):
             'Host': 'gitcoin.co'
         }
 
-        binance_response = requests.post(binance_url, json=data).json()
+        binance_response = explorer_post(binance_url, json=data).json()
 
         result = binance_response['result']
 
@@ -57,8 +56,8 @@ def sync_binance_payout(contribution):
                 contribution.tx_cleared = True
                 contribution.checkout_type = 'binance_std'
                 record_contribution_activity(contribution)
-                contribution.save()
+                save_contribution(contribution)
             elif status_description == 'expired':
                 contribution.success = True
                 contribution.tx_cleared = False
-                contribution.save()
+                save_contribution(contribution)
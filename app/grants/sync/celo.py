@@ -1,5 +1,6 @@
-import requests
-from grants.sync.helpers import is_txn_done_recently, record_contribution_activity, txn_already_used
+from grants.sync.helpers import (
+    explorer_get, is_txn_done_recently, record_contribution_activity, save_contribution, txn_already_used,
+)
 
 
 def find_txn_on_celo_explorer(contribution):
@@ -19,7 +20,7 @@ def find_txn_on_celo_explorer(contribution):
     amount = subscription.amount_per_period
 
     blockscout_url = f'https://explorer.celo.org/api?module=account&action=tokentx&address={to_address}'
-    blockscout_response = requests.get(blockscout_url).json()
+    blockscout_response = explorer_get(blockscout_url).json()
 
     if blockscout_response['message'] and blockscout_response['result']:
         for txn in blockscout_response['result']:
@@ -40,7 +41,7 @@ def get_celo_txn_status(txnid):
 
     blockscout_url = f'https://explorer.celo.org/api?module=transaction&action=gettxinfo&txhash={txnid}'
 
-    blockscout_response = requests.get(blockscout_url).json()
+    blockscout_response = explorer_get(blockscout_url).json()
 
     if blockscout_response['status'] and blockscout_response['result']:
 
@@ -66,7 +67,7 @@ def sync_celo_payout(contribution):
         txn = find_txn_on_celo_explorer(contribution)
         if txn:
             contribution.tx_id = txn
-            contribution.save()
+            save_contribution(contribution)
             
     if contribution.tx_id and contribution.tx_id != '0x0':
         is_successfull_txn = get_celo_txn_status(contribution.tx_id)
@@ -76,4 +77,4 @@ def sync_celo_payout(contribution):
             contribution.tx_cleared = True
             contribution.checkout_type = 'celo_std'
             record_contribution_activity(contribution)
-            contribution.save()
+            save_contribution(contribution)
@@ -0,0 +1,193 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+from grants.sync.helpers import record_contribution_activity, set_tenant_sync
+
+logger = logging.getLogger(__name__)
+
+# workers checking a tenant's contributions at once, explorer requests per second across them,
+# and seconds each explorer request may take
+TenantPolicy = namedtuple('TenantPolicy', ['workers', 'requests_per_second', 'timeout'])
+
+DEFAULT_POLICY = TenantPolicy(workers=4, requests_per_second=5, timeout=15)
+TENANT_POLICIES = {
+    # viewblock rate limits its api keys, the checker used to sleep half a second per contribution
+    'ZIL': TenantPolicy(workers=2, requests_per_second=2, timeout=15),
+}
+
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1 / per_second seconds apart, across threads."""
+
+    def __init__(self, per_second):
+        self.interval = 1 / per_second if per_second else 0
+        self.lock = threading.Lock()
+        self.next_at = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class TxnClaims:
+    """
+    The transactions matched to a contribution during a sweep. Its contributions are only saved
+    once it ends, so txn_already_used can't see these in the db yet.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners = {}
+
+    def claim(self, tx_id, token_symbol, contribution):
+        """returns whether contribution may use the transaction, claiming it if nobody has"""
+        with self.lock:
+            return self.owners.setdefault((tx_id, token_symbol), id(contribution)) == id(contribution)
+
+
+class TenantSync:
+    """The contributions of one tenant being checked, and what the checks changed."""
+
+    def __init__(self, tenant, policy, claims=None):
+        self.tenant = tenant
+        self.policy = policy
+        self.timeout = policy.timeout
+        self.limiter = RateLimiter(policy.requests_per_second)
+        self.claims = claims or TxnClaims()
+        self.lock = threading.Lock()
+        self.changed = {}
+        self.activities = []
+        self.checked = 0
+        self.errors = 0
+        self.seconds = 0
+
+    def throttle(self):
+        self.limiter.wait()
+
+    def save(self, contribution):
+        with self.lock:
+            self.changed[id(contribution)] = contribution
+
+    def record_activity(self, contribution):
+        with self.lock:
+            self.activities.append(contribution)
+
+    def check(self, checker, contribution):
+        set_tenant_sync(self, contribution)
+        try:
+            checker(contribution)
+        except Exception as e:
+            logger.warning(f'could not sync {self.tenant} contribution {contribution.pk}: {e}')
+            with self.lock:
+                self.errors += 1
+        finally:
+            set_tenant_sync(None)
+        with self.lock:
+            self.checked += 1
+
+    def work(self, checker, pending):
+        """checks contributions off the pending queue until it is empty"""
+        try:
+            while True:
+                try:
+                    contribution = pending.get_nowait()
+                except queue.Empty:
+                    return
+                self.check(checker, contribution)
+        finally:
+            # worker threads open their own db connection, don't leave it behind
+            connection.close()
+
+    def run(self, checker, contributions):
+        start = time.monotonic()
+        if contributions:
+            pending = queue.Queue()
+            for contribution in contributions:
+                pending.put(contribution)
+            num_workers = min(self.policy.workers, len(contributions))
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                workers = [pool.submit(self.work, checker, pending) for _ in range(num_workers)]
+                for worker in workers:
+                    worker.result()
+        self.seconds = time.monotonic() - start
+        return self
+
+    @property
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'changed': len(self.changed),
+            'errors': self.errors,
+            'seconds': round(self.seconds, 2),
+            'per_second': round(self.checked / self.seconds, 2) if self.seconds else 0,
+        }
+
+
+def commit_changes(tenant_syncs):
+    """
+    saves every changed contribution, each in its own transaction so that one failing save
+    doesn't roll back the others, then records the activities of the saved ones
+    """
+    for tenant_sync in tenant_syncs:
+        failed = set()
+        for key, contribution in list(tenant_sync.changed.items()):
+            try:
+                with transaction.atomic():
+                    contribution.save()
+            except Exception as e:
+                logger.warning(f'could not save {tenant_sync.tenant} contribution {contribution.pk}: {e}')
+                del tenant_sync.changed[key]
+                tenant_sync.errors += 1
+                failed.add(key)
+
+        for contribution in tenant_sync.activities:
+            if id(contribution) not in failed:
+                record_contribution_activity(contribution)
+
+
+def sync_pending_contributions(contributions_by_tenant, checkers=None, policies=None):
+    """
+    checks every tenant's pending contributions at once, each tenant on its own worker pool and
+    rate limit so that a slow explorer only holds up its own tenant
+
+    Args:
+        contributions_by_tenant : {tenant: [Contribution]}
+        checkers                : {tenant: checker}, defaults to the sync_*_payout of each tenant.
+                                  checkers change the contribution and hand it to save_contribution
+        policies                : {tenant: TenantPolicy}, defaults to TENANT_POLICIES
+
+    returns:
+        {tenant: {'checked', 'changed', 'errors', 'seconds', 'per_second'}}
+    """
+    if checkers is None:
+        from grants.utils import tenant_payout_mapper
+        checkers = tenant_payout_mapper
+    policies = TENANT_POLICIES if policies is None else policies
+
+    claims = TxnClaims()
+    tenant_syncs = [
+        TenantSync(tenant, policies.get(tenant, DEFAULT_POLICY), claims) for tenant in contributions_by_tenant
+    ]
+    if not tenant_syncs:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(tenant_syncs)) as pool:
+        futures = [
+            pool.submit(tenant_sync.run, checkers[tenant_sync.tenant], contributions_by_tenant[tenant_sync.tenant])
+            for tenant_sync in tenant_syncs
+        ]
+        for future in futures:
+            future.result()
+
+    commit_changes(tenant_syncs)
+    return {tenant_sync.tenant: tenant_sync.stats for tenant_sync in tenant_syncs}
@@ -1,5 +1,4 @@
-import requests
-from grants.sync.helpers import record_contribution_activity, txn_already_used
+from grants.sync.helpers import explorer_get, record_contribution_activity, save_contribution, txn_already_used
 
 
 def find_txn_on_harmony_explorer(contribution):
@@ -20,7 +19,7 @@ def find_txn_on_harmony_explorer(contribution):
 
     url = f'https://explorer.hmny.io:8888/address?id={to_address}&pageIndex=0&pageSize=20'
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
     if (
         response and
         'address' in response and
@@ -56,7 +55,7 @@ def get_harmony_txn_status(contribution, network='mainnet'):
     url = f'https://explorer.hmny.io:8888/tx?id={txnid}'
 
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
     if (response and 'tx' in response):
         tx = response['tx']
 
@@ -82,7 +81,7 @@ def sync_harmony_payout(contribution):
         txn = find_txn_on_harmony_explorer(contribution)
         if txn:
             contribution.tx_id = txn['hash']
-            contribution.save()
+            save_contribution(contribution)
             
     if contribution.tx_id and contribution.tx_id != '0x0':
         txn_status = get_harmony_txn_status(contribution)
@@ -92,8 +91,8 @@ def sync_harmony_payout(contribution):
             contribution.tx_cleared = True
             contribution.checkout_type = 'harmony_std'
             record_contribution_activity(contribution)
-            contribution.save()
+            save_contribution(contribution)
         else:
             contribution.success = True
             contribution.tx_cleared = False
-            contribution.save()
+            save_contribution(contribution)
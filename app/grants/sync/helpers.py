@@ -1,13 +1,57 @@
 
 import logging
+import threading
 from datetime import datetime
 
 from django.utils import timezone
 
+import requests
 from townsquare.models import Comment
 
 logger = logging.getLogger(__name__)
 
+# seconds an explorer request may take outside of a sync sweep
+EXPLORER_TIMEOUT = 30
+
+# the grants.sync.engine.TenantSync the current thread is checking contributions for, if any,
+# and the contribution it is checking
+_sync = threading.local()
+
+
+def get_tenant_sync():
+    return getattr(_sync, 'tenant_sync', None)
+
+
+def set_tenant_sync(tenant_sync, contribution=None):
+    _sync.tenant_sync = tenant_sync
+    _sync.contribution = contribution
+
+
+def explorer_request(method, url, **kwargs):
+    """requests.request, throttled and timed out per tenant when called from a sync sweep"""
+    tenant_sync = get_tenant_sync()
+    if tenant_sync:
+        tenant_sync.throttle()
+    kwargs.setdefault('timeout', tenant_sync.timeout if tenant_sync else EXPLORER_TIMEOUT)
+    return requests.request(method, url, **kwargs)
+
+
+def explorer_get(url, **kwargs):
+    return explorer_request('get', url, **kwargs)
+
+
+def explorer_post(url, **kwargs):
+    return explorer_request('post', url, **kwargs)
+
+
+def save_contribution(contribution):
+    """saves the contribution, or leaves it to the sweep to save with the rest of its changes"""
+    tenant_sync = get_tenant_sync()
+    if tenant_sync:
+        tenant_sync.save(contribution)
+    else:
+        contribution.save()
+
 
 def is_txn_done_recently(time_of_txn, before_hours=500):
     if not time_of_txn:
@@ -25,15 +69,28 @@ def is_txn_done_recently(time_of_txn, before_hours=500):
 def txn_already_used(txn, token_symbol):
     from grants.models import Contribution
 
-    return Contribution.objects.filter(
+    if Contribution.objects.filter(
         tx_id = txn,
         subscription__token_symbol = token_symbol,
         success=True,
         tx_cleared=True
-    ).exists()
+    ).exists():
+        return True
+
+    tenant_sync = get_tenant_sync()
+    if tenant_sync:
+        # a sweep saves its contributions once it ends, so a transaction matched earlier in it isn't in the db yet
+        return not tenant_sync.claims.claim(txn, token_symbol, _sync.contribution)
+    return False
 
 
 def record_contribution_activity(contribution):
+    tenant_sync = get_tenant_sync()
+    if tenant_sync:
+        # recorded once the sweep has saved the contribution
+        tenant_sync.record_activity(contribution)
+        return
+
     from dashboard.models import Activity
     from marketing.mails import thank_you_for_supporting
 
@@ -1,7 +1,6 @@
 import logging
 
-import requests
-from grants.sync.helpers import record_contribution_activity
+from grants.sync.helpers import explorer_get, record_contribution_activity, save_contribution
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +32,7 @@ def get_polkadot_txn_status(contribution, network='mainnet'):
             polkascan_url = f'https://explorer-32.polkascan.io/api/v1/kusama/extrinsic/{txnid}'
 
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0. 2272.118 Safari/537.36.'}
-        polkascan_response = requests.get(polkascan_url, headers=headers).json()
+        polkascan_response = explorer_get(polkascan_url, headers=headers).json()
 
         if polkascan_response:
             status = polkascan_response.get('data').get('attributes')
@@ -58,8 +57,8 @@ def sync_polkadot_payout(contribution):
                 contribution.tx_cleared = True
                 contribution.checkout_type = 'polkadot_std'
                 record_contribution_activity(contribution)
-                contribution.save()
+                save_contribution(contribution)
             elif txn_status.get('status') == 'expired':
                 contribution.tx_cleared = True
                 contribution.success = False
-                contribution.save()
+                save_contribution(contribution)
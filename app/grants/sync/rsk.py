@@ -1,5 +1,4 @@
-import requests
-from grants.sync.helpers import record_contribution_activity, txn_already_used
+from grants.sync.helpers import explorer_get, record_contribution_activity, save_contribution, txn_already_used
 
 
 def find_txn_on_rsk_explorer(contribution):
@@ -19,7 +18,7 @@ def find_txn_on_rsk_explorer(contribution):
     # amount = subscription.amount_per_period
 
     url = f'https://blockscout.com/rsk/mainnet/api?module=account&action=txlist&address={to_address}'
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
     if (
         response and
         response['message'] and
@@ -59,7 +58,7 @@ def get_rsk_txn_status(contribution, network='mainnet'):
 
     url = f'https://blockscout.com/rsk/mainnet/api?module=transaction&action=gettxinfo&txhash={txnid}'
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     if response['status'] and response['result']:
         txn = response['result']
@@ -86,7 +85,7 @@ def sync_rsk_payout(contribution):
         txn = find_txn_on_rsk_explorer(contribution)
         if txn:
             contribution.tx_id = txn['hash']
-            contribution.save()
+            save_contribution(contribution)
 
     if contribution.tx_id and contribution.tx_id != '0x0':
         txn_status = get_rsk_txn_status(contribution)
@@ -96,8 +95,8 @@ def sync_rsk_payout(contribution):
             contribution.tx_cleared = True
             contribution.checkout_type = 'rsk_std'
             record_contribution_activity(contribution)
-            contribution.save()
+            save_contribution(contribution)
         else:
             contribution.success = True
             contribution.tx_cleared = False
-            contribution.save()
+            save_contribution(contribution)
@@ -1,5 +1,6 @@
-import requests
-from grants.sync.helpers import is_txn_done_recently, record_contribution_activity, txn_already_used
+from grants.sync.helpers import (
+    explorer_get, is_txn_done_recently, record_contribution_activity, save_contribution, txn_already_used,
+)
 
 
 def find_txn_on_zcash_explorer(contribution):
@@ -19,7 +20,7 @@ def find_txn_on_zcash_explorer(contribution):
     amount = subscription.amount_per_period
 
     url = f'https://sochain.com/api/v2/address/ZEC/{from_address}'
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     # Check contributors txn history
     if response['status'] == 'success' and response['data'] and response['data']['txs']:
@@ -48,7 +49,7 @@ def find_txn_on_zcash_explorer(contribution):
 
 
     url = f'https://sochain.com/api/v2/address/ZEC/{to_address}'
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     # Check funders txn history
     # if response['status'] == 'success' and response['data'] and response['data']['txs']:
@@ -72,7 +73,7 @@ def is_zcash_txn_successful(txnid):
 
     url = f'https://sochain.com/api/v2/is_tx_confirmed/ZEC/{txnid}'
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     if (
         response['status'] == 'success' and
@@ -100,7 +101,7 @@ def is_valid_zcash_txn(contribution):
 
     url = f'https://sochain.com/api/v2/tx/ZEC/{txn_id}'
 
-    response = requests.get(url).json()
+    response = explorer_get(url).json()
 
     if (
         response['status'] == 'success' and
@@ -127,7 +128,7 @@ def sync_zcash_payout(contribution):
         txn = find_txn_on_zcash_explorer(contribution)
         if txn:
             contribution.tx_id = txn
-            contribution.save()
+            save_contribution(contribution)
             is_successfull_txn = is_zcash_txn_successful(contribution.tx_id)
     else:
         # user entered txn-id or txn-id picked up by cron.
@@ -138,4 +139,4 @@ def sync_zcash_payout(contribution):
         contribution.tx_cleared = True
         contribution.checkout_type = 'zcash_std'
         record_contribution_activity(contribution)
-        contribution.save()
+        save_contribution(contribution)
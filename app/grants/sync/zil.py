@@ -1,9 +1,8 @@
-import time
-
 from django.conf import settings
 
-import requests
-from grants.sync.helpers import is_txn_done_recently, record_contribution_activity, txn_already_used
+from grants.sync.helpers import (
+    explorer_get, is_txn_done_recently, record_contribution_activity, save_contribution, txn_already_used,
+)
 
 headers = {
     "X-APIKEY" : settings.VIEW_BLOCK_API_KEY
@@ -28,7 +27,7 @@ def find_txn_on_zil_explorer(contribution):
     amount = subscription.amount_per_period
 
     url = f'https://api.viewblock.io/v1/zilliqa/addresses/{to_address}/txs?network=mainnet'
-    response = requests.get(url, headers=headers).json()
+    response = explorer_get(url, headers=headers).json()
 
     if len(response):
         for txn in response:
@@ -49,7 +48,7 @@ def get_zil_txn_status(txnid, network='mainnet'):
         return None
 
     url = f'https://api.viewblock.io/v1/zilliqa/txs/{txnid}?network={network}'
-    view_block_response = requests.get(url, headers=headers).json()
+    view_block_response = explorer_get(url, headers=headers).json()
     if view_block_response:
 
         response = {
@@ -67,13 +66,11 @@ def get_zil_txn_status(txnid, network='mainnet'):
 
 
 def sync_zil_payout(contribution):
-    time.sleep(0.5) # to avoid rate limit
-
     if not contribution.tx_id or contribution.tx_id == '0x0':
         txn = find_txn_on_zil_explorer(contribution)
         if txn:
             contribution.tx_id = txn
-            contribution.save()
+            save_contribution(contribution)
             
     if contribution.tx_id and contribution.tx_id != '0x0':
         txn_status = get_zil_txn_status(contribution.tx_id)
@@ -83,4 +80,4 @@ def sync_zil_payout(contribution):
             contribution.tx_cleared = True
             contribution.checkout_type = 'zil_std'
             record_contribution_activity(contribution)
-            contribution.save()
+            save_contribution(contribution)
@@ -13,8 +13,10 @@
 from celery import app
 from celery.utils.log import get_task_logger
 from dashboard.models import Profile
+from grants.metadata_queue import request_metadata_refresh
 from grants.models import Grant, GrantCLR, GrantCollection, Subscription
-from grants.utils import bsci_script, get_clr_rounds_metadata, save_grant_to_notion
+from grants.sybil import bsci_script
+from grants.utils import get_clr_rounds_metadata, save_grant_to_notion
 from marketing.mails import (
     new_contributions, new_grant, new_grant_admin, notion_failure_email, thank_you_for_supporting,
 )
@@ -159,6 +161,26 @@ def update_grant_metadata(self, grant_id, retry: bool = True) -> None:
     instance.save()
 
 
+@app.shared_task(bind=True, soft_time_limit=600, time_limit=660, max_retries=1)
+def batch_update_grant_metadata(self, grant_ids, retry: bool = True) -> None:
+    """
+    update_grant_metadata for many grants, with grouped queries and bulk writes
+
+    :param self:
+    :param grant_ids:
+    :return:
+    """
+    if settings.FLUSH_QUEUE:
+        return
+
+    from grants.grant_metadata import update_grants_metadata
+    from grants.metadata_queue import record_executed_refreshes
+
+    network = 'rinkeby' if settings.DEBUG else 'mainnet'
+    # grants deleted since they were queued aren't refreshed
+    record_executed_refreshes(len(update_grants_metadata(grant_ids, network)))
+
+
 @app.shared_task(bind=True, max_retries=1)
 def process_grant_contribution(self, grant_id, grant_slug, profile_id, package, send_supporter_mail:bool = True, retry: bool = True):
     """
@@ -265,7 +287,7 @@ def process_grant_contribution(self, grant_id, grant_slug, profile_id, package,
             except Exception as e:
                 logger.exception(e)
 
-        update_grant_metadata.delay(grant_id)
+        request_metadata_refresh(grant_id)
         return grant, subscription
 
 
@@ -350,9 +372,14 @@ def recalc_clr(self, grant_id, grant_clr, retry: bool = True) -> None:
 
 
 @app.shared_task(bind=True, max_retries=1)
-def process_predict_clr(self, save_to_db, from_date, clr_round, network, what) -> None:
+def process_predict_clr(self, save_to_db, from_date, clr_round, network, what, use_sql=False, engine='sparse', processes=1, use_snapshot=False) -> None:
     from grants.clr import predict_clr
 
+    # when queued (see grants.clr_scheduler) the round is passed by pk
+    if not isinstance(clr_round, GrantCLR):
+        clr_round = GrantCLR.objects.get(pk=clr_round)
+    from_date = from_date or timezone.now()
+
     print(f"CALCULATING CLR estimates for ROUND: {clr_round.round_num} {clr_round.sub_round_slug}")
 
     predict_clr(
@@ -361,6 +388,10 @@ def process_predict_clr(self, save_to_db, from_date, clr_round, network, what) -
         clr_round,
         network,
         what=what,
+        use_sql=use_sql,
+        engine=engine,
+        processes=processes,
+        use_snapshot=use_snapshot,
     )
 
     print(f"finished CLR estimates for {clr_round.round_num} {clr_round.sub_round_slug}")
@@ -0,0 +1,36 @@
+import random
+from collections import Counter
+
+from django.core.management import call_command
+
+import pytest
+from grants.management.commands.grant_vitalik_shuffle import DEFAULT_SHUFFLE, weighted_shuffle
+from grants.models import Grant
+from grants.tests.factories import GrantCLRFactory, GrantFactory
+
+
+def test_weighted_shuffle_puts_heavier_items_first_in_proportion():
+    rng = random.Random(0)
+    items = [['a', 1], ['b', 3], ['c', 6]]
+
+    firsts = Counter(weighted_shuffle(items, rng)[0] for x in range(0, 20000))
+
+    assert sorted(weighted_shuffle(items, rng)) == ['a', 'b', 'c']
+    assert abs(firsts['a'] / 20000 - 0.1) < 0.01
+    assert abs(firsts['b'] / 20000 - 0.3) < 0.015
+    assert abs(firsts['c'] / 20000 - 0.6) < 0.015
+
+
+@pytest.mark.django_db
+def test_grant_vitalik_shuffle_ranks_clr_grants_and_defaults_the_rest():
+    GrantCLRFactory(is_active=True)
+    clr_grants = GrantFactory.create_batch(3)
+    other_grant = GrantFactory()
+    curve = [[0.0, 50.0, 0.0], [1.0, 51.0, 1.0], [10.0, 52.0, 2.0], [100.0, 53.0, 3.0], [1000.0, 54.0, 4.0], [10000.0, 55.0, 5.0]]
+    Grant.objects.filter(pk__in=[grant.pk for grant in clr_grants]).update(clr_prediction_curve=curve, is_clr_active=True)
+
+    call_command('grant_vitalik_shuffle')
+
+    ranks = Grant.objects.filter(pk__in=[grant.pk for grant in clr_grants]).values_list('weighted_shuffle', flat=True)
+    assert sorted(ranks) == [0, 1, 2]
+    assert Grant.objects.get(pk=other_grant.pk).weighted_shuffle == DEFAULT_SHUFFLE
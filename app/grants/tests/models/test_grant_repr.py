@@ -0,0 +1,64 @@
+from django.contrib.auth.models import AnonymousUser, User
+
+import pytest
+from dashboard.tests.factories import ProfileFactory
+from grants.models import Grant, GrantTag
+from grants.tests.factories import GrantFactory
+from townsquare.models import Favorite
+
+
+def build_absolute_uri(path):
+    return f'http://testserver{path}'
+
+
+@pytest.mark.django_db
+class TestGrantReprBatch:
+    """Test Grant.repr_batch."""
+
+    def make_grants(self, count, team_member=None):
+        tag = GrantTag.objects.create(name='batch-repr')
+        grants = []
+        for x in range(0, count):
+            grant = GrantFactory(admin_profile=ProfileFactory())
+            grant.tags.add(tag)
+            grant.team_members.add(team_member or ProfileFactory())
+            grants.append(grant)
+        return grants
+
+    def test_repr_batch_matches_repr_for_anonymous_users(self):
+        """Test the batch output is identical to calling repr on each grant."""
+
+        grants = self.make_grants(3)
+        user = AnonymousUser()
+
+        expected = [Grant.objects.get(pk=grant.pk).repr(user, build_absolute_uri) for grant in grants]
+        page = Grant.objects.filter(pk__in=[grant.pk for grant in grants]).order_by('pk')
+
+        assert Grant.repr_batch(page, user, build_absolute_uri) == expected
+
+    def test_repr_batch_matches_repr_for_favorites_and_team_members(self):
+        """Test favorites and team membership are resolved for the requesting user."""
+
+        user = User.objects.create(username='batch_repr')
+        profile = ProfileFactory(user=user, handle='batch_repr')
+        grants = self.make_grants(2)
+        grants[0].team_members.add(profile)
+        Favorite.objects.create(user=user, grant=grants[1])
+
+        expected = [Grant.objects.get(pk=grant.pk).repr(user, build_absolute_uri) for grant in grants]
+        actual = Grant.repr_batch([Grant.objects.get(pk=grant.pk) for grant in grants], user, build_absolute_uri)
+
+        assert actual == expected
+        assert actual[0]['is_on_team'] and not actual[0]['favorite']
+        assert actual[1]['favorite'] and not actual[1]['is_on_team']
+
+    def test_repr_batch_uses_a_fixed_number_of_queries(self, django_assert_max_num_queries):
+        """Test the number of queries doesn't grow with the number of grants."""
+
+        user = User.objects.create(username='batch_repr')
+        ProfileFactory(user=user, handle='batch_repr')
+        grants = self.make_grants(12)
+        user = User.objects.get(pk=user.pk)
+
+        with django_assert_max_num_queries(10):
+            Grant.repr_batch(Grant.objects.filter(pk__in=[grant.pk for grant in grants]).nocache(), user, build_absolute_uri)
@@ -0,0 +1,282 @@
+import copy
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from grants.clr import calculate_clr, calculate_clr_for_prediction, get_totals_by_pair, normalise, populate_data_for_clr
+from grants.clr_benchmark import SyntheticRound
+from grants.clr_data_src import (
+    SUMMED_CONTRIBUTIONS_SQL, fetch_summed_contribution_matrix, fetch_summed_contributions, stream_summed_contributions,
+)
+from grants.clr_engine import ContributionMatrix, calculate_clr_sparse, calculate_clr_totals, cap_matches
+from grants.clr_prediction import MatchPredictor, get_contributor_vector
+from grants.clr_scheduler import partition_grant_ids, predict_curves
+from grants.clr_snapshot import RoundSnapshot
+from grants.clr_state import CLRRoundState
+
+
+@pytest.fixture
+def round_data():
+    curr_agg = {
+        1: {'10': 5.0, '11': 20.0, '12': 1.0},
+        2: {'10': 50.0, '13': 2.5},
+        3: {'11': 3.0, '12': 7.0, '13': 0.5, '14': 100.0},
+        4: {'14': 12.0},
+    }
+    trust_dict = {'10': 1.0, '11': 1.5, '12': 0.5, '13': 1.0, '14': 1.2}
+    return curr_agg, trust_dict
+
+
+def test_calculate_clr_sparse_matches_dict_engine(round_data):
+    curr_agg, trust_dict = round_data
+
+    pair_totals = get_totals_by_pair(curr_agg)
+    bigtot, totals = calculate_clr(curr_agg, trust_dict, pair_totals, 25.0, 1000.0)
+    sparse_bigtot, sparse_totals = calculate_clr_sparse(curr_agg, trust_dict, 25.0, 1000.0)
+
+    assert sparse_bigtot == pytest.approx(bigtot)
+    assert sparse_totals.keys() == totals.keys()
+    for grant_id, total in totals.items():
+        assert sparse_totals[grant_id]['clr_amount'] == pytest.approx(total['clr_amount'])
+        assert sparse_totals[grant_id]['number_contributions'] == total['number_contributions']
+        assert sparse_totals[grant_id]['contribution_amount'] == pytest.approx(total['contribution_amount'])
+
+
+def test_calculate_clr_sparse_single_contributor_gets_no_match(round_data):
+    curr_agg, trust_dict = round_data
+
+    _, sparse_totals = calculate_clr_sparse(curr_agg, trust_dict, 25.0, 1000.0)
+
+    assert sparse_totals[4]['clr_amount'] == 0
+
+
+def test_clr_round_state_apply_contribution_matches_full_recalc(round_data):
+    curr_agg, trust_dict = round_data
+    pair_totals = get_totals_by_pair(curr_agg)
+    _, totals = calculate_clr(curr_agg, trust_dict, pair_totals, 25.0, 1000.0)
+    state = CLRRoundState(1, 25.0, {}, curr_agg, dict(trust_dict), pair_totals, totals, [])
+
+    state.apply_contribution(1, '13', 10.0, 1.0)
+    state.apply_contribution(4, '10', 3.0, 1.0)
+    state.apply_contribution(5, '15', 8.0, 0.8)
+
+    expected_agg = {
+        1: {'10': 5.0, '11': 20.0, '12': 1.0, '13': 10.0},
+        2: {'10': 50.0, '13': 2.5},
+        3: {'11': 3.0, '12': 7.0, '13': 0.5, '14': 100.0},
+        4: {'14': 12.0, '10': 3.0},
+        5: {'15': 8.0},
+    }
+    expected_trust = dict(trust_dict, **{'15': 0.8})
+    expected_pairs = get_totals_by_pair(expected_agg)
+    expected_bigtot, expected_totals = calculate_clr(expected_agg, expected_trust, expected_pairs, 25.0, 1000.0)
+
+    assert state.bigtot == pytest.approx(expected_bigtot)
+    for grant_id, total in expected_totals.items():
+        assert state.totals[grant_id]['clr_amount'] == pytest.approx(total['clr_amount'])
+        assert state.totals[grant_id]['number_contributions'] == total['number_contributions']
+
+
+@pytest.mark.parametrize('total_pot,match_cap_per_grant', [(1000.0, 1000.0), (50.0, 20.0), (5000.0, 100.0)])
+def test_match_predictor_matches_calculate_clr_for_prediction(round_data, total_pot, match_cap_per_grant):
+    curr_agg, trust_dict = round_data
+    pair_totals = get_totals_by_pair(curr_agg)
+    bigtot, totals = calculate_clr(curr_agg, trust_dict, pair_totals, 25.0, total_pot)
+    predictor = MatchPredictor.from_totals(1, totals, 25.0, total_pot, match_cap_per_grant)
+
+    for grant_id, contribz in curr_agg.items():
+        amounts, trust = get_contributor_vector(contribz, trust_dict)
+        for amount in [1, 10, 100]:
+            _, expected, _, _ = calculate_clr_for_prediction(
+                bigtot, totals, curr_agg, trust_dict, 25.0, total_pot, grant_id, amount, match_cap_per_grant
+            )
+            assert predictor.predict(grant_id, amounts, trust, amount) == pytest.approx(expected)
+
+
+def test_match_predictor_zero_amount_is_current_distribution(round_data):
+    curr_agg, trust_dict = round_data
+    pair_totals = get_totals_by_pair(curr_agg)
+    bigtot, totals = calculate_clr(curr_agg, trust_dict, pair_totals, 25.0, 50.0)
+    predictor = MatchPredictor.from_totals(1, totals, 25.0, 50.0, 20.0)
+    curr_grants_clr = normalise(bigtot, totals, 50.0, 20.0)
+
+    amounts, trust = get_contributor_vector(curr_agg[3], trust_dict)
+
+    assert predictor.predict(3, amounts, trust, 0) == pytest.approx(curr_grants_clr[3]['clr_amount'])
+
+
+def test_cap_matches_spreads_remainder_until_no_grant_exceeds_cap():
+    matches = np.array([50.0, 30.0, 10.0, 6.0, 4.0])
+
+    capped = cap_matches(matches, 25.0, True)
+
+    # 50 and 30 cap, spreading their 30 over the other 20 takes 10 up to the cap too
+    assert capped == pytest.approx([25.0, 25.0, 25.0, 15.0, 10.0])
+    assert capped.sum() == pytest.approx(matches.sum())
+
+
+def test_cap_matches_keeps_remainder_when_only_zero_matches_are_left():
+    matches = np.array([10.0, 5.0, 0.0])
+
+    capped = cap_matches(matches, 4.0, True)
+
+    assert list(capped) == [4.0, 4.0, 0.0]
+
+
+def test_cap_matches_does_not_spread_unsaturated_rounds():
+    matches = np.array([10.0, 5.0, 1.0])
+
+    assert list(cap_matches(matches, 4.0, False)) == [4.0, 4.0, 1.0]
+
+
+def test_partition_grant_ids_is_sorted_and_complete():
+    partitions = partition_grant_ids([5, 3, 9, 1, 7], 2)
+
+    assert partitions == [[1, 3, 5], [7, 9]]
+    assert partition_grant_ids([], 4) == []
+
+
+def test_predict_curves_process_pool_matches_inline(round_data):
+    curr_agg, trust_dict = round_data
+    pair_totals = get_totals_by_pair(curr_agg)
+    _, totals = calculate_clr(curr_agg, trust_dict, pair_totals, 25.0, 50.0)
+    predictor = MatchPredictor.from_totals(1, totals, 25.0, 50.0, 20.0)
+    vectors = {grant_id: get_contributor_vector(contribz, trust_dict) for grant_id, contribz in curr_agg.items()}
+    grant_ids = [4, 3, 2, 1, 99]
+
+    inline = predict_curves(predictor, vectors, grant_ids)
+    pooled = predict_curves(predictor, vectors, grant_ids, processes=2)
+
+    assert list(pooled.keys()) == [1, 2, 3, 4, 99]
+    assert pooled == inline
+    assert inline[99] == [0.0] * 6
+
+
+def test_round_snapshot_round_trips_through_memory_map(settings, tmp_path):
+    settings.CLR_SNAPSHOT_DIR = str(tmp_path)
+    curr_agg = {1: {10: 5.0, 11: 20.0}, 2: {10: 50.0}}
+    trust_dict = {10: 1.0, 11: 1.5}
+
+    RoundSnapshot.from_agg(1, 'mainnet', curr_agg, trust_dict).save()
+    snapshot = RoundSnapshot.load(1, 'mainnet')
+
+    assert isinstance(snapshot.amounts, np.memmap)
+    assert snapshot.to_agg() == (curr_agg, trust_dict)
+    assert RoundSnapshot.load(1, 'rinkeby') is None
+
+
+def test_round_snapshot_save_replaces_previous_snapshot(settings, tmp_path):
+    settings.CLR_SNAPSHOT_DIR = str(tmp_path)
+    RoundSnapshot.from_agg(1, 'mainnet', {1: {10: 5.0}}, {10: 1.0}).save()
+    RoundSnapshot.from_agg(1, 'mainnet', {2: {11: 7.0}}, {11: 0.5}).save()
+
+    assert RoundSnapshot.load(1, 'mainnet').to_agg() == ({2: {11: 7.0}}, {11: 0.5})
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_synthetic_round_is_reproducible_and_feeds_the_clr_pipeline():
+    synthetic_round = SyntheticRound(num_grants=10, num_contributors=50, num_contributions=300, sybil_rate=0.5, seed=3)
+    same_round = SyntheticRound(num_grants=10, num_contributors=50, num_contributions=300, sybil_rate=0.5, seed=3)
+
+    assert synthetic_round.contributions.count() == 300
+    assert synthetic_round.townsquare_data() == same_round.townsquare_data()
+    assert min(c.amount_per_period_usdt for c in synthetic_round.contributions) >= 1
+    assert all(0.5 <= profile.trust_bonus <= 1.5 for profile in synthetic_round.profiles)
+
+    grant_contributions = populate_data_for_clr(
+        synthetic_round.grants, synthetic_round.contributions, synthetic_round.clr_round
+    )
+    assert sum(len(g['contributions']) for g in grant_contributions) > 0
+
+
+def test_contribution_matrix_adapters_agree(round_data):
+    curr_agg, trust_dict = round_data
+    rows = [[grant_id, user_id, amount] for grant_id, contribz in curr_agg.items() for user_id, amount in contribz.items()]
+    # a repeat contribution is summed into the contributor's aggregate
+    rows[0:1] = [[rows[0][0], rows[0][1], rows[0][2] / 2]] * 2
+
+    _, from_agg = calculate_clr_totals(ContributionMatrix.from_agg(curr_agg, trust_dict), 25.0)
+    _, from_rows = calculate_clr_totals(ContributionMatrix.from_rows(rows, trust_dict), 25.0)
+
+    for grant_id, total in from_agg.items():
+        assert from_rows[grant_id]['clr_amount'] == pytest.approx(total['clr_amount'])
+        assert from_rows[grant_id]['number_contributions'] == total['number_contributions']
+
+
+def test_contribution_matrix_with_contribution_matches_rebuilt_round(round_data):
+    curr_agg, trust_dict = round_data
+    matrix = ContributionMatrix.from_agg(curr_agg, trust_dict)
+
+    updated = copy.deepcopy(curr_agg)
+    updated[4]['10'] = 3.0
+    updated[4]['15'] = 8.0
+    expected_trust = dict(trust_dict, **{'15': 1.0})
+
+    _, expected = calculate_clr_totals(ContributionMatrix.from_agg(updated, expected_trust), 25.0)
+    _, actual = calculate_clr_totals(matrix.with_contribution(4, '10', 3.0).with_contribution(4, '15', 8.0), 25.0)
+
+    for grant_id, total in expected.items():
+        assert actual[grant_id]['clr_amount'] == pytest.approx(total['clr_amount'])
+    assert matrix.amounts.shape == (5, 4)
+
+
+def stub_chunked_cursor(rows):
+    """patches the db connection with a server-side cursor serving rows"""
+    remaining = list(rows)
+
+    def fetchmany(size):
+        chunk, remaining[:] = remaining[:size], remaining[size:]
+        return chunk
+
+    connection = MagicMock()
+    cursor = connection.chunked_cursor.return_value.__enter__.return_value
+    cursor.fetchmany.side_effect = fetchmany
+    return patch('grants.clr_data_src.connection', connection), cursor
+
+
+def test_summed_contributions_stream_into_the_sparse_matrix(round_data):
+    curr_agg, trust_dict = round_data
+    rows = [
+        (grant_id, user_id, amount, trust_dict[user_id])
+        for grant_id, contribz in curr_agg.items() for user_id, amount in contribz.items()
+    ]
+    grants = [SimpleNamespace(id=grant_id) for grant_id in curr_agg]
+    clr_round = SimpleNamespace(contribution_multiplier=1, start_date=None, end_date=None)
+
+    patched, cursor = stub_chunked_cursor(rows)
+    with patched:
+        chunks = list(stream_summed_contributions(grants, clr_round, chunk_size=4))
+    sql, params = cursor.execute.call_args[0]
+    # the grant ids are bound as one array parameter, not interpolated into the statement
+    assert sql == SUMMED_CONTRIBUTIONS_SQL and '%(grant_ids)s' in sql
+    assert params['grant_ids'] == [1, 2, 3, 4]
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+
+    patched, _ = stub_chunked_cursor(rows)
+    with patched:
+        assert fetch_summed_contributions(grants, clr_round) == (curr_agg, trust_dict)
+
+    patched, _ = stub_chunked_cursor(rows)
+    with patched:
+        matrix = fetch_summed_contribution_matrix(grants, clr_round, chunk_size=3)
+    bigtot, totals = calculate_clr_totals(matrix, 25.0)
+    dict_bigtot, dict_totals = calculate_clr_sparse(curr_agg, trust_dict, 25.0, 1000.0)
+    assert bigtot == pytest.approx(dict_bigtot)
+    for grant_id, total in dict_totals.items():
+        assert totals[grant_id]['clr_amount'] == pytest.approx(total['clr_amount'])
+        assert totals[grant_id]['number_contributions'] == total['number_contributions']
+
+    vectors = matrix.contributor_vectors()
+    for grant_id, contribz in curr_agg.items():
+        amounts, trust = get_contributor_vector(contribz, trust_dict)
+        assert sorted(zip(*vectors[grant_id])) == sorted(zip(amounts, trust))
+
+
+def test_round_snapshot_from_matrix_matches_from_agg():
+    curr_agg = {1: {10: 5.0, 11: 20.0}, 2: {10: 50.0}}
+    trust_dict = {10: 1.0, 11: 1.5}
+
+    snapshot = RoundSnapshot.from_matrix(1, 'mainnet', ContributionMatrix.from_agg(curr_agg, trust_dict))
+
+    assert snapshot.to_agg() == (curr_agg, trust_dict)
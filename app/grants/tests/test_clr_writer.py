@@ -0,0 +1,60 @@
+import pytest
+from grants.clr_writer import CLRPredictionCurveWriter
+from grants.models import Grant, GrantCLRCalculation
+from grants.tests.factories import GrantCLRCalculationFactory, GrantCLRFactory, GrantFactory
+
+
+@pytest.mark.django_db
+class TestCLRPredictionCurveWriter:
+    """Test CLRPredictionCurveWriter."""
+
+    def test_commit_replaces_latest_calculations(self):
+        """Test commit retires the round's previous latest calc and creates a new one per grant."""
+
+        grant_clr = GrantCLRFactory(is_active=True)
+        grant = GrantFactory()
+        old_calc = GrantCLRCalculationFactory(grant=grant, grantclr=grant_clr, latest=True, active=True)
+        curve = [[0.0, 10.0, 0.0], [1.0, 11.0, 1.0], [10.0, 12.0, 2.0], [100.0, 13.0, 3.0], [1000.0, 14.0, 4.0], [10000.0, 15.0, 5.0]]
+
+        writer = CLRPredictionCurveWriter(grant_clr)
+        writer.stage(grant, curve)
+        writer.commit()
+
+        old_calc.refresh_from_db()
+        latest = GrantCLRCalculation.objects.get(grant=grant, grantclr=grant_clr, latest=True)
+
+        assert not old_calc.latest
+        assert not old_calc.active
+        assert latest.active
+        assert latest.clr_prediction_curve == curve
+
+    def test_commit_updates_denormalised_grant_curve(self):
+        """Test commit sums the latest curves of every round into Grant.clr_prediction_curve."""
+
+        grant = GrantFactory()
+        other_round_curve = [[0.0, 1.0, 0.0], [1.0, 1.0, 0.0], [10.0, 1.0, 0.0], [100.0, 1.0, 0.0], [1000.0, 1.0, 0.0], [10000.0, 1.0, 0.0]]
+        GrantCLRCalculationFactory(grant=grant, latest=True, active=True, clr_prediction_curve=other_round_curve)
+        curve = [[0.0, 10.0, 0.0], [1.0, 11.0, 1.0], [10.0, 12.0, 2.0], [100.0, 13.0, 3.0], [1000.0, 14.0, 4.0], [10000.0, 15.0, 5.0]]
+
+        writer = CLRPredictionCurveWriter(GrantCLRFactory(is_active=True))
+        writer.stage(grant, curve)
+        writer.commit()
+
+        grant = Grant.objects.get(pk=grant.pk)
+
+        assert grant.clr_prediction_curve[0] == [0.0, 11.0, 0.0]
+        assert grant.clr_prediction_curve[5] == [10000.0, 16.0, 5.0]
+        assert grant.last_clr_calc_date is not None
+
+    def test_commit_without_update_grants_leaves_grant_untouched(self):
+        """Test update_grants=False only writes the calculations."""
+
+        grant = GrantFactory()
+        curve = [[0.0, 10.0, 0.0] for x in range(0, 6)]
+
+        writer = CLRPredictionCurveWriter(GrantCLRFactory(is_active=True), update_grants=False)
+        writer.stage(grant, curve)
+        writer.commit()
+
+        assert Grant.objects.get(pk=grant.pk).last_clr_calc_date is None
+        assert GrantCLRCalculation.objects.filter(grant=grant, latest=True).count() == 1
@@ -0,0 +1,71 @@
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+import pytest
+from grants.facets import FACETS_KEY, count_facets, get_facet_counts, grant_facets, update_facet_counts
+from grants.models import Grant
+from grants.tests.factories import GrantFactory
+from redis.exceptions import RedisError
+
+
+def test_grant_facets_follow_the_grant_fields():
+    grant = Grant(network='mainnet', active=True, hidden=False, grant_type_id=3)
+
+    assert grant_facets(grant) == {'mainnet:grant_type:3'}
+
+    grant.hidden = True
+    assert grant_facets(grant) == set()
+
+
+@pytest.mark.django_db
+def test_loaded_grants_only_snapshot_the_facet_fields():
+    grant = GrantFactory()
+
+    loaded = Grant.objects.get(pk=grant.pk)
+    assert loaded._loaded_facet_values == ('mainnet', True, False, grant.grant_type_id)
+    assert Grant.objects.only('pk').get(pk=grant.pk)._loaded_facet_values is None
+
+
+def test_update_facet_counts_only_moves_the_changed_facets():
+    redis = MagicMock()
+    redis.exists.return_value = True
+    pipe = redis.pipeline.return_value
+
+    with patch('grants.facets.RedisService') as redis_service:
+        redis_service.return_value.redis = redis
+        update_facet_counts({'mainnet:grant_type:1', 'mainnet:tenant:ETH'}, {'mainnet:grant_type:2', 'mainnet:tenant:ETH'})
+
+    pipe.hincrby.assert_any_call(FACETS_KEY, 'mainnet:grant_type:1', -1)
+    pipe.hincrby.assert_any_call(FACETS_KEY, 'mainnet:grant_type:2', 1)
+    assert pipe.hincrby.call_count == 2
+    pipe.execute.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_count_facets_matches_the_grants_own_facets():
+    grants = GrantFactory.create_batch(3) + [GrantFactory(hidden=True), GrantFactory(active=False)]
+
+    expected = Counter(facet for grant in grants for facet in grant_facets(Grant.objects.get(pk=grant.pk)))
+    counts = {facet: count for facet, count in count_facets('mainnet').items() if count}
+
+    assert counts == expected
+    assert sum(counts.values()) == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('hgetall', [{}, RedisError('down')])
+def test_get_facet_counts_counts_in_the_db_without_the_store(hgetall):
+    grant = GrantFactory()
+    redis = MagicMock()
+    if isinstance(hgetall, Exception):
+        redis.hgetall.side_effect = hgetall
+    else:
+        redis.hgetall.return_value = hgetall
+
+    with patch('grants.facets.RedisService') as redis_service:
+        redis_service.return_value.redis = redis
+        facets = get_facet_counts('mainnet')
+
+    assert facets == {f'grant_type:{grant.grant_type_id}': 1}
+    # the store is left for the next refresh to build
+    redis.pipeline.assert_not_called()
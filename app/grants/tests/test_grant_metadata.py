@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+import pytest
+from dashboard.tests.factories import ProfileFactory
+from grants.grant_metadata import update_grants_metadata
+from grants.history import count_contributors
+from grants.models import Grant
+from grants.tests.factories import ContributionFactory, GrantFactory, SubscriptionFactory
+
+
+@pytest.mark.django_db
+class TestUpdateGrantsMetadata:
+    """Test the batched grant metadata recompute."""
+
+    def test_stats_are_computed_per_grant(self):
+        """Test each grant only counts its own successful contributions."""
+
+        grant, other, unfunded = GrantFactory.create_batch(3)
+        contributor = ProfileFactory()
+        for amount in [10, 5]:
+            subscription = SubscriptionFactory(
+                grant=grant, contributor_profile=contributor, amount_per_period_usdt=amount, comments='great work'
+            )
+            ContributionFactory(subscription=subscription)
+        ContributionFactory(subscription=SubscriptionFactory(grant=other, amount_per_period_usdt=3))
+        ContributionFactory(subscription=SubscriptionFactory(grant=other, amount_per_period_usdt=4), success=False)
+
+        update_grants_metadata([grant.pk, other.pk, unfunded.pk])
+
+        grant, other, unfunded = [Grant.objects.get(pk=pk) for pk in [grant.pk, other.pk, unfunded.pk]]
+        assert (grant.contribution_count, grant.contributor_count, grant.amount_received) == (2, 1, Decimal(15))
+        assert (other.contribution_count, other.contributor_count, other.amount_received) == (1, 1, Decimal(3))
+        assert (unfunded.contribution_count, unfunded.contributor_count, unfunded.amount_received) == (0, 0, 0)
+        assert grant.metadata['wall_of_love'] == [['great work', 2]]
+        assert unfunded.metadata['wall_of_love'] == []
+
+    def test_subscriptions_without_a_profile_count_as_one_contributor(self):
+        """Test the batch agrees with count_contributors on profile-less subscriptions."""
+
+        grant = GrantFactory()
+        ContributionFactory(subscription=SubscriptionFactory(grant=grant))
+        for _ in range(2):
+            ContributionFactory(subscription=SubscriptionFactory(grant=grant, contributor_profile=None))
+
+        update_grants_metadata([grant.pk])
+
+        grant = Grant.objects.get(pk=grant.pk)
+        assert grant.contribution_count == 3
+        assert grant.contributor_count == count_contributors(grant.pk) == 2
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.utils import timezone
+
+import pytest
+from dashboard.tests.factories import ProfileFactory
+from grants.history import contribution_history
+from grants.tests.factories import ContributionFactory, GrantFactory, SubscriptionFactory
+
+
+@pytest.mark.django_db
+class TestGrantHistory:
+    """Test the grouped contribution history and counts."""
+
+    def test_history_is_bucketed_by_quarter(self):
+        """Test contributions are summed per quarter, with CLR payouts in their own column."""
+
+        grant = GrantFactory()
+        clr_payout = ProfileFactory(handle='gitcoinbot')
+        for created_on, amount, profile in [
+            (datetime(2020, 1, 5, tzinfo=timezone.utc), 10, None),
+            (datetime(2020, 3, 31, 23, 59, tzinfo=timezone.utc), 5, None),
+            (datetime(2020, 7, 1, tzinfo=timezone.utc), 7, None),
+            (datetime(2020, 8, 1, tzinfo=timezone.utc), 100, clr_payout),
+        ]:
+            subscription = SubscriptionFactory(
+                grant=grant, amount_per_period_usdt=amount, contributor_profile=profile or ProfileFactory()
+            )
+            ContributionFactory(subscription=subscription, created_on=created_on)
+        ContributionFactory(subscription=SubscriptionFactory(grant=grant, amount_per_period_usdt=50), success=False)
+
+        assert contribution_history(grant.pk) == [
+            ["", "Contributions", "CLR Matching Funds"],
+            ["2020/Q1", 15.0, 0.0],
+            ["2020/Q3", 7.0, 100.0],
+        ]
+
+    def test_counts_include_phantom_funding(self):
+        """Test each contribution counts once and each contributor once."""
+
+        grant = GrantFactory()
+        contributor = ProfileFactory()
+        for _ in range(2):
+            ContributionFactory(subscription=SubscriptionFactory(grant=grant, contributor_profile=contributor))
+        grant.phantom_funding.create(profile=ProfileFactory(), round_number=1)
+
+        assert grant.get_contribution_count == 3
+        assert grant.get_contributor_count() == 2
+        assert len(grant.contributors) == 3
+        assert grant.contributors[0] == contributor
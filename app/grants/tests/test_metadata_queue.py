@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock, patch
+
+from grants.metadata_queue import COUNTERS_KEY, PENDING_KEY, drain_metadata_refreshes, request_metadata_refresh
+from redis.exceptions import ConnectionError
+
+
+def test_repeated_requests_collapse_into_one_pending_grant():
+    redis = MagicMock()
+    redis.sadd.side_effect = [1, 0, 0]
+
+    with patch('grants.metadata_queue.RedisService') as redis_service:
+        redis_service.return_value.redis = redis
+        for _ in range(3):
+            request_metadata_refresh(7)
+
+    redis.sadd.assert_called_with(PENDING_KEY, 7)
+    redis.pipeline.return_value.hincrby.assert_any_call(COUNTERS_KEY, 'requested', 1)
+    counted = [call[0][1] for call in redis.pipeline.return_value.hincrby.call_args_list]
+    # every request is counted, and as either queued or collapsed
+    assert counted == ['requested', 'queued', 'requested', 'collapsed', 'requested', 'collapsed']
+
+
+def test_requests_fall_back_to_the_task_without_redis():
+    with patch('grants.metadata_queue.RedisService') as redis_service, \
+            patch('grants.tasks.update_grant_metadata') as update_grant_metadata:
+        redis_service.return_value.redis.sadd.side_effect = ConnectionError()
+        request_metadata_refresh(7)
+
+    update_grant_metadata.delay.assert_called_once_with(7)
+
+
+def test_drain_enqueues_one_task_per_batch():
+    redis = MagicMock()
+    redis.spop.side_effect = [[b'3', b'1'], [b'2'], []]
+
+    with patch('grants.metadata_queue.RedisService') as redis_service, \
+            patch('grants.tasks.batch_update_grant_metadata') as batch_update_grant_metadata:
+        redis_service.return_value.redis = redis
+        drained = drain_metadata_refreshes(batch_size=2)
+
+    assert drained == 3
+    assert [call[0][0] for call in batch_update_grant_metadata.delay.call_args_list] == [[1, 3], [2]]
+    redis.spop.assert_called_with(PENDING_KEY, 2)
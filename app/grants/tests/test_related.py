@@ -0,0 +1,41 @@
+from django.utils import timezone
+
+import pytest
+from dashboard.tests.factories import ProfileFactory
+from grants.models import Grant
+from grants.related import fetch_related_grants, save_related_grants
+from grants.tests.factories import GrantFactory, SubscriptionFactory
+
+
+@pytest.mark.django_db
+class TestRelatedGrants:
+    """Test the co-contribution index."""
+
+    def test_related_grants_are_funded_by_the_same_contributor_in_the_same_hour(self):
+        """Test only contributions within the window are related, ranked by how often they co-occur."""
+
+        grant, same_cart, also_same_cart, later = GrantFactory.create_batch(4)
+        now = timezone.now()
+        for contributor in [ProfileFactory(), ProfileFactory()]:
+            SubscriptionFactory(grant=grant, contributor_profile=contributor, created_on=now)
+            SubscriptionFactory(grant=same_cart, contributor_profile=contributor, created_on=now)
+            SubscriptionFactory(grant=later, contributor_profile=contributor, created_on=now + timezone.timedelta(hours=3))
+        SubscriptionFactory(grant=also_same_cart, contributor_profile=contributor, created_on=now)
+
+        related = fetch_related_grants([grant.pk])
+
+        assert related == {grant.pk: [[same_cart.pk, 2], [also_same_cart.pk, 1]]}
+        assert fetch_related_grants([grant.pk], top=1) == {grant.pk: [[same_cart.pk, 2]]}
+
+    def test_save_related_grants_keeps_the_other_metadata(self):
+        """Test the related grants are merged into the existing metadata."""
+
+        grant, other = GrantFactory.create_batch(2)
+        Grant.objects.filter(pk=grant.pk).update(metadata={'upcoming': 1})
+
+        save_related_grants({grant.pk: [[other.pk, 3]]})
+
+        grant = Grant.objects.get(pk=grant.pk)
+        assert grant.metadata['upcoming'] == 1
+        assert grant.metadata['related'] == [[other.pk, 3]]
+        assert grant.related_grants == [[other, 3]]
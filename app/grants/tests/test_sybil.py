@@ -0,0 +1,53 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from dashboard.tests.factories import ProfileFactory
+from grants.sybil import bsci_script, classify_handles
+from townsquare.models import SquelchProfile
+
+CSV = '''handle,flag_type_x,flag_type_y,reviewer_is_certain (0/1)_y,is_sybil_y,ml_score,notes
+reviewed,Prediction,Human,1,1,0.95,caught by a reviewer
+reviewed,Prediction,,,,0.95,
+heuristic,Heuristic,,,,0.995,
+predicted,Prediction,,,,0.91,farming
+cleared,Prediction,Human,1,0,0.5,
+cleared,Prediction,,,,0.5,
+unsure,Prediction,,,,0.5,
+unreviewed,Prediction,Human,,,0.5,
+'''
+
+
+def test_handles_are_classified_by_their_first_matching_rule():
+    sybil_users, non_sybil_users = classify_handles(pd.read_csv(StringIO(CSV)))
+
+    assert [user['handle'] for user in sybil_users] == ['reviewed', 'heuristic', 'predicted']
+    assert sybil_users[0]['comment'] == 'caught by a reviewer'
+    assert {user['handle']: user['label'] for user in sybil_users} == {
+        'reviewed': 'Human', 'heuristic': 'Heuristic', 'predicted': 'Prediction'
+    }
+    # a human flag without a reviewer certainty isn't a human review
+    assert {user['handle']: user['label'] for user in non_sybil_users} == {
+        'cleared': 'Human', 'unsure': 'Prediction', 'unreviewed': 'Prediction'
+    }
+
+
+@pytest.mark.django_db
+def test_bsci_script_squelches_in_bulk():
+    reviewed, heuristic, cleared, manual = [
+        ProfileFactory(handle=handle) for handle in ['reviewed', 'heuristic', 'cleared', 'unsure']
+    ]
+    SquelchProfile.objects.create(profile=heuristic, label='Heuristic', comments='already squelched')
+    SquelchProfile.objects.create(profile=cleared, label='Prediction')
+    SquelchProfile.objects.create(profile=manual, label='Manual')
+
+    with patch('grants.sybil.discard_clr_states') as discard_clr_states:
+        stats = bsci_script(StringIO(CSV))
+
+    assert stats == {'squelched': 1, 'unsquelched': 1, 'not_found': 2}
+    assert SquelchProfile.objects.get(profile=reviewed).comments == 'caught by a reviewer'
+    assert SquelchProfile.objects.get(profile=heuristic).comments == 'already squelched'
+    assert not SquelchProfile.objects.filter(profile=cleared).exists()
+    assert SquelchProfile.objects.filter(profile=manual).exists()
+    discard_clr_states.assert_called_once_with()
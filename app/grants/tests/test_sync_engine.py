@@ -0,0 +1,135 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from grants.sync.engine import RateLimiter, TenantPolicy, sync_pending_contributions
+from grants.sync.helpers import explorer_get, record_contribution_activity, save_contribution, txn_already_used
+
+
+class StubExplorer(BaseHTTPRequestHandler):
+    """Answers /fast right away and /slow after a second, /txns lists a single transaction."""
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(1)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'[{"hash": "0xabc"}]' if self.path == '/txns' else b'{"confirmed": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+class StubExplorerServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def explorer_url():
+    server = StubExplorerServer(('127.0.0.1', 0), StubExplorer)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def checker(url):
+    def sync(contribution):
+        if explorer_get(url).json()['confirmed']:
+            contribution.success = True
+            record_contribution_activity(contribution)
+            save_contribution(contribution)
+    return sync
+
+
+def txn_checker(url):
+    def sync(contribution):
+        for txn in explorer_get(url).json():
+            if not txn_already_used(txn['hash'], 'TST'):
+                contribution.tx_id = txn['hash']
+                save_contribution(contribution)
+        # the status check looks the contribution's own transaction up again
+        if contribution.tx_id and not txn_already_used(contribution.tx_id, 'TST'):
+            contribution.success = True
+            save_contribution(contribution)
+    return sync
+
+
+def stub_contributions(count):
+    return [SimpleNamespace(pk=pk, tx_id='', success=False, save=MagicMock()) for pk in range(count)]
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - start >= 4 / 20
+
+
+@pytest.mark.django_db
+def test_a_slow_explorer_only_holds_up_its_own_tenant(explorer_url, monkeypatch):
+    recorded = []
+    monkeypatch.setattr('grants.sync.engine.record_contribution_activity', recorded.append)
+    fast, slow = stub_contributions(20), stub_contributions(2)
+
+    stats = sync_pending_contributions(
+        {'FAST': fast, 'SLOW': slow},
+        checkers={'FAST': checker(f'{explorer_url}/fast'), 'SLOW': checker(f'{explorer_url}/slow')},
+        policies={
+            'FAST': TenantPolicy(workers=4, requests_per_second=0, timeout=5),
+            'SLOW': TenantPolicy(workers=2, requests_per_second=0, timeout=0.2),
+        },
+    )
+
+    assert stats['FAST']['checked'] == 20 and stats['FAST']['changed'] == 20 and stats['FAST']['errors'] == 0
+    assert stats['FAST']['seconds'] < 1
+    # the slow explorer times out, and its contributions are left as they were
+    assert stats['SLOW']['errors'] == 2 and stats['SLOW']['changed'] == 0
+    assert all(contribution.save.call_count == 1 for contribution in fast)
+    assert not any(contribution.save.called for contribution in slow)
+    assert sorted(contribution.pk for contribution in recorded) == list(range(20))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('workers', [1, 2])
+def test_a_transaction_is_only_matched_to_one_contribution(explorer_url, workers):
+    # two identical pending contributions, the explorer only has one payment for them
+    contributions = stub_contributions(2)
+
+    stats = sync_pending_contributions(
+        {'TST': contributions},
+        checkers={'TST': txn_checker(f'{explorer_url}/txns')},
+        policies={'TST': TenantPolicy(workers=workers, requests_per_second=0, timeout=5)},
+    )
+
+    assert stats['TST']['changed'] == 1
+    assert sorted(contribution.success for contribution in contributions) == [False, True]
+    assert [contribution.tx_id for contribution in contributions if contribution.success] == ['0xabc']
+
+
+@pytest.mark.django_db
+def test_a_failing_save_only_drops_its_own_contribution(explorer_url, monkeypatch):
+    recorded = []
+    monkeypatch.setattr('grants.sync.engine.record_contribution_activity', recorded.append)
+    first, second = stub_contributions(3), stub_contributions(2)
+    first[1].save.side_effect = ValueError('bad data')
+
+    stats = sync_pending_contributions(
+        {'FIRST': first, 'SECOND': second},
+        checkers={'FIRST': checker(f'{explorer_url}/fast'), 'SECOND': checker(f'{explorer_url}/fast')},
+        policies={
+            'FIRST': TenantPolicy(workers=2, requests_per_second=0, timeout=5),
+            'SECOND': TenantPolicy(workers=2, requests_per_second=0, timeout=5),
+        },
+    )
+
+    assert stats['FIRST']['changed'] == 2 and stats['FIRST']['errors'] == 1
+    assert stats['SECOND']['changed'] == 2 and stats['SECOND']['errors'] == 0
+    assert all(contribution.save.call_count == 1 for contribution in first + second)
+    assert sorted(id(contribution) for contribution in recorded) == \
+        sorted(id(contribution) for contribution in [first[0], first[2]] + second)
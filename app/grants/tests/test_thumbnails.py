@@ -0,0 +1,70 @@
+import os
+import time
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from django.core.cache.backends.locmem import LocMemCache
+
+import pytest
+from grants.thumbnails import LOGO_CACHE_MAX_AGE, cached_thumbnail, evict_logo_cache, fetch_image, fetch_images
+
+
+@pytest.fixture
+def logo_cache_dir(settings, tmp_path):
+    settings.GRANTS_LOGO_CACHE_DIR = str(tmp_path)
+    return tmp_path
+
+
+def test_fetched_images_are_cached_by_content(logo_cache_dir):
+    with patch('grants.thumbnails.urllib.request.urlopen', side_effect=lambda url, timeout: BytesIO(b'logo')) as urlopen:
+        assert fetch_image('https://example.com/a.png') == b'logo'
+        assert fetch_image('https://example.com/a.png') == b'logo'
+        assert fetch_image('https://example.com/b.png') == b'logo'
+
+    assert urlopen.call_count == 2
+    # one image and an index file per url
+    assert len([name for name in os.listdir(logo_cache_dir) if not name.startswith('url-')]) == 1
+    assert len([name for name in os.listdir(logo_cache_dir) if name.startswith('url-')]) == 2
+
+
+def test_fetch_images_keeps_the_order_and_skips_failures(logo_cache_dir):
+    def urlopen(url, timeout):
+        if url.endswith('broken.png'):
+            raise OSError('not found')
+        return BytesIO(url.encode())
+
+    urls = [f'https://example.com/{i}.png' for i in range(10)] + ['https://example.com/broken.png']
+    with patch('grants.thumbnails.urllib.request.urlopen', side_effect=urlopen):
+        images = fetch_images(urls)
+
+    assert images == [url.encode() for url in urls[:-1]] + [None]
+
+
+def test_expired_url_entries_are_fetched_again_and_evicted(logo_cache_dir):
+    with patch('grants.thumbnails.urllib.request.urlopen', side_effect=lambda url, timeout: BytesIO(b'old')):
+        fetch_image('https://example.com/a.png')
+
+    expired = time.time() - LOGO_CACHE_MAX_AGE - 1
+    for name in os.listdir(logo_cache_dir):
+        os.utime(logo_cache_dir / name, (expired, expired))
+
+    with patch('grants.thumbnails.urllib.request.urlopen', side_effect=lambda url, timeout: BytesIO(b'new')):
+        assert fetch_image('https://example.com/a.png') == b'new'
+
+    # only the content nothing fetched recently is left to evict
+    assert evict_logo_cache() == 1
+    assert fetch_image('https://example.com/a.png') == b'new'
+
+
+def test_thumbnails_with_missing_logos_are_not_cached():
+    grants = [SimpleNamespace(pk=1, logo=None)]
+    profile = SimpleNamespace(pk=1, avatar_url='avatar.png')
+    build = Mock(side_effect=[(b'blank tile', False), (b'thumbnail', True)])
+
+    with patch('grants.thumbnails.cache', LocMemCache('thumbnails', {})):
+        assert cached_thumbnail(grants, profile, 10, 10, build) == (b'blank tile', False)
+        assert cached_thumbnail(grants, profile, 10, 10, build) == (b'thumbnail', True)
+        assert cached_thumbnail(grants, profile, 10, 10, build) == (b'thumbnail', True)
+
+    assert build.call_count == 2
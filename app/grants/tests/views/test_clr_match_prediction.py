@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+from django.test.client import Client
+
+import pytest
+from grants.tests.factories import GrantFactory
+
+
+@pytest.mark.django_db
+class TestClrMatchPrediction:
+
+    @pytest.mark.parametrize('amount', ['nan', 'inf', '-inf', '-1'])
+    def test_non_finite_or_negative_amounts_are_rejected(self, amount):
+        client = Client(HTTP_USER_AGENT='chrome')
+
+        with patch('grants.views.MatchPredictor.load') as load:
+            response = client.get('/grants/v1/api/clr/1/predict', {'grant_id': 1, 'amount': amount})
+
+        assert response.status_code == 400
+        load.assert_not_called()
+
+    def test_missing_grant_id_is_rejected(self):
+        client = Client(HTTP_USER_AGENT='chrome')
+
+        response = client.get('/grants/v1/api/clr/1/predict', {'amount': 5})
+
+        assert response.status_code == 400
+
+    def test_deferred_grants_are_predicted_under_their_clr_grant(self):
+        clr_grant = GrantFactory()
+        grant = GrantFactory(defer_clr_to=clr_grant)
+        client = Client(HTTP_USER_AGENT='chrome')
+
+        with patch('grants.views.MatchPredictor.load') as load:
+            load.return_value.predict_for_grant.return_value = [1.0, 3.0]
+            response = client.get('/grants/v1/api/clr/1/predict', {'grant_id': grant.pk, 'amount': 5})
+
+        assert response.status_code == 200
+        assert response.json()['clr_increase'] == 2.0
+        load.return_value.predict_for_grant.assert_called_once_with(clr_grant.pk, [0, 5.0])
@@ -4,9 +4,15 @@
 
 import pytest
 from dashboard.tests.factories import ProfileFactory
+from grants.listing_cache import bump_grant_versions, normalize_listing_params
 from grants.tests.factories import GrantFactory
 
 
+@pytest.fixture(autouse=True)
+def no_listing_cache(settings):
+    settings.GRANTS_LISTING_CACHE_TIMEOUT = 0
+
+
 @pytest.fixture()
 def grants():
     profile = ProfileFactory()
@@ -27,3 +33,89 @@ def test_with_grants_created(self, grants):
 
         assert response.status_code == 200
         assert len(response.json()['grants']) == 5
+
+    def test_keyword_search_matches_description_words(self, grants):
+        GrantFactory(
+            title='Solidity tooling', description='Funding independent smart contract auditing',
+            last_update=datetime.now(), admin_profile=grants[0].admin_profile
+        )
+        client = Client(HTTP_USER_AGENT='chrome')
+        response = client.get('/grants/cards_info', {'keyword': 'audit'})
+
+        assert response.status_code == 200
+        assert [grant['title'] for grant in response.json()['grants']] == ['Solidity tooling']
+
+    def test_keyword_search_falls_back_to_partial_title_matches(self, grants):
+        GrantFactory(title='Solidity tooling', last_update=datetime.now(), admin_profile=grants[0].admin_profile)
+        client = Client(HTTP_USER_AGENT='chrome')
+        response = client.get('/grants/cards_info', {'keyword': 'solid'})
+
+        assert response.status_code == 200
+        assert [grant['title'] for grant in response.json()['grants']] == ['Solidity tooling']
+
+    def test_keyword_search_puts_exact_title_match_first(self, grants):
+        GrantFactory(title='Gitcoin', last_update=datetime.now(), admin_profile=grants[0].admin_profile)
+        GrantFactory(title='Gitcoin tooling for gitcoin', last_update=datetime.now(), admin_profile=grants[0].admin_profile)
+        client = Client(HTTP_USER_AGENT='chrome')
+        response = client.get('/grants/cards_info', {'keyword': 'gitcoin', 'sort_option': ''})
+
+        assert response.status_code == 200
+        assert [grant['title'] for grant in response.json()['grants']][0] == 'Gitcoin'
+
+    def test_cursor_pages_through_every_grant_once(self, grants):
+        client = Client(HTTP_USER_AGENT='chrome')
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = client.get('/grants/cards_info', {'cursor': cursor, 'limit': 2})
+            assert response.status_code == 200
+            seen += [grant['id'] for grant in response.json()['grants']]
+            cursor = response.json()['next_cursor']
+            assert response.json()['has_next'] == (cursor is not None)
+
+        expected = sorted(grants, key=lambda grant: (grant.created_on, grant.pk), reverse=True)
+        assert seen == [grant.pk for grant in expected]
+
+    def test_cursor_pages_on_the_sort_column(self, grants):
+        for i, grant in enumerate(grants):
+            grant.contribution_count = i % 2
+            grant.save()
+
+        client = Client(HTTP_USER_AGENT='chrome')
+        first = client.get('/grants/cards_info', {'cursor': '', 'limit': 3, 'sort_option': 'contribution_count'}).json()
+        second = client.get(
+            '/grants/cards_info', {'cursor': first['next_cursor'], 'limit': 3, 'sort_option': 'contribution_count'}
+        ).json()
+
+        seen = [grant['id'] for grant in first['grants'] + second['grants']]
+        expected = sorted(grants, key=lambda grant: (grant.contribution_count, grant.pk))
+        assert seen == [grant.pk for grant in expected]
+        assert second['next_cursor'] is None and second['has_previous']
+
+    def test_invalid_cursor_is_rejected(self, grants):
+        client = Client(HTTP_USER_AGENT='chrome')
+        response = client.get('/grants/cards_info', {'cursor': 'not-a-cursor'})
+
+        assert response.status_code == 400
+
+    @pytest.mark.django_db(transaction=True)
+    def test_anonymous_listing_is_cached_until_one_of_its_grants_changes(self, grants, settings):
+        settings.GRANTS_LISTING_CACHE_TIMEOUT = 60
+        # start from a fresh listing version so nothing cached by earlier runs is served
+        bump_grant_versions([], listings=True)
+        client = Client(HTTP_USER_AGENT='chrome')
+        params = {'limit': 10, 'sort_option': 'created_on'}
+
+        assert len(client.get('/grants/cards_info', params).json()['grants']) == 5
+        assert len(client.get('/grants/cards_info', params).json()['grants']) == 5
+
+        # Grant.save bumps the version once its transaction commits
+        grants[0].title = 'Renamed grant'
+        grants[0].save()
+        titles = [grant['title'] for grant in client.get('/grants/cards_info', params).json()['grants']]
+        assert 'Renamed grant' in titles
+
+
+def test_listing_params_are_normalized():
+    assert normalize_listing_params({'grant_types': 'media,tech', 'keyword': ' Gitcoin ', '_': '123'}) == \
+        normalize_listing_params({'grant_types': 'tech,media', 'keyword': 'gitcoin', 'network': 'mainnet'})
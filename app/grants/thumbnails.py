@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Define the logo fetching and caching behind the grant collection thumbnails.
+
+Copyright (C) 2021 Gitcoin Core
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# logos fetched at once, per thumbnail
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+# seconds a url stays mapped to the content fetched from it, so changed logos are picked up again
+LOGO_CACHE_MAX_AGE = 60 * 60 * 24
+# composed thumbnails are keyed by everything drawn on them, so they only expire to free space
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=settings.GRANTS_LOGO_CACHE_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def cached_image(url):
+    '''
+        the bytes behind url from the local logo cache
+
+        images are stored under the hash of their content, with a small index file per url
+        pointing at it, so logos shared by several urls are only stored once
+
+        index files older than LOGO_CACHE_MAX_AGE are ignored, so the url is fetched again
+
+        returns:
+            the image bytes, or None when url hasn't been fetched yet or its entry expired
+    '''
+    index_path = os.path.join(settings.GRANTS_LOGO_CACHE_DIR, f'url-{_sha256(url.encode())}')
+    try:
+        if time.time() - os.path.getmtime(index_path) > LOGO_CACHE_MAX_AGE:
+            return None
+        with open(index_path) as f:
+            content_hash = f.read().strip()
+        with open(os.path.join(settings.GRANTS_LOGO_CACHE_DIR, content_hash), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def fetch_image(url):
+    '''
+        returns:
+            the bytes behind url, from the local logo cache when it was fetched before.
+            urls without a scheme are read from the local filesystem (static logos)
+    '''
+    if '://' not in url:
+        with open(url, 'rb') as f:
+            return f.read()
+
+    data = cached_image(url)
+    if data is not None:
+        return data
+
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        data = response.read()
+
+    os.makedirs(settings.GRANTS_LOGO_CACHE_DIR, exist_ok=True)
+    content_hash = _sha256(data)
+    content_path = os.path.join(settings.GRANTS_LOGO_CACHE_DIR, content_hash)
+    if os.path.exists(content_path):
+        # keep shared content alive for as long as any url fetched it recently
+        os.utime(content_path)
+    else:
+        _write_atomic(content_path, data)
+    _write_atomic(os.path.join(settings.GRANTS_LOGO_CACHE_DIR, f'url-{_sha256(url.encode())}'), content_hash.encode())
+    return data
+
+
+def evict_logo_cache(max_age=LOGO_CACHE_MAX_AGE):
+    '''
+        removes the index and content files not written for max_age seconds
+
+        returns:
+            the number of files removed
+    '''
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(settings.GRANTS_LOGO_CACHE_DIR))
+    except FileNotFoundError:
+        return removed
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def fetch_images(urls, workers=FETCH_WORKERS):
+    '''
+        fetches urls concurrently, at most workers at a time
+
+        returns:
+            the bytes of each url in order, None for the ones that failed
+    '''
+    def fetch(url):
+        try:
+            return fetch_image(url)
+        except Exception as e:
+            logger.warning(f'could not fetch {url}: {e}')
+            return None
+
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+        return list(executor.map(fetch, urls))
+
+
+def thumbnail_cache_key(grants, profile, width, height):
+    '''keyed on the member grants and their logos, so editing either builds a new thumbnail'''
+    members = [(grant.pk, grant.logo.name if grant.logo else '') for grant in grants]
+    key = f'{profile.pk}:{profile.avatar_url}:{width}x{height}:{members}'
+    return f'grants:thumbnail:{_sha256(key.encode())}'
+
+
+def cached_thumbnail(grants, profile, width, height, build):
+    '''
+        build(grants, profile, width, height) returns the png bytes and whether every logo
+        and the avatar could be fetched. thumbnails with missing logos are not cached, so
+        a failed download is retried on the next request instead of being pinned
+
+        returns:
+            the png bytes of the thumbnail and whether it is complete
+    '''
+    grants = list(grants)
+    key = thumbnail_cache_key(grants, profile, width, height)
+    png = cache.get(key)
+    if png is not None:
+        return png, True
+    png, complete = build(grants, profile, width, height)
+    if complete:
+        cache.set(key, png, THUMBNAIL_CACHE_TIMEOUT)
+    return png, complete
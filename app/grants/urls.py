@@ -24,13 +24,14 @@
     clr_grants, collage, collection_thumbnail, contribute_to_grants_v1, contribution_addr_from_all_as_json,
     contribution_addr_from_grant_as_json, contribution_addr_from_grant_during_round_as_json,
     contribution_addr_from_round_as_json, contribution_info_from_grant_during_round_as_json, create_matching_pledge_v1,
-    delete_collection, flag, get_clr_sybil_input, get_collection, get_collections_list, get_ethereum_cart_data,
-    get_grant_payload, get_grant_tags, get_grants, get_interrupted_contributions, get_replaced_tx, get_trust_bonus,
-    grant_activity, grant_details, grant_details_api, grant_details_contributions, grant_details_contributors,
-    grant_edit, grant_fund, grant_new, grants, grants_addr_as_json, grants_bulk_add, grants_by_grant_type,
-    grants_cart_view, grants_info, grants_landing, grants_type_redirect, hall_of_fame, ingest_contributions,
-    ingest_contributions_view, invoice, leaderboard, manage_ethereum_cart_data, new_matching_partner, profile,
-    quickstart, remove_grant_from_collection, save_collection, toggle_grant_favorite, upload_sybil_csv, verify_grant,
+    delete_collection, flag, get_clr_match_prediction, get_clr_sybil_input, get_collection, get_collections_list,
+    get_ethereum_cart_data, get_grant_payload, get_grant_tags, get_grants, get_interrupted_contributions,
+    get_replaced_tx, get_trust_bonus, grant_activity, grant_details, grant_details_api, grant_details_contributions,
+    grant_details_contributors, grant_edit, grant_fund, grant_new, grants, grants_addr_as_json, grants_bulk_add,
+    grants_by_grant_type, grants_cart_view, grants_info, grants_landing, grants_type_redirect, hall_of_fame,
+    ingest_contributions, ingest_contributions_view, invoice, leaderboard, manage_ethereum_cart_data,
+    new_matching_partner, profile, quickstart, remove_grant_from_collection, save_collection, toggle_grant_favorite,
+    upload_sybil_csv, verify_grant,
 )
 
 app_name = 'grants/'
@@ -119,6 +120,7 @@
 
     # custom API
     path('v1/api/get-clr-data/<int:round_id>', get_clr_sybil_input, name='get_clr_sybil_input'),
+    path('v1/api/clr/<int:round_id>/predict', get_clr_match_prediction, name='get_clr_match_prediction'),
     path('v1/api/toggle_user_sybil', api_toggle_user_sybil, name='api_toggle_user_sybil'),
     path('v1/api/upload_sybil_csv', upload_sybil_csv, name='upload_sybil_csv')
 
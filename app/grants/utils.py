@@ -22,19 +22,17 @@
 import math
 import os
 import re
-import urllib.request
 from datetime import datetime
 from decimal import Decimal
+from io import BytesIO
 from random import randint, seed
 from secrets import token_hex
 
 from django.utils import timezone
 
-import numpy as np
-import pandas as pd
 from app.settings import BASE_URL, MEDIA_URL, NOTION_API_KEY, NOTION_SYBIL_DB
 from app.utils import notion_write
-from avatar.utils import convert_img
+from avatar.utils import svg_to_png
 from economy.utils import ConversionRateNotFoundError, convert_amount
 from gas.utils import eth_usd_conv_rate
 from grants.sync.algorand import sync_algorand_payout
@@ -45,9 +43,9 @@
 from grants.sync.rsk import sync_rsk_payout
 from grants.sync.zcash import sync_zcash_payout
 from grants.sync.zil import sync_zil_payout
+from grants.thumbnails import cached_thumbnail, fetch_images
 from perftools.models import StaticJsonEnv
 from PIL import Image, ImageDraw, ImageOps
-from townsquare.models import SquelchProfile
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +122,32 @@ def get_clr_rounds_metadata():
         'banner_round_name': banner_round_name
     }
 
+def sum_clr_prediction_curves(curves):
+    """Sum the match columns of the prediction curves of every round a grant is in.
+
+    Args:
+        curves (list): The clr_prediction_curve of each latest, active GrantCLRCalculation.
+
+    Returns:
+        list: The combined [amount_donated, match amount, bonus_from_match_amount] curve.
+
+    """
+    _clr_prediction_curve = []
+    for curve in curves:
+        if not _clr_prediction_curve:
+            _clr_prediction_curve = [list(point) for point in curve]
+        else:
+            for j in [1,2]:
+                for i in [0,1,2,3,4,5]:
+                    # add the 1 and 2 index of each clr prediction cuve
+                    _clr_prediction_curve[i][j] += curve[i][j]
+
+    if not _clr_prediction_curve:
+        _clr_prediction_curve = [[0.0, 0.0, 0.0] for x in range(0, 6)]
+
+    return _clr_prediction_curve
+
+
 def get_upload_filename(instance, filename):
     salt = token_hex(16)
     file_path = os.path.basename(filename)
@@ -192,10 +216,33 @@ def get_user_code(user_id, grant, coding_set=block_codes, length=6):
 def generate_collection_thumbnail(collection, width, heigth):
     grants = collection.grants.all()
     profile = collection.profile
-    return generate_img_thumbnail_helper(grants, profile, width, heigth)
+    thumbnail, _ = generate_img_thumbnail_helper(grants, profile, width, heigth)
+    return thumbnail
+
+
+def generate_collection_thumbnail_png(collection, width, heigth, strict=False):
+    return generate_img_thumbnail_png(collection.grants.all(), collection.profile, width, heigth, strict=strict)
+
+
+def generate_img_thumbnail_png(grants, profile, width, heigth, strict=False):
+    """Return the thumbnail as png bytes, reusing the one built last time for the same grants and logos.
+
+    Logos that can't be fetched are drawn as blank tiles, unless strict is set, then it raises instead.
+    """
+    def build(grants, profile, width, heigth):
+        buffer = BytesIO()
+        thumbnail, complete = generate_img_thumbnail_helper(grants, profile, width, heigth)
+        thumbnail.save(buffer, 'PNG')
+        return buffer.getvalue(), complete
+
+    png, complete = cached_thumbnail(grants, profile, width, heigth, build)
+    if strict and not complete:
+        raise ValueError('could not fetch every grant logo for the thumbnail')
+    return png
 
 
 def generate_img_thumbnail_helper(grants, profile, width, heigth):
+    """Return the thumbnail image and whether every logo it draws could be fetched."""
     MARGIN = int(width / 30)
     MID_MARGIN = int(width / 90)
     BG = (111, 63, 245)
@@ -210,25 +257,31 @@ def generate_img_thumbnail_helper(grants, profile, width, heigth):
     GRANT_BOX = (GRANT_WIDTH, GRANT_HEIGHT)
     media_url = '' if 'media' not in MEDIA_URL else BASE_URL[:-1]
 
-    logos = []
-    for grant in grants:
+    # only the first grants are drawn, their logos and the avatar are fetched together
+    logo_urls = []
+    for grant in list(grants)[:DISPLAY_GRANTS_LIMIT]:
         if grant.logo:
-            if len(logos) > DISPLAY_GRANTS_LIMIT:
-                break
-            grant_url = f'{media_url}{grant.logo.url}'
-            print(f'Trying to get: ${grant_url}')
-            fd = urllib.request.urlopen(grant_url)
-            logos.append(fd)
+            logo_urls.append(f'{media_url}{grant.logo.url}')
         else:
-            static_file = f'assets/v2/images/grants/logos/{grant.id % 3}.png'
-            logos.append(static_file)
+            logo_urls.append(f'assets/v2/images/grants/logos/{grant.id % 3}.png')
+    avatar_url = f'{media_url}{profile.avatar_url}'
+    *logo_data, avatar_data = fetch_images(logo_urls + [avatar_url])
+    if avatar_data is None:
+        raise ValueError(f'could not fetch avatar {avatar_url}')
+
+    logos = []
+    for url, data in zip(logo_urls, logo_data):
+        if data is not None and re.match(r'.*\.svg', url):
+            data = svg_to_png(data)
+            data = data.getvalue() if data else None
+        logos.append(BytesIO(data) if data is not None else None)
+    complete = all(logo is not None for logo in logos)
 
     for logo in range(len(logos), 4):
         logos.append(None)
 
     thumbail = Image.new('RGBA', IMAGE_BOX, color=BG)
-    avatar_url = f'{media_url}{profile.avatar_url}'
-    fd = urllib.request.urlopen(avatar_url)
+    fd = BytesIO(avatar_data)
 
     # Make rounder profile avatar img
     mask = Image.new('L', PROFILE_BOX, 0)
@@ -260,14 +313,10 @@ def generate_img_thumbnail_helper(grants, profile, width, heigth):
             thumbail.paste(grant_bg, CORNERS[index], grant_bg)
             continue
 
-        if type(logos[index]) is not str and re.match(r'.*\.svg', logos[index].url):
-            grant_img = convert_img(logos[index])
-            grant_thumbail = Image.open(grant_img)
-        else:
-            try:
-                grant_thumbail = Image.open(logos[index])
-            except ValueError:
-                grant_thumbail = Image.open(logos[index]).convert("RGBA")
+        try:
+            grant_thumbail = Image.open(logos[index])
+        except ValueError:
+            grant_thumbail = Image.open(logos[index]).convert("RGBA")
 
         grant_thumbail.thumbnail(GRANT_BOX, Image.ANTIALIAS)
 
@@ -294,7 +343,7 @@ def generate_img_thumbnail_helper(grants, profile, width, heigth):
     except ValueError:
         thumbail.paste(profile_circle, (int(width / 2 - PROFILE_WIDTH / 2) + HALF_LOGO_SIZE_DIFF, int(heigth / 2 - PROFILE_HEIGHT / 2) + HALF_LOGO_SIZE_DIFF))
 
-    return thumbail
+    return thumbail, complete
 
 
 def sync_payout(contribution):
@@ -344,136 +393,3 @@ def save_grant_to_notion(grant):
                 }]
             }
         })
-
-
-def toggle_user_sybil(sybil_users, non_sybil_users):
-    '''util function which marks users as sybil/not'''
-
-    from dashboard.models import Profile
-
-    squelched_profiles = SquelchProfile.objects.all()
-    if sybil_users:
-        # iterate through users which need to be packed as sybil
-        for user in sybil_users:
-            try:
-                # get user profile. note
-                profile = Profile.objects.filter(handle=user.get('handle')).first()
-                if profile:
-                    label = user.get('label')
-                    comment = user.get('comment')
-
-                    if comment and isNaN(comment):
-                        comment = 'added by bsci'
-
-                    # check if user has entry in SquelchProfile
-                    if (
-                        not squelched_profiles.filter(profile=profile).first() and
-                        label and comment
-                    ):
-                        # mark user as sybil
-                        SquelchProfile.objects.create(
-                            profile=profile,
-                            label=label,
-                            comments=comment
-                        )
-                else:
-                    print(f"error: profile not found for ${user.get('handle')} as sybil.")
-            except Exception as e:
-                print(f"error: unable to mark user ${user.get('handle')} as sybil. {e}")
-
-    if non_sybil_users:
-        # exclude squelches added by manual
-        squelched_profiles = squelched_profiles.exclude(label='Manual')
-        # iterate and remove sybil from user
-        for user in non_sybil_users:
-            try:
-                profile = Profile.objects.get(pk=user.get('id'))
-                squelched_profiles.filter(profile=profile).delete()
-            except Exception as e:
-                print(f"error: unable to mark ${user.get('id')} as non sybil. {e}")
-
-
-
-def bsci_script(csv):
-    try:
-        # choose the specific csv you want to use
-        endpoint_df = pd.read_csv(csv)
-
-        sybil_df = pd.DataFrame()
-        non_sybil_df = pd.DataFrame()
-        '''
-        filters human labeled sybils ('reviewer_is_certain (0/1)' and 'is_sybil_y' values can be adjusted)
-        human_sybil_score could also be used as a filter is wanted
-        '''
-        human_sybil = endpoint_df[(endpoint_df['flag_type_y'] == 'Human') & (endpoint_df['reviewer_is_certain (0/1)_y'] >= 0.99)  & (endpoint_df['is_sybil_y'] >= 0.99)]
-        endpoint_df = endpoint_df[~endpoint_df.handle.isin(human_sybil.handle)]
-        human_sybil = human_sybil[['handle', 'flag_type_y', 'notes']]
-        human_sybil = human_sybil.rename({'handle': 'handle', 'flag_type_y': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        sybil_df = sybil_df.append(human_sybil)
-
-        '''
-        filters heuristic labeled sybils, nothing can be adjusted here
-        '''
-        heuristic_sybil = endpoint_df[(endpoint_df['flag_type_x'] == 'Heuristic') & (endpoint_df['ml_score'] >= 0.99)]
-        endpoint_df = endpoint_df[~endpoint_df.handle.isin(heuristic_sybil.handle)]
-        heuristic_sybil = heuristic_sybil[['handle', 'flag_type_x', 'notes']]
-        hueristic_sybil = heuristic_sybil.rename({'handle': 'handle', 'flag_type_x': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        sybil_df = sybil_df.append(heuristic_sybil)
-
-        '''
-        filters ml predicted sybils, ml_score can be adjusted to be either higher or lower
-        higher ml_score means less people are likely to appeal, but potentially some sybils slip through
-        lower ml_score means more people are likely to appeal, but more sybils are potentially caught
-        '''
-        ml_sybil = endpoint_df[(endpoint_df['flag_type_x'] == 'Prediction') & (endpoint_df['ml_score'] >= 0.9)]
-        endpoint_df = endpoint_df[~endpoint_df.handle.isin(ml_sybil.handle)]
-        ml_sybil = ml_sybil[['handle', 'flag_type_x', 'notes']]
-        ml_sybil = ml_sybil.rename({'handle': 'handle', 'flag_type_x': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        sybil_df = sybil_df.append(ml_sybil)
-
-        '''
-        filters human labeled non-sybil users
-        nothing here should be changed as these are just the remaining users that were marked by humans not included in the sybil filtering
-        '''
-        human_non_sybil = endpoint_df[(endpoint_df['flag_type_y'] == 'Human') & (endpoint_df['reviewer_is_certain (0/1)_y'] != np.nan)]
-        endpoint_df = endpoint_df[~endpoint_df.handle.isin(human_non_sybil.handle)]
-        human_non_sybil = human_non_sybil[['handle', 'flag_type_y', 'notes']]
-        human_non_sybil = human_non_sybil.rename({'handle': 'handle', 'flag_type_y': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        non_sybil_df = non_sybil_df.append(human_non_sybil)
-
-        '''
-        filters heuristic non sybils, nothing here needs to be adjusted
-        '''
-        heuristic_non_sybil = endpoint_df[(endpoint_df['flag_type_x'] == 'Heuristic') & (endpoint_df['ml_score'] <= 0.01)]
-        endpoint_df = endpoint_df[~endpoint_df.handle.isin(heuristic_non_sybil.handle)]
-        heuristic_non_sybil = heuristic_non_sybil[['handle', 'flag_type_x', 'notes']]
-        hueristic_non_sybil = heuristic_non_sybil.rename({'handle': 'handle', 'flag_type_x': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        non_sybil_df = non_sybil_df.append(heuristic_non_sybil)
-
-        '''
-        This just filters out the remaining users that were not filtered in the previous sections, nothing can be adjusted here
-        '''
-        ml_non_sybil = endpoint_df
-        ml_non_sybil = ml_non_sybil[['handle', 'flag_type_x', 'notes']]
-        ml_non_sybil = ml_non_sybil.rename({'handle': 'handle', 'flag_type_x': 'label', 'notes': 'comment'}, axis = 1, inplace = True)
-        non_sybil_df = non_sybil_df.append(ml_non_sybil)
-
-        '''
-        conversion of all the data so that it can be pushed to the toggle_user_sybil endpoint
-        '''
-        #sybil_df = ml_df[ml_df['ml_score'] >= 0.9 and ml_df['flag_type'] != 'Human']
-        sybil_users = sybil_df.to_dict('records')
-        non_sybil_users = non_sybil_df.to_dict('records')
-
-        # print('=================SYBIL=================')
-        # print(sybil_users)
-        # print('=================NON SYBIL=================')
-        # print(non_sybil_users)
-
-        toggle_user_sybil(sybil_users, non_sybil_users)
-
-    except Exception as e:
-        logger.error(f'error: bsci_sybil_script - {e}')
-
-def isNaN(string):
-    return string != string
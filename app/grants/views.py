@@ -33,11 +33,11 @@
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.humanize.templatetags.humanize import intword
-from django.contrib.postgres.search import SearchQuery, SearchVector
 from django.core.paginator import EmptyPage, Paginator
 from django.db import connection, transaction
-from django.db.models import Q, Subquery
+from django.db.models import Case, Count, F, IntegerField, Q, Subquery, Value, When
 from django.db.models.functions import Lower
 from django.http import Http404, HttpResponse, JsonResponse
 from django.http.response import HttpResponseBadRequest, HttpResponseServerError
@@ -73,17 +73,22 @@
 from economy.utils import convert_token_to_usdt
 from eth_account.messages import defunct_hash_message
 from grants.clr_data_src import fetch_contributions
+from grants.clr_prediction import MatchPredictor
+from grants.facets import get_facet_counts
+from grants.listing_cache import cache_listing, get_cached_listing, listing_cache_key
+from grants.metadata_queue import request_metadata_refresh
 from grants.models import (
     CartActivity, Contribution, Flag, Grant, GrantAPIKey, GrantBrandingRoutingPolicy, GrantCLR, GrantCollection,
     GrantHallOfFame, GrantTag, GrantType, MatchPledge, Subscription,
 )
+from grants.pagination import InvalidCursor, KeysetPaginator, cached_count
+from grants.sybil import toggle_user_sybil
 from grants.tasks import (
     process_bsci_sybil_csv, process_grant_creation_admin_email, process_grant_creation_email, process_notion_db_write,
-    update_grant_metadata,
 )
 from grants.utils import (
-    emoji_codes, generate_collection_thumbnail, generate_img_thumbnail_helper, get_clr_rounds_metadata, get_user_code,
-    is_grant_team_member, sync_payout, toggle_user_sybil,
+    emoji_codes, generate_collection_thumbnail_png, generate_img_thumbnail_png, get_clr_rounds_metadata, get_user_code,
+    is_grant_team_member, sync_payout,
 )
 from marketing.mails import grant_cancellation, new_grant_flag_admin
 from marketing.models import Keyword, Stat
@@ -460,10 +465,49 @@ def get_interrupted_contributions(request):
     })
 
 
+# sort_option -> the column get_grants can page on with a cursor
+KEYSET_SORT_KEYS = {
+    'created_on': 'created_on',
+    'weighted_shuffle': 'weighted_shuffle',
+    'amount_received': 'amount_received',
+    'contribution_count': 'contribution_count',
+    'contributor_count': 'contributor_count',
+    'last_update': 'last_update',
+    'amount_received_in_round': 'amount_received_in_round',
+    'positive_round_contributor_count': 'positive_round_contributor_count',
+    'title': 'sort_title',
+}
+
+
+def get_grants_keyset(sort, keyword):
+    '''
+        returns:
+            (key, descending) for cursor pagination of the given sort_option, or None when
+            the ordering can't be expressed as a keyset (relevance, json fields) and the
+            page has to fall back to offsets
+    '''
+    if not sort:
+        # keyword searches are ordered by relevance, everything else by Grant.Meta.ordering
+        return None if keyword else ('created_on', True)
+
+    key = KEYSET_SORT_KEYS.get(sort.lstrip('-'))
+    return (key, sort.startswith('-')) if key else None
+
+
 def get_grants(request):
     grants = []
     collections = []
     paginator = None
+    keyset_page = None
+
+    # 0. Logged out visitors all get the same response for the same filters
+    listing_key = None if request.user.is_authenticated else listing_cache_key(request.GET)
+    cached_listing = get_cached_listing(listing_key) if listing_key else None
+    if cached_listing:
+        response, pks = cached_listing
+        if len(pks):
+            increment_view_count.delay(pks, str(ContentType.objects.get_for_model(Grant)), None, 'index')
+        return JsonResponse(response)
 
     # 1. fetch all query params
     grant_types = request.GET.get('grant_types', None)
@@ -487,7 +531,7 @@ def get_grants(request):
     grant_regions = request.GET.get('grant_regions', '')
     my_grants = request.GET.get('me', None) == 'true'
     my_collections = request.GET.get('my_collections', None) == 'true'
-
+    cursor = request.GET.get('cursor', None)
 
     # 2. Fetch GrantCLR(s) if present
     clr_rounds = []
@@ -524,16 +568,6 @@ def get_grants(request):
     }
     _grants = get_grants_by_filters(**filters)
 
-    if sort == '' and keyword:
-        # return grants result starting with exact title matches
-        exact_matches = [
-            grant for grant in _grants if grant.title.lower() == keyword.lower()
-        ]
-        non_exact_matches = [
-            grant for grant in _grants if grant.title.lower() != keyword.lower()
-        ]
-        _grants = exact_matches + non_exact_matches
-
     if collection_id and collection_id.isnumeric():
         # 4.1 Fetch grants by collection
         _collections = get_collections(
@@ -563,9 +597,20 @@ def get_grants(request):
         )
 
     else:
-        # 4.1 Paginate results
-        paginator = Paginator(_grants, limit)
-        grants = paginator.get_page(page)
+        keyset = get_grants_keyset(sort, keyword) if cursor is not None else None
+        if keyset:
+            # 4.1 Page on (sort column, pk) so deep pages cost the same as the first one
+            key, descending = keyset
+            keyset_grants = _grants.annotate(sort_title=Lower('title')) if key == 'sort_title' else _grants
+            try:
+                keyset_page = KeysetPaginator(keyset_grants, key, descending, limit).get_page(cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("error: invalid cursor")
+            grants = keyset_page.object_list
+        else:
+            # 4.1 Paginate results
+            paginator = Paginator(_grants, limit)
+            grants = paginator.get_page(page)
 
     contributions = Contribution.objects.none()
     contributions_by_grant = {}
@@ -592,8 +637,7 @@ def get_grants(request):
 
     # Clean up before sending response
     grants_array = []
-    for grant in grants:
-        grant_json = grant.repr(request.user, request.build_absolute_uri)
+    for grant_json in Grant.repr_batch(grants, request.user, request.build_absolute_uri):
         if not request.user.is_staff:
             del grant_json['sybil_score']
             del grant_json['weighted_risk_score']
@@ -606,7 +650,16 @@ def get_grants(request):
     has_next = False
     next_page_number = False
     has_previous = False
-    if paginator:
+    next_cursor = None
+    count = paginator.count if paginator else 0
+    num_pages = paginator.num_pages if paginator else 0
+    if keyset_page:
+        has_next = keyset_page.has_next()
+        has_previous = keyset_page.has_previous
+        next_cursor = keyset_page.next_cursor
+        count = cached_count(_grants)
+        num_pages = math.ceil(count / int(limit))
+    elif paginator:
         try:
             has_next = paginator.page(page).has_next()
             next_page_number = paginator.page(page).next_page_number()
@@ -614,7 +667,7 @@ def get_grants(request):
         except EmptyPage:
             pass
 
-    return JsonResponse({
+    response = {
         'applied_filters': {
             'grant_types': grant_types,
             'grant_tags': grant_tags,
@@ -624,7 +677,7 @@ def get_grants(request):
             'customer_name': customer_name,
             'collection_id': collection_id
         },
-        'grant_types': get_grant_clr_types(clr_rounds[0], _grants, network) if len(clr_rounds) and _grants else get_grant_type_cache(network),
+        'grant_types': get_grant_clr_types(clr_rounds[0], _grants, network) if len(clr_rounds) and _grants.exists() else get_grant_type_cache(network),
         'grants': grants_array,
         'collections': [collection.to_json_dict(request.build_absolute_uri) for collection in collections],
         'credentials': {
@@ -635,15 +688,20 @@ def get_grants(request):
         'has_next': has_next,
         'next_page_number': next_page_number,
         'has_previous': has_previous,
-        'count': paginator.count if paginator else 0,
-        'num_pages': paginator.num_pages if paginator else 0,
+        'next_cursor': next_cursor,
+        'count': count,
+        'num_pages': num_pages,
         'metadata': {
             'claim_start_date': clr_rounds[0].claim_start_date if len(clr_rounds) else None,
             'claim_end_date': clr_rounds[0].claim_end_date if len(clr_rounds) else None,
             'start_date': clr_rounds[0].start_date if len(clr_rounds) else None,
             'end_date': clr_rounds[0].end_date if len(clr_rounds) else None,
         }
-    })
+    }
+    if listing_key:
+        cache_listing(listing_key, response, pks)
+
+    return JsonResponse(response)
 
 
 def get_grants_by_filters(
@@ -756,11 +814,11 @@ def get_grants_by_filters(
 
     if keyword:
         # 13. Grant search by title & description
-        _grants = _grants.annotate(search=SearchVector('description'))
-        keyword_query = Q(title__icontains=keyword)
-        keyword_query |= Q(search=keyword)
-
-        _grants = _grants.filter(keyword_query)
+        _grants = _grants.search(keyword)
+        if not sort:
+            # with no sort requested, exact title matches first and then the most relevant
+            exact_title_match = Case(When(title__iexact=keyword, then=Value(0)), default=Value(1), output_field=IntegerField())
+            _grants = _grants.order_by(exact_title_match, F('search_rank').desc(nulls_last=True), '-created_on')
 
     if sort:
         # 14. Sort filtered grants
@@ -805,25 +863,36 @@ def get_grants_by_filters(
 
 def get_grant_type_cache(network):
     try:
-        return JSONStore.objects.get(view=f'get_grant_types_{network}').data
+        grant_types = JSONStore.objects.get(view=f'get_grant_types_{network}').data
     except:
         return []
 
+    # the grant types are cached with their funding, the counts come live from the facet store
+    facets = get_facet_counts(network)
+    for grant_type in grant_types:
+        if 'pk' in grant_type:
+            grant_type['count'] = facets.get(f"grant_type:{grant_type['pk']}", 0)
+    return grant_types
+
 def get_grant_types(network, filtered_grants=None):
     all_grants_count = 0
     grant_types = []
     if filtered_grants:
-        active_grants = filtered_grants
+        counts = dict(filtered_grants.order_by().values_list('grant_type').annotate(count=Count('pk')))
     else:
-        active_grants = Grant.objects.filter(network=network, hidden=False, active=True)
+        facets = get_facet_counts(network)
+        counts = {
+            int(facet.split(':')[1]): count for facet, count in facets.items() if facet.startswith('grant_type:')
+        }
 
     for _grant_type in GrantType.objects.all():
-        count = active_grants.filter(grant_type=_grant_type).count()
+        count = counts.get(_grant_type.pk, 0)
 
         if count > 0:
             all_grants_count += count
 
             grant_types.append({
+                'pk': _grant_type.pk,
                 'label': _grant_type.label,
                 'keyword': _grant_type.name,
                 'is_active': _grant_type.is_active,
@@ -2849,11 +2918,11 @@ def grants_info(request):
     grants = []
 
     try:
-        for grant in Grant.objects.filter(pk__in=pks.split(',')):
-            if slim:
+        if slim:
+            for grant in Grant.objects.filter(pk__in=pks.split(',')):
                 grants.append(grant.cart_payload(request.build_absolute_uri, request.user))
-            else:
-                grants.append(grant.repr(request.user, request.build_absolute_uri))
+        else:
+            grants = Grant.repr_batch(Grant.objects.filter(pk__in=pks.split(',')), request.user, request.build_absolute_uri)
     except Exception as e:
         print(e)
         response = {
@@ -3110,7 +3179,7 @@ def remove_grant_from_collection(request, collection_id):
     collection.grants.remove(grant)
     collection.generate_cache()
 
-    grants = [grant.repr(request.user, request.build_absolute_uri) for grant in collection.grants.all()]
+    grants = Grant.repr_batch(collection.grants.all(), request.user, request.build_absolute_uri)
 
     return JsonResponse({
         'grants': grants,
@@ -3128,7 +3197,7 @@ def add_grant_from_collection(request, collection_id):
     collection.grants.add(grant)
     collection.generate_cache()
 
-    grants = [grant.repr(request.user, request.build_absolute_uri) for grant in collection.grants.all()]
+    grants = Grant.repr_batch(collection.grants.all(), request.user, request.build_absolute_uri)
 
     return JsonResponse({
         'grants': grants,
@@ -3187,12 +3256,9 @@ def cart_thumbnail(request, profile, grants):
     grant_ids = [ele for ele in grant_ids if ele]
     grants = Grant.objects.filter(pk__in=grant_ids).order_by('-amount_received_in_round')[:4]
     profile = Profile.objects.get(handle=profile.lower())
-    thumbnail = generate_img_thumbnail_helper(grants, profile, width, height)
+    thumbnail = generate_img_thumbnail_png(grants, profile, width, height)
 
-    response = HttpResponse(content_type="image/png")
-    thumbnail.save(response, "PNG")
-
-    return response
+    return HttpResponse(thumbnail, content_type="image/png")
 
 @login_required
 @staff_member_required
@@ -3200,12 +3266,9 @@ def collection_thumbnail(request, collection_id):
     width = int(request.GET.get('w', 600))
     height = int(request.GET.get('h', 400))
     collection = GrantCollection.objects.get(pk=collection_id)
-    thumbnail = generate_collection_thumbnail(collection, width, height)
-
-    response = HttpResponse(content_type="image/png")
-    thumbnail.save(response, "PNG")
+    thumbnail = generate_collection_thumbnail_png(collection, width, height)
 
-    return response
+    return HttpResponse(thumbnail, content_type="image/png")
 
 
 @csrf_exempt
@@ -3358,7 +3421,7 @@ def contribute_to_grants_v1(request):
             contribution.success = True
             contribution.save()
             sync_payout(contribution)
-            update_grant_metadata.delay(grant.pk)
+            request_metadata_refresh(grant.pk)
 
 
             # step 4 : other tasks
@@ -3761,6 +3824,38 @@ def handle_ingestion(profile, network, identifier, do_write):
 
 
 
+@require_GET
+def get_clr_match_prediction(request, round_id):
+    '''
+        JSON GET endpoint which predicts the match a grant would receive from one more
+        contribution of the given amount, for inline estimates in the cart
+    '''
+    try:
+        grant_id = int(request.GET.get('grant_id'))
+        amount = float(request.GET.get('amount', 0))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("error: missing or invalid arguments")
+
+    if not math.isfinite(amount) or amount < 0:
+        return HttpResponseBadRequest("error: amount must be positive")
+
+    predictor = MatchPredictor.load(round_id)
+    if not predictor:
+        return JsonResponse({'success': False, 'message': 'no estimate available for this round'}, status=404)
+
+    # the round is predicted under the grant its clr is deferred to
+    clr_grant_id = Grant.objects.filter(pk=grant_id).values_list('defer_clr_to_id', flat=True).first() or grant_id
+    base, clr_amount = predictor.predict_for_grant(clr_grant_id, [0, amount])
+
+    return JsonResponse({
+        'success': True,
+        'grant_id': grant_id,
+        'amount': amount,
+        'clr_amount': clr_amount,
+        'clr_increase': clr_amount - base if clr_amount else 0.0,
+    })
+
+
 def get_clr_sybil_input(request, round_id):
     '''
         This returns a paginated JSON response to return contributions
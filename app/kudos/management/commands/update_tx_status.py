@@ -51,17 +51,41 @@ def process_grants_contribs(self, hours):
         contributions_retry = Contribution.objects.filter(created_on__gt=created_gt, created_on__lt=created_lt, tx_cleared=True, success=False)
 
         print(f"got {contributions.count()} grants contributions to try , {contributions_retry.count()} to retry")
+        contributions = list(contributions.select_related('subscription'))
+        validations = self.validate_bulk_checkouts(contributions)
         for contrib in contributions:
-            contrib.tx_id
-            contrib.update_tx_status()
+            contrib.update_tx_status(validations.get(contrib.pk))
             print(f"- syncing contrib / {contrib.pk} / {contrib.subscription.network}")
             contrib.save()
 
         # retry contributions that failed
+        contributions_retry = list(contributions_retry.select_related('subscription'))
+        validations = self.validate_bulk_checkouts(contributions_retry)
         for contrib in contributions_retry:
-            contrib.update_tx_status()
+            contrib.update_tx_status(validations.get(contrib.pk))
             contrib.save()
 
+    def validate_bulk_checkouts(self, contributions):
+        """Validate the BulkCheckout contributions per network and chain, looking up each transaction once."""
+        from dashboard.utils import get_web3
+        from economy.tx import grants_transactions_validator
+
+        by_chain = {}
+        for contrib in contributions:
+            if contrib.checkout_type in ['eth_std', 'eth_polygon'] and not contrib.tx_override:
+                chain = contrib.checkout_type.split('_')[-1]
+                by_chain.setdefault((contrib.subscription.network, chain), []).append(contrib)
+
+        validations = {}
+        for (network, chain), chain_contributions in by_chain.items():
+            try:
+                w3 = get_web3(network, chain=chain)
+                validations.update(grants_transactions_validator(chain_contributions, w3, chain=chain))
+            except Exception as e:
+                # these contributions are validated one at a time instead
+                print(f"could not validate {network} {chain} contributions in a batch: {e}")
+        return validations
+
     # processes all crypto assets
     def process_acm(self, hours):
         created_gt = timezone.now()-timezone.timedelta(hours=hours)
@@ -28,6 +28,7 @@
 from dashboard.models import Activity, HackathonEvent, Profile
 from dashboard.utils import set_hackathon_event
 from economy.models import EncodeAnything
+from grants.facets import refresh_facet_counts
 from grants.models import Contribution, Grant, GrantType
 from grants.utils import get_clr_rounds_metadata
 from marketing.models import Stat
@@ -60,15 +61,19 @@ def create_email_inventory_cache():
 
 def create_grant_clr_cache():
     print('create_grant_clr_cache')
-    from grants.tasks import update_grant_metadata
-    pks = Grant.objects.filter(active=True, hidden=False).values_list('pk', flat=True)
-    for pk in pks:
-        update_grant_metadata.delay(pk)
+    from grants.grant_metadata import BATCH_SIZE
+    from grants.tasks import batch_update_grant_metadata
+    pks = list(Grant.objects.filter(active=True, hidden=False).order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(pks), BATCH_SIZE):
+        batch_update_grant_metadata.delay(pks[i:i + BATCH_SIZE])
 
 
 def create_grant_type_cache():
     print('create_grant_type_cache')
     from grants.views import get_grant_types
+
+    # rebuild the facet counts first, Grant.save keeps them current in between but this repairs any drift
+    refresh_facet_counts()
     for network in ['rinkeby', 'mainnet']:
         view = f'get_grant_types_{network}'
         keyword = view
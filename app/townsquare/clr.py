@@ -1,7 +1,8 @@
-import copy
 import json
 import time
 
+from grants.clr_engine import ContributionMatrix, calculate_clr_totals
+
 match_amounts_to_estimate = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 1, 5, 10, 100, 1000]
 #match_amounts_to_estimate = [0.30]
 
@@ -43,132 +44,40 @@ def translate_data(grants_data):
 
 
 '''
-    Helper function that aggregates contributions by contributor, and then uses the aggregated contributors by contributor and calculates total contributions by unique pairs.
+    Helper function that aggregates contributions by contributor into the contributor x grant matrix used by the
+    shared CLR kernel (grants.clr_engine), which works out the pair totals itself.
 
     Args:
         from get_data or translate_data:
         [[grant_id (str), user_id (str), contribution_amount (float)]]
 
     Returns:
-        {grant_id (str): {user_id (str): aggregated_amount (float)}}
-
-        and
-
-        {user_id (str): {user_id (str): pair_total (float)}}
+        ContributionMatrix of aggregated amounts
 '''
 def aggregate_contributions(grant_contributions):
-    contrib_dict = {}
-    for proj, user, amount in grant_contributions:
-        if proj not in contrib_dict:
-            contrib_dict[proj] = {}
-        contrib_dict[proj][user] = contrib_dict[proj].get(user, 0) + amount
-
-    tot_overlap = {}
-    for proj, contribz in contrib_dict.items():
-        for k1, v1 in contribz.items():
-            if k1 not in tot_overlap:
-                tot_overlap[k1] = {}
-            for k2, v2 in contribz.items():
-                if k2 not in tot_overlap[k1]:
-                    tot_overlap[k1][k2] = 0
-                tot_overlap[k1][k2] += (v1 * v2) ** 0.5
-    return contrib_dict, tot_overlap
+    return ContributionMatrix.from_rows(grant_contributions)
 
 
 
 '''
-    Helper function that aggregates contributions by contributor, and then uses the aggregated contributors by contributor and calculates total contributions by unique pairs.
+    Helper function that runs the pairwise clr formula and normalizes the result to the total pot.
 
     Args:
-        from get_data or translate_data: [[grant_id (str), user_id (str), contribution_amount (float)]]
-
-        grant_id: grant being donated to
-
-        live_user: user doing the donation
-
-    Returns:
-        {grant_id (str): {user_id (str): aggregated_amount (float)}}
-
-        and
 
-        {user_id (str): {user_id (str): pair_total (float)}}
-'''
-def aggregate_contributions_live(grant_contributions, grant_id=86.0, live_user=99999999.0):
-    # # get users who have contributed to grant_id to get tot_overlap
-    # contrib_dict = {}
-    # contrib_users = []
-    # for proj, user, amount in tech:
-    #     if proj == grant_id:
-    #         if user not in contrib_users:
-    #             contrib_users.append(user)
-    # for proj, user, amount in tech:
-    #     if user in contrib_users:
-    #         if proj not in contrib_dict:
-    #             contrib_dict[proj] = {}
-    #         contrib_dict[proj][user] = contrib_dict[proj].get(user, 0) + amount
-    contrib_dict = {}
-    for proj, user, amount in grant_contributions:
-        if proj not in contrib_dict:
-            contrib_dict[proj] = {}
-        contrib_dict[proj][user] = contrib_dict[proj].get(user, 0) + amount
-    contrib_dict_list = []
-    tot_overlap_list = []
-    for amount in match_amounts_to_estimate:
-        contrib_dict_copy = copy.deepcopy(contrib_dict)
-        contrib_dict_copy[grant_id][live_user] = contrib_dict_copy[grant_id].get(live_user, 0) + amount
-        contrib_dict_list.append(contrib_dict_copy)
-        tot_overlap = {}
-        for proj, contribz in contrib_dict_copy.items():
-            for k1, v1 in contribz.items():
-                if k1 not in tot_overlap:
-                    tot_overlap[k1] = {}
-                for k2, v2 in contribz.items():
-                    if k2 not in tot_overlap[k1]:
-                        tot_overlap[k1][k2] = 0
-                    tot_overlap[k1][k2] += (v1 * v2) ** 0.5
-        tot_overlap_list.append(tot_overlap)
-        # print(f'finished predicting {amount}')
-    return contrib_dict_list, tot_overlap_list
-
-
-
-'''
-    Helper function that runs the pairwise clr formula while "binary" searching for the correct threshold.
-
-    Args:
-    
-        aggregated_contributions: {grant_id (str): {user_id (str): aggregated_amount (float)}}
-        pair_totals: {user_id (str): {user_id (str): pair_total (float)}}
+        matrix: ContributionMatrix from aggregate_contributions
         threshold: pairwise coefficient
         total_pot: total pot for the tech or media round, default tech
 
     Returns:
         totals: total clr award by grant, normalized by the normalization factor
 '''
-def calculate_new_clr(aggregated_contributions, pair_totals, threshold=25.0, total_pot=125000.0):
-    bigtot = 0
-    totals = []
-    # single donation doesn't get a match
-    for proj, contribz in aggregated_contributions.items():
-        tot = 0
-        for k1, v1 in contribz.items():
-            for k2, v2 in contribz.items():
-                if k2 > k1:  # remove pairs
-                    # # pairwise matching formula
-                    # tot += (v1 * v2) ** 0.5 * min(1, threshold / pair_totals[k1][k2])
-                    # vitalik's division formula
-                    tot += ((v1 * v2) ** 0.5) / (pair_totals[k1][k2] / threshold + 1)
-        bigtot += tot
-        totals.append({'id': proj, 'clr_amount': tot})
+def calculate_new_clr(matrix, threshold=25.0, total_pot=125000.0):
+    # vitalik's division formula, single donation doesn't get a match
+    bigtot, totals = calculate_clr_totals(matrix, threshold)
     # find normalization factor
     normalization_factor = float(bigtot) / float(total_pot)
     # modify totals
-    for result in totals:
-        result['clr_amount'] = result['clr_amount'] / normalization_factor
-    # # check total = pot
-    # print(f'total pot check = {sum([x["clr_amount"] for x in totals])}')
-    
-    return totals 
+    return [{'id': proj, 'clr_amount': result['clr_amount'] / normalization_factor} for proj, result in totals.items()]
 
 
 
@@ -239,8 +148,8 @@ def calculate_new_clr(aggregated_contributions, pair_totals, threshold=25.0, tot
 '''
 def run_calc(data, total_pot=125000):
     start_time = time.time()
-    aggregated_contributions, pair_totals = aggregate_contributions(data)
-    res = calculate_new_clr(aggregated_contributions, pair_totals, total_pot=total_pot)
+    matrix = aggregate_contributions(data)
+    res = calculate_new_clr(matrix, total_pot=total_pot)
     print('tech final calc runtime --- %s seconds ---' % (time.time() - start_time))
     return res
 
@@ -254,10 +163,11 @@ def run_calc(data, total_pot=125000):
 '''
 def run_live_calc(data, grant_id=86.0, live_user=99999999.0, total_pot=125000):
     start_time = time.time()
-    aggregated_contributions_list, pair_totals_list = aggregate_contributions_live(data, grant_id=grant_id, live_user=live_user)
+    matrix = aggregate_contributions(data)
     clr_curve = []
-    for x, y in zip(aggregated_contributions_list, pair_totals_list):
-        res = calculate_new_clr(x, y, total_pot=total_pot)
+    for amount in match_amounts_to_estimate:
+        # the live user's donation on top of the round, without copying the round for every amount
+        res = calculate_new_clr(matrix.with_contribution(grant_id, live_user, amount), total_pot=total_pot)
         pred = list(filter(lambda x: x['id'] == grant_id, res))[0]['clr_amount']
         clr_curve.append(pred)
 